@@ -0,0 +1,166 @@
+"""Fermentation analytics per batch: OG, current SG, apparent attenuation, ABV and velocity.
+
+The state of a batch is built once from the stored gravity readings with NumPy and then
+updated in constant time for each new reading. The velocity is the slope of a least squares
+line through the readings in the last ANALYTICS_WINDOW_HOURS, kept as running sums so that
+adding a reading and dropping the ones that fall out of the window does not rescan the window.
+"""
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from api.db import models, schemas
+from api.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_WINDOW_HOURS = 24.0
+ANALYTICS_OG_HOURS = 12.0  # OG is the highest gravity in the first hours of the batch
+ABV_FACTOR = 131.25
+
+
+def _days(created: datetime, start: datetime) -> float:
+    return (created - start).total_seconds() / 86400
+
+
+class BatchAnalytics:
+    """Running analytics for the active gravity readings of one batch."""
+    def __init__(self):
+        self.start: Optional[datetime] = None
+        self.last: Optional[datetime] = None
+        self.og: Optional[float] = None
+        self.sg: Optional[float] = None
+        self.readings = 0
+        self.window: Deque[Tuple[float, float]] = deque()
+        self.sums = np.zeros(4)  # x, y, xx, xy for the readings in the window
+
+    def add(self, created: datetime, gravity: float) -> None:
+        """Add a reading, readings must be added in time order."""
+        if self.start is None:
+            self.start = created
+        x = _days(created, self.start)
+        if x * 24 <= ANALYTICS_OG_HOURS:
+            self.og = gravity if self.og is None else max(self.og, gravity)
+
+        self.last = created
+        self.sg = gravity
+        self.readings += 1
+        self.window.append((x, gravity))
+        self.sums += (x, gravity, x * x, x * gravity)
+
+        limit = x - ANALYTICS_WINDOW_HOURS / 24
+        while self.window[0][0] < limit:
+            ox, oy = self.window.popleft()
+            self.sums -= (ox, oy, ox * ox, ox * oy)
+
+    def load(self, created: np.ndarray, gravity: np.ndarray) -> None:
+        """Build the state from all readings of a batch, sorted by time, in one vectorized pass."""
+        if len(gravity) == 0:
+            return
+        self.start = created[0].astype(datetime)
+        self.last = created[-1].astype(datetime)
+        x = (created - created[0]) / np.timedelta64(1, "s") / 86400
+        self.og = float(gravity[x * 24 <= ANALYTICS_OG_HOURS].max())
+        self.sg = float(gravity[-1])
+        self.readings = len(gravity)
+
+        first = int(np.searchsorted(x, x[-1] - ANALYTICS_WINDOW_HOURS / 24))
+        wx, wy = x[first:], gravity[first:]
+        self.window = deque(zip(wx.tolist(), wy.tolist()))
+        self.sums = np.array([wx.sum(), wy.sum(), (wx * wx).sum(), (wx * wy).sum()])
+
+    @property
+    def velocity(self) -> Optional[float]:
+        """Change of gravity in points per day over the window, None with too few readings."""
+        n = len(self.window)
+        sx, sy, sxx, sxy = self.sums
+        denominator = n * sxx - sx * sx
+        if n < 2 or denominator <= 1e-12:
+            return None
+        return (n * sxy - sx * sy) / denominator * 1000
+
+    def result(self) -> schemas.FermentationAnalytics:
+        """Return the current values."""
+        attenuation = abv = None
+        if self.og is not None and self.sg is not None:
+            abv = (self.og - self.sg) * ABV_FACTOR
+            if self.og > 1:
+                attenuation = (self.og - self.sg) / (self.og - 1) * 100
+        velocity = self.velocity
+        return schemas.FermentationAnalytics(
+            og=self.og,
+            sg=self.sg,
+            attenuation=None if attenuation is None else round(attenuation, 1),
+            abv=None if abv is None else round(abv, 2),
+            velocity=None if velocity is None else round(velocity, 2),
+            readings=self.readings,
+            last=self.last,
+        )
+
+
+class BatchCache:  # pylint: disable=too-few-public-methods
+    """State per batch guarded by a lock, dropped when the readings of a batch change."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches: Dict[int, Any] = {}
+
+    def invalidate(self, batch_id: Optional[int] = None) -> None:
+        """Drop the state for a batch, or all batches, after readings are changed or deleted."""
+        with self.lock:
+            if batch_id is None:
+                self.batches.clear()
+            else:
+                self.batches.pop(batch_id, None)
+
+
+class AnalyticsCache(BatchCache):
+    """Analytics state per batch, built on first use and updated as readings are stored."""
+    def _load(self, batch_id: int) -> BatchAnalytics:
+        gravity = models.Gravity
+        with engine.connect() as con:
+            rows = con.execute(
+                select(gravity.created, gravity.corr_gravity, gravity.gravity)
+                .where(gravity.batch_id == batch_id, gravity.active.is_(True))
+                .order_by(gravity.created, gravity.id)
+            ).all()
+
+        analytics = BatchAnalytics()
+        if rows:
+            created, corr_gravity, sg = zip(*rows)
+            values = np.array(
+                [c if c is not None else g for c, g in zip(corr_gravity, sg)], dtype=float
+            )
+            analytics.load(np.array(created, dtype="datetime64[us]"), values)
+        logger.info("Loaded analytics for batch %d from %d readings", batch_id, len(rows))
+        return analytics
+
+    def get(self, batch_id: int) -> schemas.FermentationAnalytics:
+        """Return the analytics for a batch."""
+        with self.lock:
+            analytics = self.batches.get(batch_id)
+            if analytics is None:
+                analytics = self.batches[batch_id] = self._load(batch_id)
+            return analytics.result()
+
+    def add(self, reading: Any) -> None:
+        """Update the analytics with a stored gravity reading."""
+        if not reading.active or reading.batch_id is None:
+            return
+        with self.lock:
+            analytics = self.batches.get(reading.batch_id)
+            if analytics is None:
+                return
+            if analytics.last is not None and reading.created < analytics.last:
+                # Out of order, rebuild on next use
+                del self.batches[reading.batch_id]
+                return
+            gravity = reading.corr_gravity if reading.corr_gravity is not None else reading.gravity
+            analytics.add(reading.created, gravity)
+
+
+batch_analytics = AnalyticsCache()
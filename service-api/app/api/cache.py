@@ -78,6 +78,115 @@ def write_key(key: str, value: str, ttl: int) -> bool:
     return False
 
 
+def write_bytes(key: str, value: bytes, ttl: int) -> bool:
+    """Write a binary value, such as a serialized response, to Redis cache with TTL.
+
+    Args:
+        key: The key to write
+        value: The value to store as is
+        ttl: Time to live in seconds
+
+    Returns:
+        True if successful, False if cache disabled or connection error
+    """
+    if pool is None:
+        return False
+
+    logger.info("Writing key %s (%d bytes) ttl:%s.", key, len(value), ttl)
+    try:
+        r = redis.Redis(connection_pool=pool)
+        r.set(name=key, value=value, ex=ttl)
+        return True
+    except redis.exceptions.ConnectionError as e:
+        logger.error("Failed to connect with redis %s.", e)
+    return False
+
+
+def write_registry(key: str, values: dict[str, str], timestamp: float) -> bool:
+    """Add or update entries in a registry through one pipeline.
+
+    The registry is a Redis hash with the entries and a sorted set named <key>_seen
+    that keeps the last seen time of each entry as score.
+    
+    Args:
+        key: Name of the registry
+        values: Dictionary of field and value
+        timestamp: Last seen time for the entries (seconds since epoch)
+    
+    Returns:
+        True if successful, False if connection error
+    """
+    if pool is None or len(values) == 0:
+        return True
+
+    logger.info("Writing %d entries to registry %s.", len(values), key)
+    try:
+        r = redis.Redis(connection_pool=pool)
+        pipe = r.pipeline(transaction=False)
+        pipe.hset(key, mapping=values)
+        pipe.zadd(key + "_seen", {field: timestamp for field in values})
+        pipe.execute()
+        return True
+    except redis.exceptions.ConnectionError as e:
+        logger.error("Failed to connect with redis %s.", e)
+    return False
+
+
+def remove_registry(key: str, fields: list[str]) -> None:
+    """Remove entries from a registry through one pipeline.
+    
+    Args:
+        key: Name of the registry
+        fields: The entries to remove
+    """
+    if pool is None or len(fields) == 0:
+        return
+
+    logger.info("Removing %d entries from registry %s.", len(fields), key)
+    try:
+        r = redis.Redis(connection_pool=pool)
+        pipe = r.pipeline(transaction=False)
+        pipe.hdel(key, *fields)
+        pipe.zrem(key + "_seen", *fields)
+        pipe.execute()
+    except redis.exceptions.ConnectionError as e:
+        logger.error("Failed to connect with redis %s.", e)
+    return
+
+
+def read_registry(key: str, max_age: float, now: float) -> dict[bytes, bytes]:
+    """Read all entries in a registry after removing the ones not seen within max_age.
+    
+    Args:
+        key: Name of the registry
+        max_age: Seconds an entry is kept after it was last seen
+        now: Current time (seconds since epoch)
+    
+    Returns:
+        Dictionary of field/value as bytes, empty if the registry doesn't exist or cache disabled
+    """
+    if pool is None:
+        return {}
+
+    logger.info("Reading registry %s.", key)
+    try:
+        r = redis.Redis(connection_pool=pool)
+        stale = r.zrangebyscore(key + "_seen", "-inf", now - max_age)
+        pipe = r.pipeline(transaction=False)
+        if len(stale):
+            logger.info("Expiring %d entries from registry %s.", len(stale), key)
+            pipe.hdel(key, *stale)
+            pipe.zrem(key + "_seen", *stale)
+        pipe.hgetall(key)
+        return pipe.execute()[-1]
+    except redis.exceptions.ConnectionError as e:
+        logger.error("Failed to connect with redis %s.", e)
+    except redis.exceptions.ResponseError as e:
+        logger.error("Failed to read registry %s, %s.", key, e)
+
+    return {}
+
+
 def read_key(key: str | bytes) -> bytes | None:
     """Read a value from Redis cache by key.
     
@@ -100,6 +209,31 @@ def read_key(key: str | bytes) -> bytes | None:
     return None
 
 
+def read_hash(key: str | bytes) -> dict[bytes, bytes]:
+    """Read all fields of a Redis hash with a single HGETALL.
+    
+    Args:
+        key: The hash key to read (str or bytes)
+    
+    Returns:
+        Dictionary of field/value as bytes, empty if key doesn't exist, is not a hash or
+        cache disabled
+    """
+    if pool is None:
+        return {}
+
+    logger.info("Reading hash %s.", key)
+    try:
+        r = redis.Redis(connection_pool=pool)
+        return r.hgetall(key)
+    except redis.exceptions.ConnectionError as e:
+        logger.error("Failed to connect with redis %s.", e)
+    except redis.exceptions.ResponseError as e:
+        logger.error("Failed to read hash %s, %s.", key, e)
+
+    return {}
+
+
 def exist_key(key: str | bytes) -> bool:
     """Check if a key exists in Redis cache.
     
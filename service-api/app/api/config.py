@@ -31,6 +31,15 @@ class Settings(BaseSettings):
     cache_enabled: bool = config("CACHE_ENABLED", cast=bool, default=True)
     brewfather_api_key: str = config("BREWFATHER_API_KEY", cast=str, default="")
     brewfather_user_key: str = config("BREWFATHER_USER_KEY", cast=str, default="")
+    device_proxy_concurrency: int = config("DEVICE_PROXY_CONCURRENCY", cast=int, default=1)
+    device_proxy_cache_ttl: float = config("DEVICE_PROXY_CACHE_TTL", cast=float, default=2.0)
+    systemlog_retention_days: int = config("SYSTEMLOG_RETENTION_DAYS", cast=int, default=90)
+    receivelog_retention_days: int = config("RECEIVELOG_RETENTION_DAYS", cast=int, default=90)
+    devicelog_retention_days: int = config("DEVICELOG_RETENTION_DAYS", cast=int, default=30)
+    retention_chunk_size: int = config("RETENTION_CHUNK_SIZE", cast=int, default=5000)
+    gravity_filter: str = config("GRAVITY_FILTER", cast=str, default="")
+    gravity_filter_threshold: float = config("GRAVITY_FILTER_THRESHOLD", cast=float, default=3.0)
+    gravity_filter_deactivate: bool = config("GRAVITY_FILTER_DEACTIVATE", cast=bool, default=False)
 
     if api_key == "":
         api_key = generate_api_key(20)
@@ -43,6 +52,15 @@ class Settings(BaseSettings):
     logger.info("cache_enabled: %s", cache_enabled)
     logger.info("brewfather_api_key: %s", brewfather_api_key)
     logger.info("brewfather_user_key: %s", brewfather_user_key)
+    logger.info("device_proxy_concurrency: %s", device_proxy_concurrency)
+    logger.info("device_proxy_cache_ttl: %s", device_proxy_cache_ttl)
+    logger.info("systemlog_retention_days: %s", systemlog_retention_days)
+    logger.info("receivelog_retention_days: %s", receivelog_retention_days)
+    logger.info("devicelog_retention_days: %s", devicelog_retention_days)
+    logger.info("retention_chunk_size: %s", retention_chunk_size)
+    logger.info("gravity_filter: %s", gravity_filter)
+    logger.info("gravity_filter_threshold: %s", gravity_filter_threshold)
+    logger.info("gravity_filter_deactivate: %s", gravity_filter_deactivate)
 
 
 @lru_cache
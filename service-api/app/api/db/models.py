@@ -9,6 +9,7 @@ from sqlalchemy import (
     ForeignKey,
     Boolean,
     Text,
+    Index,
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -38,6 +39,10 @@ class SystemLog(Base):
     error_code = Column(Integer, nullable=False)
     log_level = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        Index("ix_systemlog_timestamp_id", "timestamp", "id"),
+    )
+
 
 class Device(Base):
     __tablename__ = "device"
@@ -105,6 +110,7 @@ class Batch(Base):
     gravity = relationship("Gravity", back_populates="batch", cascade="all,delete")
     pressure = relationship("Pressure", back_populates="batch", cascade="all,delete")
     pour = relationship("Pour", back_populates="batch", cascade="all,delete")
+    rollup = relationship("Rollup", cascade="all,delete")
 
 
 class Gravity(Base):
@@ -119,6 +125,7 @@ class Gravity(Base):
     battery = Column(Float, nullable=False)
     rssi = Column(Float, nullable=False)
     corr_gravity = Column(Float, nullable=True)
+    filtered_gravity = Column(Float, nullable=True)
     run_time = Column(Float, nullable=True)
 
     # Data from chamber controller
@@ -136,6 +143,10 @@ class Gravity(Base):
     batch_id = Column(Integer, ForeignKey(Batch.__table__.c.id))
     batch = relationship("Batch", back_populates="gravity")
 
+    __table_args__ = (
+        Index("ix_gravity_batch_id_created", "batch_id", "created"),
+    )
+
 
 class Pressure(Base):
     __tablename__ = "pressure"
@@ -153,6 +164,10 @@ class Pressure(Base):
     batch_id = Column(Integer, ForeignKey(Batch.__table__.c.id))
     batch = relationship("Batch", back_populates="pressure")
 
+    __table_args__ = (
+        Index("ix_pressure_batch_id_created", "batch_id", "created"),
+    )
+
 
 class Pour(Base):
     __tablename__ = "pour"
@@ -176,4 +191,48 @@ class ReceiveLog(Base):
     timestamp = Column(DateTime, nullable=False, default=datetime.now)
     payload = Column(Text, nullable=False)
 
+    __table_args__ = (
+        Index("ix_receivelog_timestamp_id", "timestamp", "id"),
+        Index("ix_receivelog_ip_address_timestamp", "ip_address", "timestamp"),
+    )
+
 
+class Rollup(Base):
+    __tablename__ = "rollup"
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+    batch_id = Column(Integer, ForeignKey(Batch.__table__.c.id), nullable=False)
+    period = Column(String(1), nullable=False)  # h = hour, d = day
+    bucket = Column(DateTime, nullable=False)  # Start of the hour or day
+    metric = Column(String(30), nullable=False)
+    count = Column(Integer, nullable=False)
+    sum = Column(Float, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rollup_batch_id_period_bucket", "batch_id", "period", "bucket"),
+    )
+
+
+class RollupWatermark(Base):
+    __tablename__ = "rollupwatermark"
+
+    source = Column(String(20), primary_key=True)
+    last_id = Column(Integer, nullable=False)
+
+
+class DeviceLog(Base):
+    __tablename__ = "devicelog"
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+    chip_id = Column(String(6), nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    level = Column(Integer, nullable=False)
+    message = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_devicelog_chip_id_timestamp", "chip_id", "timestamp"),
+        Index("ix_devicelog_chip_id_id", "chip_id", "id"),
+        Index("ix_devicelog_timestamp", "timestamp"),
+    )
@@ -0,0 +1,134 @@
+"""Maintenance of partitioned tables on Postgres.
+
+Partitioned tables are created by migrate/migrate.py. Range partitioned tables have one partition
+per calendar month named <table>_pYYYYMM, rows outside the existing partitions end up in
+<table>_default. Hash partitioned tables (readings partitioned by batch_id) need no maintenance.
+"""
+import logging
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import SQLAlchemyError
+
+from .session import engine
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(dt: datetime, offset: int = 0) -> datetime:
+    """Return the first day of the month of dt, moved offset months."""
+    months = dt.year * 12 + dt.month - 1 + offset
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def month_partition_name(table: str, start: datetime) -> str:
+    """Return the name of the partition holding the month that begins at start."""
+    return f"{table}_p{start.year:04d}{start.month:02d}"
+
+
+# Tables that migrate/migrate.py can convert to partitioned tables
+PARTITIONED_TABLES = ("systemlog", "receivelog", "gravity", "pressure")
+
+
+def partition_strategy(con: Connection, table: str) -> Optional[str]:
+    """Return r (range) or h (hash) for a partitioned table, None if the table is not partitioned.
+
+    Always None on other databases than Postgres.
+    """
+    if con.dialect.name != "postgresql":
+        return None
+    return con.execute(
+        text(
+            "SELECT p.partstrat FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :table"
+        ),
+        {"table": table},
+    ).scalar()
+
+
+def is_partitioned(con: Connection, table: str) -> bool:
+    """Return True if the table is range partitioned by month."""
+    return partition_strategy(con, table) == "r"
+
+
+def list_month_partitions(con: Connection, table: str) -> List[Tuple[str, datetime]]:
+    """Return the name and first day of each monthly partition of the table, oldest first."""
+    result = con.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table"
+        ),
+        {"table": table},
+    )
+    pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+    partitions = []
+    for (name,) in result:
+        match = pattern.match(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_month_partitions(con: Connection, table: str, now: datetime, months_ahead: int = 2) -> List[str]:
+    """Create the partitions for the current month and the coming months if they are missing.
+
+    Returns:
+        Names of the created partitions
+    """
+    existing = {name for name, _ in list_month_partitions(con, table)}
+    created = []
+    for offset in range(months_ahead + 1):
+        start = month_start(now, offset)
+        name = month_partition_name(table, start)
+        if name in existing:
+            continue
+        try:
+            with con.begin_nested():
+                con.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES "
+                        f"FROM ('{start.isoformat()}') TO ('{month_start(start, 1).isoformat()}')"
+                    )
+                )
+        except SQLAlchemyError as e:
+            # Fails if the default partition already has rows for this month
+            logger.error("Unable to create partition %s: %s", name, e)
+            continue
+        created.append(name)
+        logger.info("Created partition %s", name)
+    return created
+
+
+def drop_month_partitions(con: Connection, table: str, cutoff: datetime) -> List[str]:
+    """Drop the partitions where all rows are older than cutoff.
+
+    Returns:
+        Names of the dropped partitions
+    """
+    dropped = []
+    for name, start in list_month_partitions(con, table):
+        if month_start(start, 1) > cutoff:
+            break
+        con.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        dropped.append(name)
+        logger.info("Dropped partition %s", name)
+    return dropped
+
+
+def maintain_partitions(now: Optional[datetime] = None) -> List[str]:
+    """Create the upcoming monthly partitions for all range partitioned tables.
+
+    Returns:
+        Names of the created partitions
+    """
+    now = now or datetime.now()
+    created = []
+    with engine.begin() as con:
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(con, table):
+                created += create_month_partitions(con, table, now)
+    return created
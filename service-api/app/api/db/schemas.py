@@ -42,6 +42,39 @@ class SelfTestResult(BaseModel):
     log: List[Cache]
     ble: List[Cache]
 
+class ImportResult(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+    rows: int = Field(description="Number of readings imported")
+    rejected: int = Field(description="Number of rows that could not be imported")
+    errors: List[str] = Field(description="Reason for the first rejected rows")
+    elapsed_ms: float = Field(description="Time spent on the import in ms")
+
+class Rollup(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+    bucket: datetime = Field(description="Start of the hour or day")
+    metric: str = Field(description="Measured value, e.g. gravity or temperature")
+    count: int = Field(description="Number of readings in the bucket")
+    min: float
+    max: float
+    avg: float
+
+class BatchSeries(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+    batch_id: int
+    metric: str
+    start: Optional[datetime] = Field(None, description="Start of the hour with the first reading")
+    hours: List[float] = Field(description="Hours since the first reading, start of each bucket")
+    values: List[float] = Field(description="Average of the metric in each bucket")
+
+class IngestStage(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+    format: str = Field(description="Device format, e.g. ispindel or pressuremon")
+    stage: str = Field(description="Ingest stage")
+    count: int = Field(description="Number of readings measured")
+    total_ms: float = Field(description="Total time spent in the stage in ms")
+    avg_ms: float = Field(description="Average time per reading in ms")
+    max_ms: float = Field(description="Longest time for a reading in ms")
+
 class BrewfatherBatch(BaseModel):
     name: str
     brewDate: str
@@ -137,6 +170,42 @@ class SystemLogPaginatedResponse(BaseModel):
     skip: int = Field(description="Number of records skipped")
     limit: int = Field(description="Number of records returned")
     data: List[SystemLog] = Field(description="List of system logs")
+    next_cursor: Optional[str] = Field(
+        default=None, description="Cursor for the next page, None on the last page"
+    )
+
+
+################################################################################
+
+
+class DeviceLogBase(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+    chip_id: str = Field(min_length=6, max_length=6, description="Chip ID of the device")
+    timestamp: datetime = Field(description="Time the line was received from the device")
+    level: int = Field(1, ge=0, le=3, description="Log level, 0=debug, 1=info, 2=warning, 3=error")
+    message: str = Field(description="Log line from the device")
+
+
+class DeviceLogUpdate(DeviceLogBase):
+    pass
+
+
+class DeviceLogCreate(DeviceLogBase):
+    pass
+
+
+class DeviceLog(DeviceLogBase):
+    model_config = ConfigDict(from_attributes=True, alias_generator=to_camel, populate_by_name=True)
+    id: int
+
+
+class DeviceLogPage(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+    limit: int = Field(description="Max number of records returned")
+    next_cursor: Optional[int] = Field(
+        None, description="Cursor for the next (older) page, null when there are no more records"
+    )
+    data: List[DeviceLog] = Field(description="Log lines, newest first")
 
 
 ################################################################################
@@ -226,6 +295,7 @@ class GravityBase(BaseModel):
     battery: float = Field(description="Battery voltage")
     rssi: float = Field(description="WIFI signal strenght")
     corr_gravity: Optional[float] = Field(None, description="Temperature corrected gravity")
+    filtered_gravity: Optional[float] = Field(None, description="Gravity after the outlier and noise filter")
     run_time: Optional[float] = Field(None, description="Number of seconds the execution took")
     created: Optional[datetime] | None = Field(
         default=None, description="If undefined the current time will be used"
@@ -417,6 +487,31 @@ class BatchList(BatchBase):
     last_pour_max_volume: Optional[float] = Field(None, description="Latest pour max volume")
 
 
+class FermentationAnalytics(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+    og: Optional[float] = Field(None, description="Original gravity, highest reading at the start of the batch")
+    sg: Optional[float] = Field(None, description="Current gravity")
+    attenuation: Optional[float] = Field(None, description="Apparent attenuation in %")
+    abv: Optional[float] = Field(None, description="Alcohol by volume in %")
+    velocity: Optional[float] = Field(None, description="Gravity change over the last 24h, points per day")
+    readings: int = Field(0, description="Number of active gravity readings")
+    last: Optional[datetime] = Field(None, description="Time of the latest reading")
+
+
+class Forecast(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+    points: int = Field(description="Number of hourly gravity averages used in the fit")
+    gravity: Optional[float] = Field(None, description="Latest hourly gravity")
+    terminal_gravity: Optional[float] = Field(None, description="Estimated final gravity")
+    rate: Optional[float] = Field(None, description="Decay rate of the fitted curve, per day")
+    rmse: Optional[float] = Field(None, description="Root mean square error of the fit")
+    completion: Optional[datetime] = Field(
+        None, description="Estimated time when the gravity is within one point of the final gravity"
+    )
+    hours_remaining: Optional[float] = Field(None, description="Hours until the estimated completion")
+    completed: Optional[bool] = Field(None, description="True if the estimated completion has passed")
+
+
 class BatchDashboard(BaseModel):
     model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
     id: int
@@ -450,6 +545,7 @@ class BatchDashboard(BaseModel):
     gravity: List[Gravity] = None
     pressure: List[Pressure] = None
     pour: List[Pour] = None
+    analytics: Optional[FermentationAnalytics] = None
 
 
 ################################################################################
@@ -477,4 +573,7 @@ class ReceiveLogPaginatedResponse(BaseModel):
     skip: int = Field(description="Number of records skipped")
     limit: int = Field(description="Number of records returned")
     data: List[ReceiveLog] = Field(description="List of receive logs")
+    next_cursor: Optional[str] = Field(
+        default=None, description="Cursor for the next page, None on the last page"
+    )
 
@@ -0,0 +1,148 @@
+"""Streaming export of batch readings as CSV, NDJSON or Parquet.
+
+Rows are read with a server side cursor (yield_per) and written in chunks so memory use does
+not depend on the number of readings in the batch.
+"""
+import csv
+import io
+import logging
+from typing import Any, Iterator, List, Sequence
+
+import orjson
+from sqlalchemy import Boolean, DateTime, Float, Integer, select
+
+from api.db.session import engine
+from .responses import RowEncoder
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 5000
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def parquet_available() -> bool:
+    """Return True if pyarrow is installed and parquet export can be used."""
+    return pyarrow is not None
+
+
+def _read_chunks(encoder: RowEncoder, batch_id: int) -> Iterator[Sequence[Any]]:
+    """Read the readings of a batch ordered by time, one list of row tuples per chunk."""
+    model = encoder.columns[0].class_
+    stmt = (
+        select(*encoder.columns)
+        .where(model.batch_id == batch_id)
+        .order_by(model.created, model.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+
+    rows = 0
+    with engine.connect() as con:
+        for partition in con.execute(stmt).partitions():
+            rows += len(partition)
+            yield partition
+    logger.info("Exported %d %s rows for batch %d", rows, model.__tablename__, batch_id)
+
+
+def export_csv(encoder: RowEncoder, batch_id: int) -> Iterator[bytes]:
+    """Stream readings as CSV with a header row using the json keys."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(encoder.keys)
+
+    for partition in _read_chunks(encoder, batch_id):
+        writer.writerows(
+            [v.isoformat() if hasattr(v, "isoformat") else v for v in row] for row in partition
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def export_ndjson(encoder: RowEncoder, batch_id: int) -> Iterator[bytes]:
+    """Stream readings as newline delimited json, one object per reading."""
+    for partition in _read_chunks(encoder, batch_id):
+        yield b"".join(
+            orjson.dumps(row) + b"\n"  # pylint: disable=no-member
+            for row in encoder.encode(partition)
+        )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write only file that keeps the written bytes until they are taken."""
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        """Return and clear the bytes written since the last call."""
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(column: Any) -> Any:
+    if isinstance(column.type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(column.type, Integer):
+        return pyarrow.int64()
+    if isinstance(column.type, Float):
+        return pyarrow.float64()
+    if isinstance(column.type, DateTime):
+        return pyarrow.timestamp("us")
+    return pyarrow.string()
+
+
+def export_parquet(encoder: RowEncoder, batch_id: int) -> Iterator[bytes]:
+    """Stream readings as a zstd compressed Parquet file, one row group per chunk."""
+    schema = pyarrow.schema(
+        [(key, _arrow_type(column)) for key, column in zip(encoder.keys, encoder.columns)]
+    )
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+
+    try:
+        for partition in _read_chunks(encoder, batch_id):
+            columns = list(zip(*partition))
+            table = pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            )
+            writer.write_table(table)
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+EXPORT_WRITERS = {
+    "csv": export_csv,
+    "ndjson": export_ndjson,
+    "parquet": export_parquet,
+}
@@ -0,0 +1,116 @@
+"""Forecast of the terminal gravity and completion time of a fermentation.
+
+An exponential attenuation curve g(t) = fg + (g0 - fg) * exp(-k * t) is fitted to the hourly
+gravity rollups of a batch, so the cost does not depend on the number of readings. For a
+range of decay rates k the curve is linear in fg and g0, these are solved with least squares
+for all rates at once and the rate with the smallest error is used.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from api.db import schemas
+from .analytics import BatchCache
+from .rollup import batch_rollups
+
+logger = logging.getLogger(__name__)
+
+FORECAST_MIN_POINTS = 6
+FORECAST_RATES = np.geomspace(0.02, 20, 400)  # Decay rate per day
+FORECAST_DONE_POINTS = 0.001  # Done when within one gravity point of the terminal gravity
+
+
+def fit_exponential(days: np.ndarray, gravity: np.ndarray) -> Optional[Dict[str, float]]:
+    """Fit the attenuation curve.
+
+    Returns:
+        fg, g0, rate (per day) and rmse, None if the gravity does not decline
+    """
+    basis = np.exp(-np.outer(FORECAST_RATES, days))  # rates x points
+    n = len(days)
+    sx = basis.sum(axis=1)
+    sxx = (basis * basis).sum(axis=1)
+    sy = gravity.sum()
+    sxy = basis @ gravity
+    denominator = n * sxx - sx * sx
+    valid = denominator > 1e-12
+
+    amplitude = np.where(valid, (n * sxy - sx * sy) / np.where(valid, denominator, 1), 0)
+    fg = (sy - amplitude * sx) / n
+    residual = gravity[None, :] - fg[:, None] - amplitude[:, None] * basis
+    sse = np.where(valid & (amplitude > 0), (residual * residual).sum(axis=1), np.inf)
+
+    best = int(np.argmin(sse))
+    if not np.isfinite(sse[best]):
+        return None
+    return {
+        "fg": float(fg[best]),
+        "g0": float(fg[best] + amplitude[best]),
+        "rate": float(FORECAST_RATES[best]),
+        "rmse": float(np.sqrt(sse[best] / n)),
+    }
+
+
+def _gravity_series(batch_id: int) -> List[dict]:
+    rollups = batch_rollups(batch_id, "hour")
+    corrected = [r for r in rollups if r["metric"] == "corr_gravity"]
+    return corrected or [r for r in rollups if r["metric"] == "gravity"]
+
+
+def forecast(batch_id: int, now: Optional[datetime] = None) -> schemas.Forecast:
+    """Fit the attenuation curve for a batch and estimate when it is done."""
+    series = _gravity_series(batch_id)
+    if len(series) < FORECAST_MIN_POINTS:
+        return schemas.Forecast(points=len(series))
+
+    start = series[0]["bucket"]
+    # The average of an hour is placed in the middle of the hour
+    days = np.array([(r["bucket"] - start).total_seconds() / 86400 + 1 / 48 for r in series])
+    gravity = np.array([r["avg"] for r in series])
+
+    fit = fit_exponential(days, gravity)
+    if fit is None:
+        return schemas.Forecast(points=len(series), gravity=float(gravity[-1]))
+
+    amplitude = fit["g0"] - fit["fg"]
+    done_days = max(np.log(amplitude / FORECAST_DONE_POINTS), 0) / fit["rate"]
+    result = schemas.Forecast(
+        points=len(series),
+        gravity=float(gravity[-1]),
+        terminal_gravity=round(fit["fg"], 4),
+        rate=round(fit["rate"], 3),
+        rmse=round(fit["rmse"], 5),
+        completion=start + timedelta(days=float(done_days)),
+    )
+    return with_remaining(result, now or datetime.now())
+
+
+def with_remaining(result: schemas.Forecast, now: datetime) -> schemas.Forecast:
+    """Return the forecast with the time left until completion as seen at now."""
+    if result.completion is None:
+        return result
+    return result.model_copy(update={
+        "hours_remaining": round(max((result.completion - now).total_seconds() / 3600, 0), 1),
+        "completed": result.completion <= now,
+    })
+
+
+class ForecastCache(BatchCache):
+    """Forecast per batch, dropped when gravity readings of the batch change."""
+    def get(self, batch_id: int) -> schemas.Forecast:
+        """Return the cached forecast for a batch or compute it."""
+        with self.lock:
+            cached = self.batches.get(batch_id)
+        if cached is not None:
+            return with_remaining(cached, datetime.now())
+
+        result = forecast(batch_id)
+        with self.lock:
+            self.batches[batch_id] = result
+        logger.info("Computed forecast for batch %d from %d points", batch_id, result.points)
+        return result
+
+
+batch_forecasts = ForecastCache()
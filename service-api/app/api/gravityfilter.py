@@ -0,0 +1,162 @@
+"""Streaming outlier and noise filter for gravity readings.
+
+Floating hydrometers report spikes caused by bubbles or krausen. When GRAVITY_FILTER is set the
+ingest pipeline passes each gravity reading through a filter kept per batch, the result is
+stored in filtered_gravity next to the raw value. Readings detected as outliers can be marked
+inactive with GRAVITY_FILTER_DEACTIVATE.
+
+hampel: replaces a reading with the median of the last readings when it is more than
+        GRAVITY_FILTER_THRESHOLD scaled median absolute deviations from that median.
+kalman: one dimensional Kalman filter on the gravity, readings with an innovation larger than
+        GRAVITY_FILTER_THRESHOLD standard deviations are rejected as outliers.
+
+The state is kept in memory, after a restart it is primed from the latest stored readings.
+"""
+import logging
+from collections import deque
+from datetime import datetime
+from statistics import median
+from typing import Deque, Optional, Tuple, Union
+
+from sqlalchemy import select
+
+from api.config import get_settings
+from api.db import models
+from api.db.session import engine
+from .analytics import BatchCache
+
+logger = logging.getLogger(__name__)
+
+HAMPEL_WINDOW = 7
+MAD_SCALE = 1.4826  # Scale factor from median absolute deviation to standard deviation
+MIN_MAD = 0.0002  # Lower limit so that a very stable series does not flag normal noise
+KALMAN_PROCESS_NOISE = 0.002 ** 2  # Variance added per day
+KALMAN_MEASUREMENT_NOISE = 0.001 ** 2
+MAX_OUTLIERS = 3  # A level shift is accepted after this many outliers in a row
+
+
+class HampelFilter:  # pylint: disable=too-few-public-methods
+    """Hampel filter over the last readings.
+
+    Args:
+        window: Number of previous readings used for the median
+        threshold: Number of scaled deviations before a reading is an outlier
+    """
+    def __init__(self, window: int, threshold: float):
+        self.values: Deque[float] = deque(maxlen=window)
+        self.threshold = threshold
+        self.outliers = 0
+
+    def update(self, _created: datetime, gravity: float) -> Tuple[float, bool]:
+        """Filter a reading, returns the filtered value and True if it is an outlier."""
+        if len(self.values) < 3:
+            self.values.append(gravity)
+            return gravity, False
+
+        center = median(self.values)
+        mad = max(median(abs(v - center) for v in self.values), MIN_MAD)
+        # Outliers are not added to the window so a spike does not move the median
+        limit = self.threshold * MAD_SCALE * mad
+        if abs(gravity - center) > limit and self.outliers < MAX_OUTLIERS:
+            self.outliers += 1
+            return center, True
+        if self.outliers >= MAX_OUTLIERS:
+            self.values.clear()
+        self.outliers = 0
+        self.values.append(gravity)
+        return gravity, False
+
+
+class KalmanFilter:  # pylint: disable=too-few-public-methods
+    """Kalman filter with a random walk model of the gravity.
+
+    Args:
+        threshold: Number of standard deviations of the innovation before a reading is an outlier
+    """
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.estimate: Optional[float] = None
+        self.variance = KALMAN_MEASUREMENT_NOISE
+        self.last: Optional[datetime] = None
+        self.outliers = 0
+
+    def update(self, created: datetime, gravity: float) -> Tuple[float, bool]:
+        """Filter a reading, returns the filtered value and True if it is an outlier."""
+        if self.estimate is None or self.last is None:
+            self.estimate, self.last = gravity, created
+            return gravity, False
+
+        days = max((created - self.last).total_seconds() / 86400, 0)
+        self.last = created
+        self.variance += KALMAN_PROCESS_NOISE * days
+
+        innovation = gravity - self.estimate
+        innovation_variance = self.variance + KALMAN_MEASUREMENT_NOISE
+        if innovation * innovation > self.threshold ** 2 * innovation_variance:
+            if self.outliers < MAX_OUTLIERS:
+                self.outliers += 1
+                return self.estimate, True
+            self.estimate, self.variance = gravity, KALMAN_MEASUREMENT_NOISE
+            self.outliers = 0
+            return gravity, False
+        self.outliers = 0
+
+        gain = self.variance / innovation_variance
+        self.estimate += gain * innovation
+        self.variance *= 1 - gain
+        return self.estimate, False
+
+
+GravityFilter = Union[HampelFilter, KalmanFilter]
+
+
+class GravityFilterCache(BatchCache):
+    """Filter state per batch."""
+    def _create(self, method: str, batch_id: int) -> GravityFilter:
+        threshold = get_settings().gravity_filter_threshold
+        gravity_filter: GravityFilter = (
+            KalmanFilter(threshold)
+            if method == "kalman"
+            else HampelFilter(HAMPEL_WINDOW, threshold)
+        )
+
+        # Prime the filter with the latest readings that were not rejected
+        gravity = models.Gravity
+        with engine.connect() as con:
+            rows = con.execute(
+                select(gravity.created, gravity.gravity, gravity.filtered_gravity)
+                .where(gravity.batch_id == batch_id, gravity.active.is_(True))
+                .order_by(gravity.created.desc(), gravity.id.desc())
+                .limit(HAMPEL_WINDOW)
+            ).all()
+        for created, raw, filtered in reversed(rows):
+            gravity_filter.update(created, raw if filtered is None else filtered)
+        return gravity_filter
+
+    def apply(
+        self, batch_id: int, created: datetime, gravity: float
+    ) -> Tuple[Optional[float], bool]:
+        """Filter a gravity reading for a batch.
+
+        Returns:
+            The filtered gravity (None if filtering is disabled) and True if it is an outlier
+        """
+        method = get_settings().gravity_filter
+        if method not in ("hampel", "kalman"):
+            return None, False
+
+        with self.lock:
+            gravity_filter = self.batches.get(batch_id)
+            if gravity_filter is None:
+                gravity_filter = self.batches[batch_id] = self._create(method, batch_id)
+            filtered, outlier = gravity_filter.update(created, gravity)
+
+        if outlier:
+            logger.info(
+                "Gravity %.4f for batch %d is an outlier, filtered %.4f",
+                gravity, batch_id, filtered,
+            )
+        return filtered, outlier
+
+
+gravity_filters = GravityFilterCache()
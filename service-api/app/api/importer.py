@@ -0,0 +1,229 @@
+"""Bulk import of batch readings from CSV or NDJSON uploads.
+
+The upload is parsed while it is received, rows are converted using the column types of the
+model and inserted with executemany in bounded chunks, so memory use does not depend on the
+size of the upload. The keys are the same as in the export (camelCase), snake_case is also
+accepted.
+"""
+import csv
+import codecs
+import logging
+from datetime import datetime
+from time import perf_counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import Boolean, DateTime, Float, Integer, insert
+
+from api.db import schemas
+from api.db.session import engine
+from .ingest import fahrenheit_to_celsius, plato_to_sg, pressure_to_kpa
+from .responses import RowEncoder
+from .versions import table_versions
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_ERRORS = 20
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("true", "1", "yes"):
+        return True
+    if text in ("false", "0", "no"):
+        return False
+    raise ValueError(f"invalid boolean '{value}'")
+
+
+def _to_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).strip())
+
+
+def _converter(column: Any) -> Callable[[Any], Any]:
+    if isinstance(column.type, Boolean):
+        return _to_bool
+    if isinstance(column.type, Integer):
+        return int
+    if isinstance(column.type, Float):
+        return float
+    if isinstance(column.type, DateTime):
+        return _to_datetime
+    return str
+
+
+class ImportUnits:  # pylint: disable=too-few-public-methods
+    """Units used in the uploaded data, values are converted to C, SG and kPa."""
+    def __init__(self, temperature: str = "C", gravity: str = "SG", pressure: str = "kPa"):
+        self.fahrenheit = temperature.upper() == "F"
+        self.plato = gravity.upper() == "P"
+        self.pressure = pressure
+
+
+class BatchImporter:  # pylint: disable=too-many-instance-attributes
+    """Convert uploaded rows and insert them for a batch.
+
+    Args:
+        encoder: Row encoder for the reading type, defines the accepted keys
+        batch_id: Batch the readings are added to
+        units: Units used in the upload
+    """
+    def __init__(self, encoder: RowEncoder, batch_id: int, units: ImportUnits):
+        self.model = encoder.columns[0].class_
+        self.batch_id = batch_id
+        self.units = units
+        self.fields: Dict[str, Tuple[str, Callable[[Any], Any], bool]] = {}
+        for key, column in zip(encoder.keys, encoder.columns):
+            if column.key in ("id", "batch_id"):
+                continue
+            nullable = self.model.__table__.c[column.key].nullable or column.key == "active"
+            field = (column.key, _converter(column), nullable)
+            self.fields[key] = field
+            self.fields[column.key] = field
+
+        # All columns are set for each row, executemany uses the same columns for every row
+        self.defaults = {name: None for name, _, _ in self.fields.values()}
+        self.defaults["active"] = True
+
+        self.rows = 0
+        self.rejected = 0
+        self.errors: List[str] = []
+        self.pending: List[dict] = []
+
+    def _normalize(self, values: dict) -> None:
+        if self.units.fahrenheit and values.get("temperature") is not None:
+            values["temperature"] = fahrenheit_to_celsius(values["temperature"])
+        if self.units.plato:
+            for name in ("gravity", "corr_gravity", "filtered_gravity"):
+                if values.get(name) is not None:
+                    values[name] = plato_to_sg(values[name])
+        for name in ("pressure", "pressure1"):
+            if values.get(name) is not None:
+                values[name] = pressure_to_kpa(values[name], self.units.pressure)
+
+    def convert(self, record: dict) -> dict:
+        """Convert a parsed record to column values, raises ValueError for invalid data."""
+        values = dict(self.defaults)
+        for key, value in record.items():
+            field = self.fields.get(key)
+            if field is None or value is None or value == "":
+                continue
+            name, convert, _ = field
+            values[name] = convert(value)
+
+        for name, _, nullable in self.fields.values():
+            if values.get(name) is None and not nullable:
+                raise ValueError(f"missing value for {name}")
+
+        self._normalize(values)
+        values["batch_id"] = self.batch_id
+        return values
+
+    def add(self, line: int, record: Any, connection: Any) -> None:
+        """Add a parsed record, invalid records (or an error message) are counted as rejected."""
+        try:
+            if isinstance(record, str):
+                raise ValueError(record)
+            if not isinstance(record, dict):
+                raise ValueError("not an object")
+            self.pending.append(self.convert(record))
+        except (ValueError, TypeError) as e:
+            self.rejected += 1
+            if len(self.errors) < IMPORT_MAX_ERRORS:
+                self.errors.append(f"Line {line}: {e}")
+            return
+
+        if len(self.pending) >= IMPORT_CHUNK_SIZE:
+            self.flush(connection)
+
+    def flush(self, connection: Any) -> None:
+        """Insert the pending rows and commit them."""
+        if len(self.pending) == 0:
+            return
+        connection.execute(insert(self.model), self.pending)
+        connection.commit()
+        table_versions.bump(self.model.__tablename__)
+        self.rows += len(self.pending)
+        self.pending = []
+
+
+async def _read_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """Split the uploaded byte stream into numbered text lines."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    remainder = ""
+    number = 0
+    async for chunk in stream:
+        lines = (remainder + decoder.decode(chunk)).split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            number += 1
+            yield number, line.rstrip("\r")
+    remainder += decoder.decode(b"", final=True)
+    if remainder:
+        yield number + 1, remainder.rstrip("\r")
+
+
+def _parse_csv(lines: List[Tuple[int, str]], header: List[str]) -> Iterator[Tuple[int, Any]]:
+    for (number, _), values in zip(lines, csv.reader(line for _, line in lines)):
+        if len(values) != len(header):
+            yield number, f"expected {len(header)} values, found {len(values)}"
+        else:
+            yield number, dict(zip(header, values))
+
+
+async def import_readings(
+    importer: BatchImporter, stream: AsyncIterator[bytes], import_format: str
+) -> schemas.ImportResult:
+    """Parse an uploaded stream and insert the readings.
+
+    Args:
+        importer: Importer for the batch and reading type
+        stream: Uploaded body
+        import_format: csv or ndjson
+
+    Returns:
+        Number of inserted and rejected rows and the time spent
+    """
+    start = perf_counter()
+    header: Optional[List[str]] = None
+    lines: List[Tuple[int, str]] = []
+
+    with engine.connect() as connection:
+        async for number, line in _read_lines(stream):
+            if line.strip() == "":
+                continue
+
+            if import_format == "ndjson":
+                try:
+                    record = orjson.loads(line)  # pylint: disable=no-member
+                except orjson.JSONDecodeError:  # pylint: disable=no-member
+                    record = "invalid json"
+                importer.add(number, record, connection)
+            elif header is None:
+                header = next(csv.reader([line]))
+            else:
+                lines.append((number, line))
+                if len(lines) >= IMPORT_CHUNK_SIZE:
+                    for n, record in _parse_csv(lines, header):
+                        importer.add(n, record, connection)
+                    lines = []
+
+        for n, record in _parse_csv(lines, header or []):
+            importer.add(n, record, connection)
+        importer.flush(connection)
+
+    elapsed = perf_counter() - start
+    logger.info(
+        "Imported %d %s rows to batch %d, %d rejected in %.2f s",
+        importer.rows, importer.model.__tablename__, importer.batch_id, importer.rejected, elapsed,
+    )
+    return schemas.ImportResult(
+        rows=importer.rows,
+        rejected=importer.rejected,
+        errors=importer.errors,
+        elapsed_ms=round(elapsed * 1000, 1),
+    )
@@ -0,0 +1,521 @@
+"""Ingest pipeline for readings posted by devices to the public endpoints.
+
+A posted payload goes through the same stages regardless of the device: parse, detect the
+format, normalize, look up or create the batch, look up or create the device and store the
+reading. Each device format (iSpindel, Tilt, Gravitymon, Pressuremon, Kegmon) only provides a
+normalizer that converts the payload to the fields of the reading. Everything that is written
+for a reading is committed in one transaction and the time spent in each stage is collected
+per format.
+"""
+import logging
+import json
+from datetime import datetime
+from json.decoder import JSONDecodeError
+from time import perf_counter
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import BackgroundTasks, Depends, Request
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.exceptions import HTTPException
+
+from api.db import models, schemas
+from api.db.session import get_session
+from api.services import (
+    BatchService,
+    DeviceService,
+    GravityService,
+    PourService,
+    PressureService,
+)
+from .cache import exist_key, read_key, write_key
+from .config import get_settings
+from .ws import notify_clients
+from .analytics import batch_analytics
+from .forecast import batch_forecasts
+from .gravityfilter import gravity_filters
+from .log import system_log, LogLevel
+from .utils import log_public_request, get_client_ip
+
+logger = logging.getLogger(__name__)
+
+
+class Reading:  # pylint: disable=too-few-public-methods
+    """A normalized reading, values are the fields of the create schema except batch_id."""
+    def __init__(self, values: dict, chip_id: str = "", batch_id: Optional[int] = None):
+        self.values = values
+        self.chip_id = chip_id
+        self.batch_id = batch_id
+
+
+class IngestFormat:  # pylint: disable=too-few-public-methods
+    """Description of a device payload format.
+
+    Args:
+        name: Name of the format, used in logs and statistics
+        kind: Type of reading stored, gravity, pressure or pour
+        detect: Returns True if a payload is in this format
+        required: Keys that must be present in the payload
+        normalize: Converts the payload to a Reading
+    """
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        name: str,
+        kind: str,
+        detect: Callable[[dict], bool],
+        required: Tuple[str, ...],
+        normalize: Callable[["IngestPipeline", dict], Reading],
+    ):
+        self.name = name
+        self.kind = kind
+        self.detect = detect
+        self.required = frozenset(required)
+        self.normalize = normalize
+
+    def validate(self, req_json: dict) -> None:
+        """Raise KeyError if a required key is missing in the payload."""
+        if not self.required.issubset(req_json.keys()):
+            raise KeyError(", ".join(sorted(self.required.difference(req_json.keys()))))
+
+
+def fahrenheit_to_celsius(temperature: float) -> float:
+    """Convert a temperature from F to C."""
+    return float(f"{(temperature - 32) * 5 / 9:.2f}")  # °C = (°F − 32) x 5/9
+
+
+def plato_to_sg(gravity: float) -> float:
+    """Convert a gravity from Plato to SG."""
+    return float(
+        f"{1 + (gravity / (258.6 - ((gravity / 258.2) * 227.1))):.4f}"
+    )  # SG = 1+ (plato / (258.6 – ((plato/258.2) *227.1)))
+
+
+def pressure_to_kpa(pressure: float, unit: str) -> float:
+    """Convert a pressure in BAR or PSI to kPa, other units are returned as is."""
+    if unit.upper() == "BAR":
+        return float(f"{pressure * 1000:.4f}")
+    if unit.upper() == "PSI":
+        return float(f"{pressure * 6.89476:.4f}")
+    return pressure
+
+
+GRAVITYMON_EXTENSIONS = ("corr-gravity", "gravity-unit", "run-time", "velocity")
+
+
+def normalize_ispindel(_pipeline: "IngestPipeline", req_json: dict) -> Reading:
+    """Normalize an iSpindel payload, the Gravitymon extensions are used if present."""
+    # Treat temperature values less than -270 as null (below absolute zero, sensor error)
+    temperature = req_json.get("temperature")
+    if temperature is not None and temperature < -270:
+        temperature = None
+    if temperature is not None and str(req_json.get("temp_units", "")).upper() == "F":
+        temperature = fahrenheit_to_celsius(temperature)
+
+    gravity = req_json["gravity"]
+    if gravity is not None and str(req_json.get("gravity-unit") or "SG").upper() == "P":
+        gravity = plato_to_sg(gravity)
+
+    values = {
+        "temperature": temperature,
+        "gravity": gravity,
+        "velocity": req_json.get("velocity"),
+        "angle": req_json["angle"],
+        "battery": req_json["battery"],
+        "rssi": req_json["RSSI"],
+        "corr_gravity": req_json.get("corr-gravity"),
+        "run_time": req_json.get("run-time"),
+    }
+    return Reading(values, chip_id=req_json["ID"])
+
+
+def normalize_tilt(pipeline: "IngestPipeline", req_json: dict) -> Reading:
+    """Normalize a Tilt payload, the device is found using the color."""
+    logger.info("Detected tilt post, searching for device id for %s", req_json["color"])
+
+    device_list = pipeline.device_service.search_ble_color(req_json["color"])
+    if len(device_list) == 0:
+        raise HTTPException(status_code=404, detail="Device with color not found")
+
+    req_json["ID"] = device_list[0].chip_id
+    req_json["temp_units"] = "F"
+    req_json["angle"] = 0
+    req_json["battery"] = 0
+    return normalize_ispindel(pipeline, req_json)
+
+
+def normalize_pressuremon(_pipeline: "IngestPipeline", req_json: dict) -> Reading:
+    """Normalize a Pressuremon payload.
+
+    Example payload from pressuremon v0.4
+    {
+        "name": "aaaa", "id": "cb3818", "interval": 10, "temperature": 21.71,
+        "temperature_unit": "C", "pressure": -0.0023, "pressure1": -0.0023,
+        "pressure_unit": "PSI", "battery": 0.00, "rssi": -82, "run-time": 0
+    }
+    """
+    temperature = req_json.get("temperature")
+    if temperature is not None and str(req_json.get("temperature-unit", "")).upper() == "F":
+        temperature = fahrenheit_to_celsius(temperature)
+
+    pressure = req_json["pressure"]
+    pressure1 = req_json.get("pressure1")
+    if "pressure-unit" in req_json:
+        if pressure is not None:
+            pressure = pressure_to_kpa(pressure, req_json["pressure-unit"])
+        if pressure1 is not None and pressure1 != 0.0:
+            pressure1 = pressure_to_kpa(pressure1, req_json["pressure-unit"])
+
+    values = {
+        "temperature": temperature,
+        "pressure": pressure,
+        "pressure1": pressure1,
+        "battery": req_json.get("battery"),
+        "rssi": req_json["rssi"],
+        "run_time": req_json.get("run-time"),
+    }
+    return Reading(values, chip_id=req_json["id"])
+
+
+def normalize_kegmon(_pipeline: "IngestPipeline", req_json: dict) -> Reading:
+    """Normalize a Kegmon payload, the id is the batch the keg is connected to."""
+    try:
+        batch_id = int(req_json["id"])
+    except (KeyError, ValueError, TypeError) as e:
+        logger.error("Invalid batch ID: %s", e)
+        system_log(
+            "pour",
+            f"Invalid batch ID in request: {req_json.get('id')}",
+            error_code=400,
+            log_level=LogLevel.WARNING,
+        )
+        raise HTTPException(status_code=400, detail="Invalid batch ID") from e
+
+    values = {
+        "pour": req_json.get("pour") or 0,
+        "volume": req_json.get("volume") or 0,
+        "max_volume": req_json.get("maxVolume") or 0,
+    }
+    return Reading(values, batch_id=batch_id)
+
+
+# Formats in the order they are detected, the last format of each kind is used when
+# nothing matches on an endpoint for that kind.
+INGEST_FORMATS: List[IngestFormat] = [
+    IngestFormat(
+        "tilt", "gravity", lambda j: "color" in j, ("color", "gravity", "RSSI"), normalize_tilt
+    ),
+    IngestFormat(
+        "gravitymon", "gravity",
+        lambda j: "gravity" in j and any(k in j for k in GRAVITYMON_EXTENSIONS),
+        ("ID", "gravity", "angle", "battery", "RSSI"), normalize_ispindel,
+    ),
+    IngestFormat(
+        "ispindel", "gravity",
+        lambda j: "gravity" in j,
+        ("ID", "gravity", "angle", "battery", "RSSI"), normalize_ispindel,
+    ),
+    IngestFormat(
+        "pressuremon", "pressure",
+        lambda j: "pressure" in j,
+        ("id", "pressure", "rssi"), normalize_pressuremon,
+    ),
+    IngestFormat("kegmon", "pour", lambda j: "pour" in j or "volume" in j, (), normalize_kegmon),
+]
+
+
+def detect_format(req_json: Any, kind: Optional[str] = None) -> Optional[IngestFormat]:
+    """Find the format of a payload.
+
+    Args:
+        req_json: Posted payload
+        kind: Only consider formats storing this kind of reading, None for all formats
+
+    Returns:
+        The detected format or None if the payload is not recognized
+    """
+    if not isinstance(req_json, dict):
+        return None
+
+    fallback = None
+    for fmt in INGEST_FORMATS:
+        if kind is not None and fmt.kind != kind:
+            continue
+        if fmt.detect(req_json):
+            return fmt
+        fallback = fmt
+
+    return fallback if kind is not None else None
+
+
+class IngestStats:
+    """Number of readings and time spent per format and stage."""
+    def __init__(self):
+        self.stages: dict[tuple[str, str], list] = {}
+
+    def record(self, fmt: str, timings: dict[str, float]) -> None:
+        """Add the stage timings (seconds) for one reading."""
+        for stage, elapsed in timings.items():
+            entry = self.stages.setdefault((fmt, stage), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+    def snapshot(self) -> List[schemas.IngestStage]:
+        """Return the collected statistics."""
+        return [
+            schemas.IngestStage(
+                format=fmt,
+                stage=stage,
+                count=count,
+                total_ms=round(total * 1000, 3),
+                avg_ms=round(total * 1000 / count, 3),
+                max_ms=round(peak * 1000, 3),
+            )
+            for (fmt, stage), (count, total, peak) in self.stages.items()
+        ]
+
+    def clear(self) -> None:
+        """Remove all collected statistics."""
+        self.stages = {}
+
+
+ingest_stats = IngestStats()
+
+
+class IngestPipeline:
+    """Store readings posted by devices, all database changes for a reading use one transaction."""
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+        self.batch_service = BatchService(db_session)
+        self.device_service = DeviceService(db_session)
+        self.reading_services = {
+            "gravity": GravityService(db_session),
+            "pressure": PressureService(db_session),
+            "pour": PourService(db_session),
+        }
+
+    async def handle(
+        self, request: Request, background_tasks: BackgroundTasks, kind: Optional[str] = None
+    ) -> Optional[Any]:
+        """Parse a posted request, log it to the receive log and store the reading.
+
+        Args:
+            request: The incoming HTTP request with JSON body
+            background_tasks: FastAPI background tasks for logging and notifications
+            kind: Reading kind accepted by the endpoint, None to detect it from the payload
+
+        Returns:
+            The stored reading, None if the reading was ignored
+        """
+        module = kind or "dispatch"
+        start = perf_counter()
+
+        try:
+            req_json = await request.json()
+        except (JSONDecodeError, UnicodeDecodeError) as e:
+            logger.error(e)
+            system_log(
+                module,
+                f"Failed to parse {module} data: {type(e).__name__}",
+                error_code=0,
+                log_level=LogLevel.ERROR,
+            )
+            raise HTTPException(status_code=422, detail="Unable to parse request") from e
+
+        # Get client IP address and log the request
+        client_host = get_client_ip(request)
+        logger.debug("Request from IP: %s", client_host)
+        background_tasks.add_task(log_public_request, client_host, req_json)
+
+        fmt = detect_format(req_json, kind)
+        if fmt is None:
+            if kind is None and isinstance(req_json, dict):
+                raise HTTPException(status_code=400, detail="Format not recognized")
+            raise HTTPException(status_code=422, detail="Unable to parse request")
+
+        try:
+            return self.ingest(fmt, req_json, background_tasks, {"parse": perf_counter() - start})
+        except (KeyError, TypeError, ValidationError) as e:
+            self.db_session.rollback()
+            logger.error(e)
+            system_log(
+                fmt.kind,
+                f"Failed to parse {fmt.kind} data: {type(e).__name__}",
+                error_code=0,
+                log_level=LogLevel.ERROR,
+            )
+            raise HTTPException(status_code=422, detail="Unable to parse request") from e
+        except HTTPException:
+            self.db_session.rollback()
+            raise
+
+    def ingest(  # pylint: disable=too-many-locals
+        self,
+        fmt: IngestFormat,
+        req_json: dict,
+        background_tasks: BackgroundTasks,
+        timings: Optional[dict[str, float]] = None,
+    ) -> Optional[Any]:
+        """Store a payload in a known format.
+
+        Args:
+            fmt: Format of the payload
+            req_json: Posted payload
+            background_tasks: FastAPI background tasks for notifications
+            timings: Stage timings already measured by the caller
+
+        Returns:
+            The stored reading, None if the reading was ignored
+        """
+        timings = timings if timings is not None else {}
+        logger.info("Payload (%s): %s", fmt.name, req_json)
+
+        start = lap = perf_counter()
+        fmt.validate(req_json)
+        reading = fmt.normalize(self, req_json)
+        timings["normalize"], lap = perf_counter() - lap, perf_counter()
+
+        created = []  # (module, message, notify type, id) to report after the commit
+        batch = self._resolve_batch(fmt, reading, created)
+        timings["batch"], lap = perf_counter() - lap, perf_counter()
+
+        device_found = True
+        if fmt.kind != "pour":
+            device_found = self._resolve_device(fmt, reading, created)
+        timings["device"], lap = perf_counter() - lap, perf_counter()
+
+        try:
+            result = self._store(fmt, reading, batch)
+            self.db_session.commit()
+        except Exception:
+            # The filter already took the reading, rebuild it from the stored readings next time
+            if fmt.kind == "gravity":
+                gravity_filters.invalidate(batch.id)
+            raise
+        timings["insert"] = perf_counter() - lap
+        timings["total"] = perf_counter() - start + timings.get("parse", 0)
+
+        for module, message, notify_type, notify_id in created:
+            system_log(module, message, error_code=0, log_level=LogLevel.INFO)
+            background_tasks.add_task(notify_clients, notify_type, "create", notify_id)
+
+        if result is not None:
+            if fmt.kind == "gravity":
+                batch_analytics.add(result)
+                batch_forecasts.invalidate(result.batch_id)
+            background_tasks.add_task(notify_clients, "batch", "update", result.batch_id)
+
+            # Save the record in redis for background job to forward
+            if fmt.kind == "gravity" and device_found:
+                write_key("gravity_" + reading.chip_id, json.dumps(req_json), ttl=None)
+
+        ingest_stats.record(fmt.name, timings)
+        logger.debug("Ingest %s timings %s", fmt.name, timings)
+        return result
+
+    def _resolve_batch(self, fmt: IngestFormat, reading: Reading, created: list) -> models.Batch:
+        if fmt.kind == "pour":
+            logger.info("Looking up batch with ID: %s", reading.batch_id)
+            batch = self.batch_service.get(reading.batch_id)
+            if batch is None:
+                logger.warning("No batch found for batch ID %s", reading.batch_id)
+                system_log(
+                    "pour",
+                    f"No batch found for batch ID {reading.batch_id}",
+                    error_code=404,
+                    log_level=LogLevel.WARNING,
+                )
+                raise HTTPException(status_code=409, detail="No batch found")
+            return batch
+
+        # Check if there is an active batch
+        batch_list = self.batch_service.search_chip_id_active(reading.chip_id, True)
+        if len(batch_list) > 0:
+            return batch_list[0]
+
+        batch = schemas.BatchCreate(
+            name="Batch for " + reading.chip_id,
+            chipIdGravity=reading.chip_id if fmt.kind == "gravity" else "",
+            chipIdPressure=reading.chip_id if fmt.kind == "pressure" else "",
+            description="Automatically created",
+            brewDate=datetime.today().strftime("%Y-%m-%d"),
+            style="",
+            brewer="",
+            brewfatherId="",
+            active=True,
+            abv=0.0,
+            ebc=0.0,
+            ibu=0.0,
+            # fermentation_chamber=None, # This is optional and should be assigned in UI
+            fermentation_steps="",
+            tap_list=True,
+        )
+        batch = self.batch_service.create(batch, commit=False)
+        created.append(
+            (fmt.kind, f"Batch auto-created from public endpoint: {batch.name}", "batch", batch.id)
+        )
+        return batch
+
+    def _resolve_device(self, fmt: IngestFormat, reading: Reading, created: list) -> bool:
+        # Check if there is an device registered
+        if len(self.device_service.search_chip_id(reading.chip_id)) > 0:
+            return True
+
+        device = schemas.DeviceCreate(
+            chipId=reading.chip_id,
+            chipFamily="",
+            software="",
+            mdns="",
+            config="",
+            bleColor="",
+            url="",
+            description="",
+            collectLogs=False,
+        )
+        device = self.device_service.create(device, commit=False)
+        message = f"Device auto-created from public endpoint: {device.chip_id}"
+        created.append((fmt.kind, message, "device", device.id))
+        return False
+
+    def _store(self, fmt: IngestFormat, reading: Reading, batch: models.Batch) -> Optional[Any]:
+        values = dict(reading.values, batch_id=batch.id, created=datetime.now(), active=True)
+        logger.info("Saving %s request for batch %s", fmt.kind, batch.id)
+
+        if fmt.kind == "gravity":
+            # If there is a tagged chamber controller device lets use the value from that
+            chamber_id = batch.fermentation_chamber
+            if chamber_id is not None and chamber_id > 1:
+                key = "chamber_" + str(chamber_id) + "_beer_temp"
+                if exist_key(key):
+                    values["beer_temperature"] = float(read_key(key))
+                key = "chamber_" + str(chamber_id) + "_fridge_temp"
+                if exist_key(key):
+                    values["chamber_temperature"] = float(read_key(key))
+
+            filtered, outlier = gravity_filters.apply(
+                batch.id, values["created"], values["gravity"]
+            )
+            values["filtered_gravity"] = filtered
+            if outlier and get_settings().gravity_filter_deactivate:
+                values["active"] = False
+            gravity_service = self.reading_services["gravity"]
+            return gravity_service.create(schemas.GravityCreate(**values), commit=False)
+
+        if fmt.kind == "pressure":
+            pressure_service = self.reading_services["pressure"]
+            return pressure_service.create(schemas.PressureCreate(**values), commit=False)
+
+        # If we get a volume update and no pour, check if the value has changed
+        pour_service = self.reading_services["pour"]
+        pour_list = pour_service.search_by_batch_id(batch.id)
+        if len(pour_list) > 0 and values["pour"] == 0:
+            latest = max(pour_list, key=lambda p: p.created)
+            if latest.volume == values["volume"]:
+                logger.info("Volume recevied in pour update has not changed, ignoring data.")
+                return None
+        return pour_service.create(schemas.PourCreate(**values), commit=False)
+
+
+def get_ingest_pipeline(db_session: Session = Depends(get_session)) -> IngestPipeline:
+    """Provide IngestPipeline dependency for the public endpoints."""
+    return IngestPipeline(db_session)
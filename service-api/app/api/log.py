@@ -1,11 +1,13 @@
 """Custom logging configuration and handlers for application event logging."""
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from enum import IntEnum
+from typing import Optional
 from sqlalchemy.exc import SQLAlchemyError
 from api.services import SystemLogService
-from api.db import schemas, models
+from api.db import schemas
 from api.db.session import create_session
+from .retention import apply_retention, retention_policies
 
 logger = logging.getLogger(__name__)
 
@@ -57,12 +59,29 @@ def system_log(module: str, message: str, error_code: int = 0, log_level: int =
         logger.error("Failed to write system log: %s", e)
 
 
-def system_log_purge(days: int = 60):
-    """Purge system log entries older than 60 days."""
-    logger.info("Purging order system log from records older than 60 days")
-    systemlog_service = SystemLogService(create_session())
-    count = systemlog_service.delete_by_timestamp(days)
-    logger.info("Deleted %s records from system log", count)
+def _purge(table: str, days: Optional[int]) -> int:
+    policy = retention_policies()[table]
+    if days is not None:
+        policy.days = days
+    return apply_retention(policy)
+
+
+def system_log_purge(days: Optional[int] = None) -> int:
+    """Purge system log entries older than the retention period.
+
+    Args:
+        days: Number of days to retain, defaults to SYSTEMLOG_RETENTION_DAYS
+    """
+    return _purge("systemlog", days)
+
+
+def device_log_purge(days: Optional[int] = None) -> int:
+    """Purge stored device log lines older than the retention period.
+
+    Args:
+        days: Number of days to retain, defaults to DEVICELOG_RETENTION_DAYS
+    """
+    return _purge("devicelog", days)
 
 
 def system_log_scheduler(message: str, error_code: int = 0, log_level: int = LogLevel.INFO) -> None:
@@ -80,27 +99,13 @@ def system_log_security(message: str, error_code: int = 0, log_level: int = LogL
     system_log("security", message=message, error_code=error_code, log_level=log_level)
 
 
-def receive_log_purge(days: int = 90) -> None:
-    """Delete receive log entries older than specified days.
+def receive_log_purge(days: Optional[int] = None) -> None:
+    """Delete receive log entries older than the retention period.
 
     Args:
-        days: Number of days to retain (default: 90). Older records deleted.
+        days: Number of days to retain, defaults to RECEIVELOG_RETENTION_DAYS
     """
     try:
-        session = create_session()
-        cutoff_date = datetime.now() - timedelta(days=days)
-
-        deleted_count = session.query(models.ReceiveLog).filter(
-            models.ReceiveLog.timestamp < cutoff_date
-        ).delete()
-
-        session.commit()
-        session.close()
-
-        if deleted_count > 0:
-            logger.info(
-                "Purged %d old receive log records (older than %d days)",
-                deleted_count, days
-            )
+        _purge("receivelog", days)
     except SQLAlchemyError as e:
         logger.error("Failed to purge old receive logs: %s", e)
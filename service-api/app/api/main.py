@@ -22,6 +22,7 @@ from api.routers import system as apiSystem
 from .cache import write_key
 from .config import get_settings
 from .log import system_log, LogLevel
+from .proxy import device_proxy
 from .scheduler import scheduler_setup, scheduler_shutdown
 from .utils import load_settings
 
@@ -41,6 +42,7 @@ async def lifespan(application: FastAPI):
     # Running on closedown
     logger.info("Running shutdown handler")
     scheduler_shutdown()
+    await device_proxy.close()
 
 
 def register_handlers(application: FastAPI) -> None:
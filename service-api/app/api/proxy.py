@@ -0,0 +1,164 @@
+"""Pooled HTTP access to devices.
+
+Requests are limited per device, GET responses are cached for a short time and identical
+GET requests in flight are coalesced.
+"""
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceProxy:  # pylint: disable=too-many-instance-attributes
+    """Forward requests to devices, the ESP devices are slow and handle one request at a time.
+
+    Each device (host:port) gets its own connection pool and a semaphore that limits the
+    number of concurrent requests. Successful GET responses are cached for a few seconds and
+    identical GET requests that arrive while one is in flight share its response. The shared
+    request runs in its own task, so a caller that is cancelled does not affect the others.
+    Write requests invalidate the cached responses for the device, a GET that was in flight
+    during a write is not cached.
+    """
+    def __init__(self, concurrency: int, cache_ttl: float):
+        self.concurrency = concurrency
+        self.cache_ttl = cache_ttl
+        self.timeout = httpx.Timeout(10.0, connect=10.0, read=10.0)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._cache: dict[tuple, tuple[float, httpx.Response]] = {}
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self._generations: dict[str, int] = {}  # Increased for each write to a device
+
+    def _check_loop(self) -> asyncio.AbstractEventLoop:
+        # Clients, semaphores and futures belong to one event loop
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._clients = {}
+            self._semaphores = {}
+            self._cache = {}
+            self._inflight = {}
+            self._generations = {}
+        return loop
+
+    def _client(self, host: str) -> httpx.AsyncClient:
+        client = self._clients.get(host)
+        if client is None:
+            limits = httpx.Limits(
+                max_connections=self.concurrency, max_keepalive_connections=self.concurrency
+            )
+            client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+            self._clients[host] = client
+        return client
+
+    async def _send(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, host: str, method: str, url: str, body: Optional[str], headers: dict[str, str]
+    ) -> httpx.Response:
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.concurrency))
+        async with semaphore:
+            client = self._client(host)
+            if method == "post":
+                logger.info("Request using post %s", url)
+                return await client.post(url, data=body, headers=headers)
+            if method == "put":
+                logger.info("Request using put %s", url)
+                return await client.put(url, data=body, headers=headers)
+            if method == "delete":
+                logger.info("Request using delete %s", url)
+                return await client.delete(url, headers=headers)
+            logger.info("Request using get %s", url)
+            return await client.get(url, headers=headers)
+
+    def _invalidate(self, host: str) -> None:
+        self._generations[host] = self._generations.get(host, 0) + 1
+        for key in [k for k in self._cache if k[0] == host]:
+            self._cache.pop(key)
+        # New GET requests should not wait for a response from before the write
+        for key in [k for k in self._inflight if k[0] == host]:
+            self._inflight.pop(key)
+
+    def _store(self, key: tuple, now: float, res: httpx.Response) -> None:
+        if len(self._cache) > 256:
+            for k in [k for k, v in self._cache.items() if v[0] <= now]:
+                self._cache.pop(k)
+        self._cache[key] = (now + self.cache_ttl, res)
+
+    async def _fetch(
+        self, key: tuple, host: str, url: str, headers: dict[str, str]
+    ) -> httpx.Response:
+        generation = self._generations.get(host, 0)
+        try:
+            res = await self._send(host, "get", url, None, headers)
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                self._inflight.pop(key)
+        if (
+            res.status_code == 200
+            and self.cache_ttl > 0
+            and self._generations.get(host, 0) == generation
+        ):
+            self._store(key, asyncio.get_running_loop().time(), res)
+        return res
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        body: Optional[str] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> httpx.Response:
+        """Send a request to a device and return the response.
+
+        Args:
+            method: get, post, put or delete (anything else is sent as get)
+            url: Full url on the device
+            body: Request body for post and put
+            headers: Extra request headers
+
+        Returns:
+            The response, possibly shared with other callers
+        """
+        loop = self._check_loop()
+        method = method.lower()
+        headers = headers or {}
+        host = urlsplit(url).netloc
+
+        if method in ("post", "put", "delete"):
+            self._invalidate(host)
+            return await self._send(host, method, url, body, headers)
+
+        key = (host, url, tuple(sorted(headers.items())))
+        now = loop.time()
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > now:
+            logger.info("Using cached response for %s", url)
+            return cached[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            logger.info("Waiting for identical request to %s", url)
+        else:
+            task = loop.create_task(self._fetch(key, host, url, headers))
+            # Retrieve the exception when all callers were cancelled, avoids a warning
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        # Cancelling a caller does not cancel the request shared with other callers
+        return await asyncio.shield(task)
+
+    async def close(self) -> None:
+        """Close all device connection pools."""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients = {}
+
+
+device_proxy = DeviceProxy(
+    get_settings().device_proxy_concurrency, get_settings().device_proxy_cache_ttl
+)
@@ -0,0 +1,52 @@
+"""Fast JSON encoding of large lists of readings.
+
+Rows are encoded directly without creating pydantic models.
+"""
+from typing import Any, Iterable, List, Sequence, Tuple, Type
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from api.db import models, schemas
+
+
+class ORJSONRowsResponse(Response):
+    """JSON response rendered with orjson, content is plain dicts and lists."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)  # pylint: disable=no-member
+
+
+class RowEncoder:
+    """Map query rows to the json keys of a response schema.
+
+    The columns are selected in the order of the schema fields so that each row can be zipped
+    with the camelCase keys, this gives the same json as the response_model but avoids
+    creating an ORM object and a pydantic model per row.
+
+    Args:
+        schema: Response schema, the field aliases are used as keys
+        model: ORM model with a column for each field
+        exclude: Schema fields that are not columns, e.g. relationships
+    """
+    def __init__(self, schema: Type[BaseModel], model: Any, exclude: Tuple[str, ...] = ()):
+        fields = [name for name in schema.model_fields if name not in exclude]
+        self.keys = tuple(schema.model_fields[name].alias or name for name in fields)
+        self.columns = tuple(getattr(model, name) for name in fields)
+
+    def encode(self, rows: Iterable[Sequence[Any]]) -> List[dict]:
+        """Convert row tuples to dicts with the schema keys."""
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in rows]
+
+    def encode_one(self, row: Sequence[Any]) -> dict:
+        """Convert a single row tuple to a dict with the schema keys."""
+        return dict(zip(self.keys, row))
+
+
+gravity_rows = RowEncoder(schemas.Gravity, models.Gravity)
+pressure_rows = RowEncoder(schemas.Pressure, models.Pressure)
+pour_rows = RowEncoder(schemas.Pour, models.Pour)
+batch_rows = RowEncoder(schemas.Batch, models.Batch, exclude=("gravity", "pressure", "pour"))
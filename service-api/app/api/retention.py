@@ -0,0 +1,109 @@
+"""Retention of log tables, old rows are deleted in bounded chunks.
+
+Each chunk is deleted in its own short transaction using the timestamp index, so a purge never
+holds long locks or writes one huge transaction to the WAL. On Postgres tables that are
+partitioned by month (see migrate/migrate.py) whole partitions are dropped first, the chunked
+delete only has to handle the remaining rows. New partitions are created by maintain_partitions.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, select
+
+from api.config import get_settings
+from api.db import models
+from api.db.partition import drop_month_partitions, is_partitioned
+from api.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:  # pylint: disable=too-few-public-methods
+    """How long rows in a table are kept.
+
+    Args:
+        model: ORM model of the table
+        column: Timestamp column used to find old rows
+        days: Number of days to keep
+        chunk_size: Max number of rows deleted per transaction
+    """
+    def __init__(self, model: Any, column: Any, days: int, chunk_size: int):
+        self.model = model
+        self.column = column
+        self.days = days
+        self.chunk_size = chunk_size
+
+    @property
+    def table(self) -> str:
+        """Name of the table."""
+        return self.model.__tablename__
+
+
+def retention_policies() -> Dict[str, RetentionPolicy]:
+    """Return the retention policies for the log tables using the configured number of days."""
+    settings = get_settings()
+    chunk_size = settings.retention_chunk_size
+    return {
+        "systemlog": RetentionPolicy(
+            models.SystemLog,
+            models.SystemLog.timestamp,
+            settings.systemlog_retention_days,
+            chunk_size,
+        ),
+        "receivelog": RetentionPolicy(
+            models.ReceiveLog,
+            models.ReceiveLog.timestamp,
+            settings.receivelog_retention_days,
+            chunk_size,
+        ),
+        "devicelog": RetentionPolicy(
+            models.DeviceLog,
+            models.DeviceLog.timestamp,
+            settings.devicelog_retention_days,
+            chunk_size,
+        ),
+    }
+
+
+def _delete_chunks(policy: RetentionPolicy, cutoff: datetime) -> int:
+    model = policy.model
+    oldest = (
+        select(model.id)
+        .where(policy.column < cutoff)
+        .order_by(policy.column)
+        .limit(policy.chunk_size)
+    )
+    statement = delete(model).where(model.id.in_(oldest.scalar_subquery()))
+
+    deleted = 0
+    while True:
+        with engine.begin() as con:
+            count = con.execute(statement).rowcount
+        deleted += count
+        if count < policy.chunk_size:
+            return deleted
+
+
+def apply_retention(policy: RetentionPolicy, now: Optional[datetime] = None) -> int:
+    """Delete the rows that are older than the retention period.
+
+    Args:
+        policy: Table and retention period
+        now: Current time, used in tests
+
+    Returns:
+        Number of deleted rows, rows in dropped partitions are not counted
+    """
+    now = now or datetime.now()
+    cutoff = now - timedelta(days=policy.days)
+
+    with engine.begin() as con:
+        if is_partitioned(con, policy.table):
+            drop_month_partitions(con, policy.table, cutoff)
+
+    deleted = _delete_chunks(policy, cutoff)
+    logger.info(
+        "Retention of %s: deleted %d rows older than %d days", policy.table, deleted, policy.days
+    )
+    return deleted
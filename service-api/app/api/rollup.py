@@ -0,0 +1,267 @@
+"""Hourly and daily rollups of the batch readings.
+
+For each batch, hour and day the rollup table holds count, sum, min and max of a metric, so
+charts and statistics do not need to read all readings. New readings are found using a
+watermark (the highest processed id per reading table), the buckets they fall in are
+recomputed from the active readings. Edits and deletes of readings refresh the whole batch.
+Ids can be committed out of order (an import commits its chunks while readings are ingested),
+so each run also scans the ids just below the watermark again.
+
+The rollups are updated by the scheduler, the endpoints only read the rollup table.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.engine import Connection
+
+from api.db import models
+from api.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_CHUNK_SIZE = 5000
+ROLLUP_RESCAN_IDS = 2000  # Ids below the watermark scanned again for late commits
+
+ROLLUP_PERIODS = {"hour": "h", "day": "d"}
+
+# Reading table and the metrics (name, column) that are rolled up
+ROLLUP_SOURCES: Dict[str, Tuple[Any, Tuple[Tuple[str, Any], ...]]] = {
+    "gravity": (models.Gravity, (
+        ("gravity", models.Gravity.gravity),
+        ("corr_gravity", models.Gravity.corr_gravity),
+        ("temperature", models.Gravity.temperature),
+    )),
+    "pressure": (models.Pressure, (
+        ("pressure", models.Pressure.pressure),
+        ("pressure_temperature", models.Pressure.temperature),
+    )),
+    "pour": (models.Pour, (
+        ("pour", models.Pour.pour),
+    )),
+}
+
+_lock = threading.Lock()
+
+
+def _hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate(
+    rows: List[Tuple[Any, ...]], metrics: List[str]
+) -> Dict[Tuple[str, datetime, str], List[float]]:
+    """Aggregate rows of (created, value, ...) to [count, sum, min, max].
+
+    Returns:
+        The aggregate per period, bucket and metric
+    """
+    buckets: Dict[Tuple[str, datetime, str], List[float]] = {}
+    for row in rows:
+        created = row[0]
+        for period, bucket in (("h", _hour(created)), ("d", _day(created))):
+            for metric, value in zip(metrics, row[1:]):
+                if value is None:
+                    continue
+                agg = buckets.get((period, bucket, metric))
+                if agg is None:
+                    buckets[(period, bucket, metric)] = [1, value, value, value]
+                else:
+                    agg[0] += 1
+                    agg[1] += value
+                    agg[2] = min(agg[2], value)
+                    agg[3] = max(agg[3], value)
+    return buckets
+
+
+def _rebuild(
+    con: Connection, source: str, batch_id: int, start: Optional[datetime], end: Optional[datetime]
+) -> None:
+    """Recompute the rollups of one reading table for a batch, between start and end if given."""
+    model, metrics = ROLLUP_SOURCES[source]
+    names = [name for name, _ in metrics]
+
+    query = select(model.created, *[column for _, column in metrics]).where(
+        model.batch_id == batch_id, model.active.is_(True)
+    )
+    stale = delete(models.Rollup).where(
+        models.Rollup.batch_id == batch_id, models.Rollup.metric.in_(names)
+    )
+    if start is not None:
+        query = query.where(model.created >= start)
+        stale = stale.where(models.Rollup.bucket >= start)
+    if end is not None:
+        query = query.where(model.created < end)
+        stale = stale.where(models.Rollup.bucket < end)
+
+    buckets = aggregate(con.execute(query).all(), names)
+    con.execute(stale)
+    if buckets:
+        con.execute(insert(models.Rollup), [
+            {
+                "batch_id": batch_id,
+                "period": period,
+                "bucket": bucket,
+                "metric": metric,
+                "count": agg[0],
+                "sum": agg[1],
+                "min": agg[2],
+                "max": agg[3],
+            }
+            for (period, bucket, metric), agg in buckets.items()
+        ])
+
+
+def _rebuild_rows(con: Connection, source: str, rows: List[Tuple[int, int, datetime]]) -> None:
+    """Recompute the days touched by rows of (id, batch_id, created) per batch."""
+    ranges: Dict[int, List[datetime]] = {}
+    for _, batch_id, created in rows:
+        if batch_id is None:
+            continue
+        day = _day(created)
+        first_last = ranges.setdefault(batch_id, [day, day])
+        first_last[0] = min(first_last[0], day)
+        first_last[1] = max(first_last[1], day)
+    for batch_id, (first, last) in ranges.items():
+        _rebuild(con, source, batch_id, first, last + timedelta(days=1))
+
+
+def _update_source(source: str) -> int:
+    model, _ = ROLLUP_SOURCES[source]
+    processed = 0
+    rescan = True
+
+    while True:
+        with engine.begin() as con:
+            watermark = con.execute(
+                select(models.RollupWatermark.last_id)
+                .where(models.RollupWatermark.source == source)
+            ).scalar()
+            if rescan and watermark is not None:
+                # Rows committed after rows with a higher id, already past the watermark
+                _rebuild_rows(con, source, con.execute(
+                    select(model.id, model.batch_id, model.created)
+                    .where(model.id > watermark - ROLLUP_RESCAN_IDS, model.id <= watermark)
+                ).all())
+            rescan = False
+
+            rows = con.execute(
+                select(model.id, model.batch_id, model.created)
+                .where(model.id > (watermark or 0))
+                .order_by(model.id)
+                .limit(ROLLUP_CHUNK_SIZE)
+            ).all()
+            if len(rows) == 0:
+                return processed
+
+            # Days touched per batch, all buckets in that range are recomputed
+            _rebuild_rows(con, source, rows)
+
+            last_id = rows[-1][0]
+            if watermark is None:
+                con.execute(insert(models.RollupWatermark), {"source": source, "last_id": last_id})
+            else:
+                con.execute(
+                    update(models.RollupWatermark)
+                    .where(models.RollupWatermark.source == source)
+                    .values(last_id=last_id)
+                )
+        processed += len(rows)
+
+
+def update_rollups() -> int:
+    """Add the readings stored since the last run to the rollups.
+
+    Returns:
+        Number of processed readings
+    """
+    with _lock:
+        processed = sum(_update_source(source) for source in ROLLUP_SOURCES)
+    if processed:
+        logger.info("Updated rollups with %d readings", processed)
+    return processed
+
+
+def refresh_batch_rollups(batch_id: int) -> None:
+    """Recompute all rollups for a batch, used when readings are changed or deleted."""
+    with _lock, engine.begin() as con:
+        for source in ROLLUP_SOURCES:
+            _rebuild(con, source, batch_id, None, None)
+    logger.info("Refreshed rollups for batch %d", batch_id)
+
+
+def batch_rollups(batch_id: int, period: str) -> List[Dict[str, Any]]:
+    """Return the rollups of a batch for the period (hour or day), oldest first."""
+    rollup = models.Rollup
+    with engine.connect() as con:
+        rows = con.execute(
+            select(rollup.bucket, rollup.metric, rollup.count, rollup.sum, rollup.min, rollup.max)
+            .where(rollup.batch_id == batch_id, rollup.period == ROLLUP_PERIODS[period])
+            .order_by(rollup.bucket, rollup.metric)
+        ).all()
+    return [
+        {
+            "bucket": bucket,
+            "metric": metric,
+            "count": count,
+            "min": lo,
+            "max": hi,
+            "avg": total / count,
+        }
+        for bucket, metric, count, total, lo, hi in rows
+    ]
+
+
+def aligned_series(  # pylint: disable=too-many-locals
+    batch_ids: List[int], metric: str, step: int
+) -> Dict[int, Dict[str, Any]]:
+    """Return the series of a metric for several batches aligned to hours since the first reading.
+
+    The hourly rollups of all batches are read with one query and merged to buckets of step
+    hours with NumPy, the averages are weighted with the number of readings.
+
+    Returns:
+        Start time, hours and values per batch id, batches without data are left out
+    """
+    rollup = models.Rollup
+    with engine.connect() as con:
+        rows = con.execute(
+            select(rollup.batch_id, rollup.bucket, rollup.sum, rollup.count)
+            .where(
+                rollup.batch_id.in_(batch_ids),
+                rollup.period == ROLLUP_PERIODS["hour"],
+                rollup.metric == metric,
+            )
+            .order_by(rollup.batch_id, rollup.bucket)
+        ).all()
+    if len(rows) == 0:
+        return {}
+
+    batch, bucket, total, count = (np.array(column) for column in zip(*rows))
+    bucket = bucket.astype("datetime64[s]")
+    ids, first, index = np.unique(batch, return_index=True, return_inverse=True)
+    hours = (bucket - bucket[first][index]) / np.timedelta64(1, "h")
+    slot = (hours // step).astype(np.int64)
+
+    keys, group = np.unique(np.stack([index, slot], axis=1), axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    sums = np.bincount(group, weights=total)
+    counts = np.bincount(group, weights=count)
+    values = sums / counts
+
+    result: Dict[int, Dict[str, Any]] = {}
+    for position, batch_id in enumerate(ids.tolist()):
+        mask = keys[:, 0] == position
+        result[batch_id] = {
+            "start": bucket[first[position]].astype(datetime),
+            "hours": (keys[mask, 1] * step).astype(float).tolist(),
+            "values": values[mask].tolist(),
+        }
+    return result
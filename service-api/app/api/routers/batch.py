@@ -1,18 +1,34 @@
 """Batch management API endpoints for creating, updating, and managing brewing batches."""
 import logging
 from typing import List, Optional
-from fastapi import Depends, BackgroundTasks, Query
+from fastapi import Depends, BackgroundTasks, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.routing import APIRouter
+from pydantic import TypeAdapter
 from starlette.exceptions import HTTPException
 from api.db import models, schemas
 from api.services import BatchService, get_batch_service
 from ..security import api_key_auth
+from ..analytics import batch_analytics
+from ..forecast import batch_forecasts
+from ..gravityfilter import gravity_filters
+from ..export import EXPORT_MEDIA_TYPES, EXPORT_WRITERS, parquet_available
+from ..importer import BatchImporter, ImportUnits, import_readings
+from ..rollup import ROLLUP_SOURCES, aligned_series, batch_rollups
+from ..responses import ORJSONRowsResponse, batch_rows, gravity_rows, pressure_rows, pour_rows
+from ..versions import BATCH_TABLES, conditional_response
 from ..ws import notify_clients
 from ..log import system_log, LogLevel
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/batch")
 
+COMPARE_MAX_BATCHES = 20
+COMPARE_METRICS = [name for _, metrics in ROLLUP_SOURCES.values() for name, _ in metrics]
+
+batch_list_adapter = TypeAdapter(List[schemas.BatchList])
+tap_list_adapter = TypeAdapter(List[schemas.TapListBatch])
+
 
 @router.get(
     "/",
@@ -20,34 +36,40 @@ router = APIRouter(prefix="/api/batch")
     dependencies=[Depends(api_key_auth)],
 )
 async def list_batches(
+    request: Request,
     chip_id: Optional[str] = Query(None, alias="chipId"),
     active: Optional[bool] = Query(None),
     batch_service: BatchService = Depends(get_batch_service),
-) -> List[schemas.BatchList]:
+) -> Response:
     """List all batches with optional filtering by chip ID and active status."""
     logger.info("Endpoint GET /api/batch/?chip_id=%s&active=%s", chip_id, active)
 
-    batches = batch_service.list_filtered(chip_id=chip_id, active=active)
-
-    # Enrich batches with counts and last pour data
-    for batch in batches:
-        batch.gravity_count = len(batch.gravity) if batch.gravity else 0
-        batch.pressure_count = len(batch.pressure) if batch.pressure else 0
-        batch.pour_count = len(batch.pour) if batch.pour else 0
-
-        last_pour_volume = None
-        last_pour_max_volume = None
-        if batch.pour:
-            active_pours = [p for p in batch.pour if p.active]
-            if active_pours:
-                active_pours.sort(key=lambda x: x.created, reverse=True)
-                last_pour_volume = active_pours[0].volume
-                last_pour_max_volume = active_pours[0].max_volume
-
-        batch.last_pour_volume = last_pour_volume
-        batch.last_pour_max_volume = last_pour_max_volume
+    def build() -> bytes:
+        batches = batch_service.list_filtered(chip_id=chip_id, active=active)
+
+        # Enrich batches with counts and last pour data
+        for batch in batches:
+            batch.gravity_count = len(batch.gravity) if batch.gravity else 0
+            batch.pressure_count = len(batch.pressure) if batch.pressure else 0
+            batch.pour_count = len(batch.pour) if batch.pour else 0
+
+            last_pour_volume = None
+            last_pour_max_volume = None
+            if batch.pour:
+                active_pours = [p for p in batch.pour if p.active]
+                if active_pours:
+                    active_pours.sort(key=lambda x: x.created, reverse=True)
+                    last_pour_volume = active_pours[0].volume
+                    last_pour_max_volume = active_pours[0].max_volume
+
+            batch.last_pour_volume = last_pour_volume
+            batch.last_pour_max_volume = last_pour_max_volume
+
+        return batch_list_adapter.dump_json(
+            batch_list_adapter.validate_python(batches), by_alias=True
+        )
 
-    return batches
+    return conditional_response(request, BATCH_TABLES, build)
 
 
 @router.get(
@@ -55,41 +77,83 @@ async def list_batches(
     response_model=List[schemas.TapListBatch],
 )
 async def get_tap_list(
+    request: Request,
     batch_service: BatchService = Depends(get_batch_service),
-) -> List[models.Batch]:
+) -> Response:
     """Get list of batches configured for tap list display."""
     logger.info("Endpoint GET /api/batch/taplist")
-    tap_list = []
-    for b in batch_service.search_tap_list():
-        tap = schemas.TapListBatch(
-            name=b.name,
-            brewDate=b.brew_date,
-            style=b.style,
-            abv=b.abv,
-            ebc=b.ebc,
-            ibu=b.ibu,
-            id=b.id,
-            brewfatherId=b.brewfather_id,
+
+    def build() -> bytes:
+        tap_list = []
+        for b in batch_service.search_tap_list():
+            tap = schemas.TapListBatch(
+                name=b.name,
+                brewDate=b.brew_date,
+                style=b.style,
+                abv=b.abv,
+                ebc=b.ebc,
+                ibu=b.ibu,
+                id=b.id,
+                brewfatherId=b.brewfather_id,
+            )
+            tap_list.append(tap)
+        return tap_list_adapter.dump_json(tap_list, by_alias=True)
+
+    return conditional_response(request, ("batch",), build)
+
+
+@router.get(
+    "/compare",
+    response_model=List[schemas.BatchSeries],
+    dependencies=[Depends(api_key_auth)],
+)
+async def compare_batches(
+    batch_ids: List[int] = Query(..., alias="batchId"),
+    metric: str = Query("gravity", pattern="^(" + "|".join(COMPARE_METRICS) + ")$"),
+    hours: int = Query(1, ge=1, le=168),
+) -> List[schemas.BatchSeries]:
+    """Series of a metric for several batches aligned to hours since the first reading.
+
+    The values are averaged over buckets of the given number of hours.
+    """
+    logger.info(
+        "Endpoint GET /api/batch/compare?batchId=%s&metric=%s&hours=%d", batch_ids, metric, hours
+    )
+    batch_ids = list(dict.fromkeys(batch_ids))
+    if len(batch_ids) > COMPARE_MAX_BATCHES:
+        raise HTTPException(
+            status_code=422, detail=f"At most {COMPARE_MAX_BATCHES} batches can be compared"
         )
-        tap_list.append(tap)
-    return tap_list
+    series = aligned_series(batch_ids, metric, hours)
+    return [
+        schemas.BatchSeries(
+            batch_id=batch_id, metric=metric, **series.get(batch_id, {"hours": [], "values": []})
+        )
+        for batch_id in batch_ids
+    ]
 
 
 @router.get(
     "/{batch_id}",
     response_model=schemas.Batch,
+    response_class=ORJSONRowsResponse,
     responses={404: {"description": "Batch not found"}},
     dependencies=[Depends(api_key_auth)],
 )
 async def get_batch_by_id(
     batch_id: int, batch_service: BatchService = Depends(get_batch_service)
-) -> Optional[models.Batch]:
-    """Retrieve a specific batch by ID."""
+) -> ORJSONRowsResponse:
+    """Retrieve a specific batch by ID including all readings."""
     logger.info("Endpoint GET /api/batch/%d", batch_id)
-    batch = batch_service.get(batch_id)
-    if batch is None:
+    rows = batch_service.list_rows(batch_rows.columns, id=batch_id)
+    if len(rows) == 0:
         raise HTTPException(status_code=404, detail="Batch not found")
-    return batch
+
+    batch = batch_rows.encode_one(rows[0])
+    readings = (("gravity", gravity_rows), ("pressure", pressure_rows), ("pour", pour_rows))
+    for key, encoder in readings:
+        batch[key] = encoder.encode(batch_service.list_rows(encoder.columns, batch_id=batch_id))
+    return ORJSONRowsResponse(batch)
 
 
 @router.get(
@@ -99,62 +163,185 @@ async def get_batch_by_id(
     dependencies=[Depends(api_key_auth)],
 )
 async def get_batch_dashboard_by_id(
-    batch_id: int, batch_service: BatchService = Depends(get_batch_service)
-) -> Optional[models.Batch]:
+    batch_id: int, request: Request, batch_service: BatchService = Depends(get_batch_service)
+) -> Response:
     """Get dashboard view for a specific batch."""
     logger.info("Endpoint GET /api/batch/%d/dashboard", batch_id)
 
-    b = batch_service.get(batch_id)
-    if b is None:
-        raise HTTPException(status_code=404, detail="Batch not found")
-    if b.active:
-        dash = schemas.BatchDashboard(
-            id=b.id,
-            name=b.name,
-            chip_id_gravity=b.chip_id_gravity,
-            chip_id_pressure=b.chip_id_pressure,
-            active=b.active,
-        )
+    def build() -> bytes:
+        b = batch_service.get(batch_id)
+        if b is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        if b.active:
+            dash = schemas.BatchDashboard(
+                id=b.id,
+                name=b.name,
+                chip_id_gravity=b.chip_id_gravity,
+                chip_id_pressure=b.chip_id_pressure,
+                active=b.active,
+            )
+
+            dash.analytics = batch_analytics.get(b.id)
+
+            # Add gravity
+            dash.gravity = []
+
+            b.gravity = list(filter(lambda x: x.active, b.gravity))
+            b.gravity.sort(key=lambda x: x.created, reverse=False)
+
+            # Just return the first and last reading
+            if len(b.gravity) > 1:
+                dash.gravity.append(schemas.Gravity.model_validate(b.gravity[0]))
+            if len(b.gravity) > 2:
+                dash.gravity.append(schemas.Gravity.model_validate(b.gravity[len(b.gravity) - 1]))
+
+            # Add pressure
+            dash.pressure = []
+
+            b.pressure = list(filter(lambda x: x.active, b.pressure))
+            b.pressure.sort(key=lambda x: x.created, reverse=False)
+
+            # Just return the first and last reading
+            if len(b.pressure) > 1:
+                dash.pressure.append(schemas.Pressure.model_validate(b.pressure[0]))
+            if len(b.pressure) > 2:
+                dash.pressure.append(
+                    schemas.Pressure.model_validate(b.pressure[len(b.pressure) - 1])
+                )
+
+            # Add pour
+            dash.pour = []
+
+            b.pour = list(filter(lambda x: x.active, b.pour))
+            b.pour.sort(key=lambda x: x.created, reverse=False)
+
+            # Just return the first and last reading
+            if len(b.pour) > 1:
+                dash.pour.append(schemas.Pour.model_validate(b.pour[0]))
+            if len(b.pour) > 2:
+                dash.pour.append(schemas.Pour.model_validate(b.pour[len(b.pour) - 1]))
 
-        # Add gravity
-        dash.gravity = []
+            return dash.model_dump_json(by_alias=True).encode()
 
-        b.gravity = list(filter(lambda x: x.active, b.gravity))
-        b.gravity.sort(key=lambda x: x.created, reverse=False)
+        raise HTTPException(status_code=404, detail="Batch not found or not active batch.")
 
-        # Just return the first and last reading
-        if len(b.gravity) > 1:
-            dash.gravity.append(b.gravity[0])
-        if len(b.gravity) > 2:
-            dash.gravity.append(b.gravity[len(b.gravity) - 1])
+    return conditional_response(request, BATCH_TABLES, build)
 
-        # Add pressure
-        dash.pressure = []
 
-        b.pressure = list(filter(lambda x: x.active, b.pressure))
-        b.pressure.sort(key=lambda x: x.created, reverse=False)
+@router.get(
+    "/{batch_id}/rollup",
+    response_model=List[schemas.Rollup],
+    responses={404: {"description": "Batch not found"}},
+    dependencies=[Depends(api_key_auth)],
+)
+async def get_batch_rollups(
+    batch_id: int,
+    period: str = Query("hour", pattern="^(hour|day)$"),
+    batch_service: BatchService = Depends(get_batch_service),
+) -> List[dict]:
+    """Hourly or daily count, min, max and average of the readings in a batch."""
+    logger.info("Endpoint GET /api/batch/%d/rollup?period=%s", batch_id, period)
+    if batch_service.get(batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch_rollups(batch_id, period)
 
-        # Just return the first and last reading
-        if len(b.pressure) > 1:
-            dash.pressure.append(b.pressure[0])
-        if len(b.pressure) > 2:
-            dash.pressure.append(b.pressure[len(b.pressure) - 1])
 
-        # Add pour
-        dash.pour = []
+@router.get(
+    "/{batch_id}/forecast",
+    response_model=schemas.Forecast,
+    responses={404: {"description": "Batch not found"}},
+    dependencies=[Depends(api_key_auth)],
+)
+async def get_batch_forecast(
+    batch_id: int, batch_service: BatchService = Depends(get_batch_service)
+) -> schemas.Forecast:
+    """Estimate the final gravity and the completion time of the fermentation."""
+    logger.info("Endpoint GET /api/batch/%d/forecast", batch_id)
+    if batch_service.get(batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch_forecasts.get(batch_id)
 
-        b.pour = list(filter(lambda x: x.active, b.pour))
-        b.pour.sort(key=lambda x: x.created, reverse=False)
 
-        # Just return the first and last reading
-        if len(b.pour) > 1:
-            dash.pour.append(b.pour[0])
-        if len(b.pour) > 2:
-            dash.pour.append(b.pour[len(b.pour) - 1])
+@router.get(
+    "/{batch_id}/export",
+    response_class=StreamingResponse,
+    responses={404: {"description": "Batch not found"}},
+    dependencies=[Depends(api_key_auth)],
+)
+async def export_batch_readings(
+    batch_id: int,
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson|parquet)$"),
+    reading_type: str = Query("gravity", alias="type", pattern="^(gravity|pressure|pour)$"),
+    batch_service: BatchService = Depends(get_batch_service),
+) -> StreamingResponse:
+    """Export the readings of a batch as csv, ndjson or parquet, the file is streamed."""
+    logger.info(
+        "Endpoint GET /api/batch/%d/export?format=%s&type=%s",
+        batch_id,
+        export_format,
+        reading_type,
+    )
+    if batch_service.get(batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(
+            status_code=400, detail="Parquet export requires pyarrow to be installed"
+        )
+
+    encoder = {"gravity": gravity_rows, "pressure": pressure_rows, "pour": pour_rows}[reading_type]
+    file_name = f"batch_{batch_id}_{reading_type}.{export_format}"
+    return StreamingResponse(
+        EXPORT_WRITERS[export_format](encoder, batch_id),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
 
-        return dash
 
-    raise HTTPException(status_code=404, detail="Batch not found or not active batch.")
+@router.post(
+    "/{batch_id}/import",
+    response_model=schemas.ImportResult,
+    responses={404: {"description": "Batch not found"}},
+    dependencies=[Depends(api_key_auth)],
+)
+async def import_batch_readings(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    batch_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    import_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    reading_type: str = Query("gravity", alias="type", pattern="^(gravity|pressure|pour)$"),
+    temp_unit: str = Query("C", alias="tempUnit", pattern="^(C|F)$"),
+    gravity_unit: str = Query("SG", alias="gravityUnit", pattern="^(SG|P)$"),
+    pressure_unit: str = Query("kPa", alias="pressureUnit", pattern="^(kPa|PSI|BAR)$"),
+    batch_service: BatchService = Depends(get_batch_service),
+) -> schemas.ImportResult:
+    """Import readings to a batch from an uploaded csv or ndjson file, using the export format."""
+    logger.info(
+        "Endpoint POST /api/batch/%d/import?format=%s&type=%s",
+        batch_id,
+        import_format,
+        reading_type,
+    )
+    if batch_service.get(batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    encoder = {"gravity": gravity_rows, "pressure": pressure_rows, "pour": pour_rows}[reading_type]
+    importer = BatchImporter(encoder, batch_id, ImportUnits(temp_unit, gravity_unit, pressure_unit))
+    result = await import_readings(importer, request.stream(), import_format)
+
+    system_log(
+        "batch",
+        f"Imported {result.rows} {reading_type} readings to batch {batch_id}, "
+        f"{result.rejected} rejected",
+        error_code=0,
+        log_level=LogLevel.INFO if result.rejected == 0 else LogLevel.WARNING,
+    )
+    if result.rows > 0:
+        if reading_type == "gravity":
+            batch_analytics.invalidate(batch_id)
+            batch_forecasts.invalidate(batch_id)
+            gravity_filters.invalidate(batch_id)
+        background_tasks.add_task(notify_clients, "batch", "update", batch_id)
+    return result
 
 
 @router.post(
@@ -209,4 +396,7 @@ async def delete_batch_by_id(
         raise HTTPException(status_code=404, detail="Batch not found")
     system_log("batch", f"Batch {batch.name} deleted", error_code=0, log_level=LogLevel.INFO)
     batch_service.delete(batch_id)
+    batch_analytics.invalidate(batch_id)
+    batch_forecasts.invalidate(batch_id)
+    gravity_filters.invalidate(batch_id)
     background_tasks.add_task(notify_clients, "batch", "delete", batch_id)
@@ -1,14 +1,18 @@
 """Device management API endpoints for registering, configuring, and monitoring brewery devices."""
+import glob
 import json
 import logging
 import os
+from datetime import datetime
+from time import time
 from json import JSONDecodeError
 from typing import Any, List, Optional
 
 import httpx
-from fastapi import Depends, BackgroundTasks
+from fastapi import Depends, BackgroundTasks, Query, Request
 from fastapi.responses import Response
 from fastapi.routing import APIRouter
+from pydantic import TypeAdapter
 from starlette.exceptions import HTTPException
 
 from api.db import models, schemas
@@ -17,29 +21,44 @@ from api.services import (
     get_device_service,
     FermentationStepService,
     get_fermentationstep_service,
+    DeviceLogService,
+    get_devicelog_service,
 )
 
-from ..cache import find_key, read_key
+from ..cache import read_registry
+from ..proxy import device_proxy
 from ..security import api_key_auth
+from ..versions import DEVICE_TABLES, conditional_response
 from ..ws import notify_clients
 from ..log import system_log, LogLevel
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/device")
 
+device_list_adapter = TypeAdapter(List[schemas.Device])
+
 
 @router.get(
     "/", response_model=List[schemas.Device], dependencies=[Depends(api_key_auth)]
 )
 async def list_devices(
+    request: Request,
     software: str = "*",
     devices_service: DeviceService = Depends(get_device_service),
-) -> List[models.Device]:
+) -> Response:
     """List all devices, optionally filtered by software type."""
     logger.info("Endpoint GET /api/device/?software=%s", software)
-    if software != "*":
-        return devices_service.search_software(software=software)
-    return devices_service.list()
+
+    def build() -> bytes:
+        if software != "*":
+            devices = devices_service.search_software(software=software)
+        else:
+            devices = devices_service.list()
+        return device_list_adapter.dump_json(
+            device_list_adapter.validate_python(devices), by_alias=True
+        )
+
+    return conditional_response(request, DEVICE_TABLES, build)
 
 
 @router.get(
@@ -74,17 +93,64 @@ async def get_device_logs() -> List[str]:
     "/logs/{chip_id}",
     dependencies=[Depends(api_key_auth)],
 )
-async def delete_device_log_for_chip_id(chip_id: str) -> None:
-    """Delete device log file for a specific chip ID."""
+async def delete_device_log_for_chip_id(
+    chip_id: str,
+    devicelog_service: DeviceLogService = Depends(get_devicelog_service),
+) -> None:
+    """Delete device log file, all rotated generations and stored lines for a specific chip ID."""
     logger.info("Endpoint DEL /api/device/logs/%s", chip_id)
-    try:
-        os.remove("log/" + chip_id + ".log")
-    except FileNotFoundError:
-        pass
-    try:
-        os.remove("log/" + chip_id + ".log.1")
-    except FileNotFoundError:
-        pass
+    files = ["log/" + chip_id + ".log"] + glob.glob(glob.escape("log/" + chip_id + ".log.") + "*")
+    for f in files:
+        try:
+            os.remove(f)
+        except FileNotFoundError:
+            pass
+    devicelog_service.delete_by_chip_id(chip_id)
+
+
+@router.post(
+    "/logs/",
+    status_code=201,
+    dependencies=[Depends(api_key_auth)],
+)
+async def create_device_logs(
+    lines: List[schemas.DeviceLogCreate],
+    devicelog_service: DeviceLogService = Depends(get_devicelog_service),
+) -> dict:
+    """Store a batch of log lines posted by the log collector."""
+    logger.info("Endpoint POST /api/device/logs/ (%d lines)", len(lines))
+    return {"count": devicelog_service.insert_list(lines)}
+
+
+@router.get(
+    "/{chip_id}/logs",
+    response_model=schemas.DeviceLogPage,
+    dependencies=[Depends(api_key_auth)],
+)
+async def search_device_logs(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    chip_id: str,
+    q: Optional[str] = Query(None, description="Text to search for in the log lines"),
+    from_time: Optional[datetime] = Query(
+        None, alias="from", description="Only lines received after this time"
+    ),
+    to_time: Optional[datetime] = Query(
+        None, alias="to", description="Only lines received before this time"
+    ),
+    level: Optional[int] = Query(None, ge=0, le=3, description="Minimum log level"),
+    cursor: Optional[int] = Query(None, description="Next cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=1000, description="Number of records to return"),
+    devicelog_service: DeviceLogService = Depends(get_devicelog_service),
+) -> schemas.DeviceLogPage:
+    """Search stored log lines for a device, newest first."""
+    logger.info(
+        "Endpoint GET /api/device/%s/logs?q=%s&from=%s&to=%s", chip_id, q, from_time, to_time
+    )
+    records = devicelog_service.search(chip_id, q, from_time, to_time, level, cursor, limit)
+    return schemas.DeviceLogPage(
+        limit=limit,
+        next_cursor=records[-1].id if len(records) == limit else None,
+        data=records,
+    )
 
 
 @router.post(
@@ -163,8 +229,6 @@ async def fetch_data_from_device(proxy_req: schemas.ProxyRequest) -> Any:
     logger.info("Endpoint POST /api/device/proxy_fetch: %s %s", proxy_req.method, proxy_req.url)
 
     try:
-        timeout = httpx.Timeout(10.0, connect=10.0, read=10.0)
-
         headers = {}
 
         if proxy_req.header != "":
@@ -172,38 +236,23 @@ async def fetch_data_from_device(proxy_req: schemas.ProxyRequest) -> Any:
             headers = {s[0]: s[1].strip(" ")}
             logger.info("Header provided %s", headers)
 
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            if proxy_req.method.lower() == "post":
-                logger.info("Request using post %s", proxy_req.url)
-                res = await client.post(
-                    proxy_req.url, data=proxy_req.body, headers=headers
-                )
-            elif proxy_req.method.lower() == "put":
-                logger.info("Request using put %s", proxy_req.url)
-                res = await client.put(
-                    proxy_req.url, data=proxy_req.body, headers=headers
-                )
-            elif proxy_req.method.lower() == "delete":
-                logger.info("Request using delete %s", proxy_req.url)
-                res = await client.delete(proxy_req.url, headers=headers)
-            else:
-                logger.info("Request using get %s", proxy_req.url)
-                res = await client.get(proxy_req.url, headers=headers)
-
-            logger.info("Response received %s", res)
-
-            if res.status_code != 200:
-                raise HTTPException(
-                    status_code=res.status_code, detail="Response from endpoint."
-                )
-
-            # if the data is not pure Json, return it as text
-            try:
-                response_data = res.json()
-            except ValueError:
-                response_data = res.text
-            logger.info("Payload from external service: %s", response_data)
-            return response_data
+        res = await device_proxy.request(
+            proxy_req.method, proxy_req.url, proxy_req.body, headers
+        )
+        logger.info("Response received %s", res)
+
+        if res.status_code != 200:
+            raise HTTPException(
+                status_code=res.status_code, detail="Response from endpoint."
+            )
+
+        # if the data is not pure Json, return it as text
+        try:
+            response_data = res.json()
+        except ValueError:
+            response_data = res.text
+        logger.info("Payload from external service: %s", response_data)
+        return response_data
     except JSONDecodeError as exc:
         logger.error("Unable to parse JSON response")
         raise HTTPException(
@@ -240,13 +289,9 @@ async def scan_for_mdns_devices() -> list[schemas.Mdns]:
     """
     logger.info("Endpoint GET /api/device/mdns/")
 
-    mdns = []
-
-    keys = find_key("*.local.")
-    for k in keys:
-        value = read_key(k).decode()
-        logger.info("Found {key} = {value}")
-        mdns.append(json.loads(value))
+    # Services that have not been reported for 15 minutes are removed
+    entries = read_registry("mdns", max_age=900, now=time())
+    mdns = [json.loads(value) for value in entries.values()]
 
     return Response(content=json.dumps(mdns), media_type="application/json")
 
@@ -1,6 +1,5 @@
 """Pour event API endpoints for recording and managing beer pour operations."""
 import logging
-from json.decoder import JSONDecodeError
 from datetime import datetime
 from typing import List, Optional, Union
 from fastapi import Depends, Request, BackgroundTasks, Query
@@ -8,28 +7,32 @@ from fastapi.responses import Response
 from fastapi.routing import APIRouter
 from starlette.exceptions import HTTPException
 from api.db import models, schemas
-from api.services import PourService, get_pour_service, BatchService, get_batch_service
+from api.services import PourService, get_pour_service
 from ..security import api_key_auth
+from ..responses import ORJSONRowsResponse, pour_rows
 from ..ws import notify_clients
-from ..utils import log_public_request, get_client_ip
-from ..log import system_log, LogLevel
+from ..rollup import refresh_batch_rollups
+from ..ingest import IngestPipeline, get_ingest_pipeline
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/pour")
 
 
 @router.get(
-    "/", response_model=List[schemas.Pour], dependencies=[Depends(api_key_auth)]
+    "/",
+    response_model=List[schemas.Pour],
+    response_class=ORJSONRowsResponse,
+    dependencies=[Depends(api_key_auth)],
 )
 async def list_pours(
     batch_id: Optional[int] = Query(None, alias="batchId"),
     pour_service: PourService = Depends(get_pour_service),
-) -> List[models.Pour]:
+) -> ORJSONRowsResponse:
     """List pour events, optionally filtered by batch ID."""
     logger.info("Endpoint GET /api/pour/?batch_id=%s", batch_id)
-    if batch_id is not None:
-        return pour_service.search_by_batch_id(batch_id)
-    return pour_service.list()
+    filters = {} if batch_id is None else {"batch_id": batch_id}
+    rows = pour_service.list_rows(pour_rows.columns, **filters)
+    return ORJSONRowsResponse(pour_rows.encode(rows))
 
 
 @router.get(
@@ -111,6 +114,7 @@ async def update_pour_by_id(
     if pour is None:
         raise HTTPException(status_code=404, detail="Pour not found")
     background_tasks.add_task(notify_clients, "batch", "update", pour.batch_id)
+    background_tasks.add_task(refresh_batch_rollups, pour.batch_id)
     return pour
 
 
@@ -126,6 +130,7 @@ async def delete_pour_by_id(
     if not pour:
         raise HTTPException(status_code=404, detail="Pour not found")
     background_tasks.add_task(notify_clients, "batch", "update", pour.batch_id)
+    background_tasks.add_task(refresh_batch_rollups, pour.batch_id)
     pour_service.delete(pour_id)
 
 
@@ -133,78 +138,9 @@ async def delete_pour_by_id(
 async def create_pour_using_kegmon_format(
     request: Request,
     background_tasks: BackgroundTasks,
-    pour_service: PourService = Depends(get_pour_service),
-    batch_service: BatchService = Depends(get_batch_service),
+    pipeline: IngestPipeline = Depends(get_ingest_pipeline),
 ) -> Response:
     """Create a pour event from Kegmon format data."""
     logger.info("Endpoint POST /api/pour/public")
-
-    try:
-        req_json = await request.json()
-
-        # Get client IP address and log the request
-        client_host = get_client_ip(request)
-        background_tasks.add_task(log_public_request, client_host, req_json)
-
-        logger.info("Payload: %s", req_json)
-
-        pour_val = 0
-        volume_val = 0
-        max_volume_val = 0
-
-        if "pour" in req_json and req_json["pour"] is not None:
-            pour_val = req_json["pour"]
-
-        if "volume" in req_json and req_json["volume"] is not None:
-            volume_val = req_json["volume"]
-
-        if "maxVolume" in req_json and req_json["maxVolume"] is not None:
-            max_volume_val = req_json["maxVolume"]
-
-        # Check if there is an active batch
-        try:
-            batch_id = int(req_json["id"])
-        except (KeyError, ValueError) as e:
-            logger.error("Invalid batch ID: %s", e)
-            system_log("pour", f"Invalid batch ID in request: {req_json.get('id')}", error_code=400, log_level=LogLevel.WARNING)
-            raise HTTPException(status_code=400, detail="Invalid batch ID") from e
-        
-        logger.info("Looking up batch with ID: %s", batch_id)
-        batch = batch_service.get(batch_id)
-        
-        if batch is None:
-            logger.warning("No batch found for batch ID %s", batch_id)
-            system_log("pour", f"No batch found for batch ID {batch_id}", error_code=404, log_level=LogLevel.WARNING)
-            raise HTTPException(status_code=409, detail="No batch found")
-
-        pour_list = pour_service.search_by_batch_id(batch.id)
-        pour_list.sort(key=lambda x: x.created, reverse=True)
-
-        for p in pour_list:
-            logging.info("%s %s", p.created, p.volume)
-
-        # If we get a volume update and no pour, check if the value has changed
-        if len(pour_list) > 0 and pour_val == 0:
-            if pour_list[0].volume == volume_val:
-                logging.info(
-                    "Volume recevied in pour update has not changed, ignoring data."
-                )
-                return None
-
-        pour = schemas.PourCreate(
-            pour=pour_val,
-            volume=volume_val,
-            maxVolume=max_volume_val,
-            batch_id=batch.id,
-            created=datetime.now(),
-            active=True,
-        )
-
-        pour = pour_service.create(pour)
-        background_tasks.add_task(notify_clients, "batch", "update", pour.batch_id)
-        return Response(content="", status_code=200)
-
-    except (KeyError, JSONDecodeError) as e:
-        logging.error(e)
-        system_log("pour", f"Failed to parse pour data: {type(e).__name__}", error_code=0, log_level=LogLevel.ERROR)
-        raise HTTPException(status_code=422, detail="Unable to parse request") from e
+    await pipeline.handle(request, background_tasks, "pour")
+    return Response(content="", status_code=200)
@@ -1,21 +1,28 @@
 """System management API endpoints for health checks, scheduling, and real-time notifications."""
 import logging
 import json
-from json import JSONDecodeError
 from datetime import datetime, timezone
-from typing import List
+from time import time
+from typing import List, Optional, Union
 import redis
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import Depends, WebSocket, WebSocketDisconnect, Query
 from fastapi.routing import APIRouter
 from api.db import models, schemas
 from api.db.session import create_session
-from api.services import BrewLoggerService, SystemLogService, get_systemlog_service
-from ..cache import write_key, read_key, find_key
+from api.services import (
+    BrewLoggerService,
+    ReceiveLogService,
+    SystemLogService,
+    get_receivelog_service,
+    get_systemlog_service,
+)
+from ..cache import write_key, write_registry, remove_registry, read_key, read_hash, find_key
 from ..scheduler import scheduler
 from ..ws import ws_manager
 from ..security import api_key_auth
 from ..config import get_settings
+from ..ingest import ingest_stats
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/system")
@@ -62,11 +69,13 @@ async def self_test() -> schemas.SelfTestResult:
         value = read_key(key)
         log.append({"name": key, "value": value.decode() if value else None})
 
+    # The BLE scanner keeps one hash per device, ble_<id> with fields last/type/gravity/temp...
     keys = find_key("ble_*")
     ble = []
     for key in keys:
-        value = read_key(key)
-        ble.append({"name": key, "value": value.decode() if value else None})
+        name = key.decode() if isinstance(key, bytes) else key
+        for field, value in read_hash(key).items():
+            ble.append({"name": f"{name}_{field.decode()}", "value": value.decode()})
 
     return schemas.SelfTestResult(
         databaseConnection=database_connection,
@@ -100,30 +109,45 @@ async def scheduler_status() -> List[schemas.Job]:
     return background_jobs
 
 
+@router.get(
+    "/ingest/",
+    response_model=List[schemas.IngestStage],
+    dependencies=[Depends(api_key_auth)],
+)
+async def ingest_status() -> List[schemas.IngestStage]:
+    """Get the time spent per stage when storing readings from the public endpoints.
+    
+    Returns:
+        Number of readings and time per device format and ingest stage
+    """
+    logger.info("Endpoint GET /api/system/ingest/")
+    return ingest_stats.snapshot()
+
+
 @router.get(
     "/log/",
     response_model=schemas.SystemLogPaginatedResponse,
     dependencies=[Depends(api_key_auth)],
 )
-async def system_log(
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+async def system_log(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    skip: int = Query(0, ge=0, description="Number of records to skip, ignored with a cursor"),
     limit: int = Query(50, ge=1, le=500, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description="Next cursor from the previous page"),
+    module: Optional[str] = Query(None, description="Only entries from this module"),
+    level: Optional[int] = Query(None, ge=0, description="Minimum log level"),
+    systemlog_service: SystemLogService = Depends(get_systemlog_service),
 ) -> schemas.SystemLogPaginatedResponse:
-    """Retrieve system logs with pagination support."""
-    logger.info("Endpoint GET /api/system/log/ (skip=%d, limit=%d)", skip, limit)
-    
+    """Retrieve system logs newest first, page with skip or with the returned cursor."""
+    logger.info("Endpoint GET /api/system/log/ (skip=%d, limit=%d, cursor=%s)", skip, limit, cursor)
+
     try:
-        session = create_session()
-        total = session.query(models.SystemLog).count()
-        records = session.query(models.SystemLog).order_by(
-            models.SystemLog.timestamp.desc()
-        ).offset(skip).limit(limit).all()
-        
+        records, next_cursor, total = systemlog_service.page(module, level, cursor, limit, skip)
         return schemas.SystemLogPaginatedResponse(
             total=total,
             skip=skip,
             limit=limit,
-            data=records
+            data=records,
+            next_cursor=next_cursor,
         )
     except SQLAlchemyError as e:
         logger.error("Database error retrieving system logs: %s", e)
@@ -191,48 +215,57 @@ async def websocket_endpoint(websocket: WebSocket) -> None:
 
 
 @router.post("/mdns", status_code=201, dependencies=[Depends(api_key_auth)])
-async def add_mdns_to_cache(mdns: schemas.Mdns) -> None:
-    """Cache mDNS service information."""
+async def add_mdns_to_cache(mdns: Union[schemas.Mdns, List[schemas.Mdns]]) -> None:
+    """Cache mDNS service information, one entry or a list, in the mdns registry."""
     logger.info("Endpoint POST /api/system/mdns")
 
-    try:
-        logger.info("Caching mdns for %s", mdns.name)
-        key = mdns.host + mdns.type
-        write_key(
-            key,
-            json.dumps({"type": mdns.type, "host": mdns.host, "name": mdns.name}),
-            ttl=900,
-        )
-    except JSONDecodeError:
-        logger.error("Unable to parse JSON response %s", mdns)
+    if isinstance(mdns, schemas.Mdns):
+        mdns = [mdns]
 
+    logger.info("Caching mdns for %s", ", ".join(m.name for m in mdns))
+    write_registry(
+        "mdns",
+        {
+            m.host + m.type: json.dumps({"type": m.type, "host": m.host, "name": m.name})
+            for m in mdns
+        },
+        time(),
+    )
     return None
 
 
+@router.post("/mdns/remove", status_code=204, dependencies=[Depends(api_key_auth)])
+async def remove_mdns_from_cache(mdns: List[schemas.Mdns]) -> None:
+    """Remove mDNS services that are no longer announced."""
+    logger.info("Endpoint POST /api/system/mdns/remove")
+    remove_registry("mdns", [m.host + m.type for m in mdns])
+
+
 @router.get(
     "/receive/",
     response_model=schemas.ReceiveLogPaginatedResponse,
     dependencies=[Depends(api_key_auth)],
 )
 async def get_receive_logs(
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    skip: int = Query(0, ge=0, description="Number of records to skip, ignored with a cursor"),
     limit: int = Query(50, ge=1, le=500, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description="Next cursor from the previous page"),
+    ip: Optional[str] = Query(None, description="Only entries from this ip address"),
+    receivelog_service: ReceiveLogService = Depends(get_receivelog_service),
 ) -> schemas.ReceiveLogPaginatedResponse:
-    """Retrieve receive logs with pagination support."""
-    logger.info("Endpoint GET /api/system/receive_logs/ (skip=%d, limit=%d)", skip, limit)
+    """Retrieve receive logs newest first, page with skip or with the returned cursor."""
+    logger.info(
+        "Endpoint GET /api/system/receive/ (skip=%d, limit=%d, cursor=%s)", skip, limit, cursor
+    )
 
     try:
-        session = create_session()
-        total = session.query(models.ReceiveLog).count()
-        records = session.query(models.ReceiveLog).order_by(
-            models.ReceiveLog.timestamp.desc()
-        ).offset(skip).limit(limit).all()
-
+        records, next_cursor, total = receivelog_service.page(ip, cursor, limit, skip)
         return schemas.ReceiveLogPaginatedResponse(
             total=total,
             skip=skip,
             limit=limit,
-            data=records
+            data=records,
+            next_cursor=next_cursor,
         )
     except SQLAlchemyError as e:
         logger.error("Database error retrieving receive logs: %s", e)
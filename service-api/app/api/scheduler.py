@@ -4,9 +4,11 @@ import logging
 from datetime import datetime
 
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 import httpx
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
+from api.db.partition import maintain_partitions
 from api.db.session import create_session
 from api.services import BrewLoggerService, DeviceService
 
@@ -14,7 +16,11 @@ from .config import get_settings
 from .cache import write_key, find_key, read_key, delete_key
 from .chamberctrl import chamberctrl_temps
 from .fermentationcontrol import fermentation_controller_run
-from .log import system_log_scheduler, system_log_purge, receive_log_purge, LogLevel
+from .forecast import batch_forecasts
+from .rollup import update_rollups
+from .log import (
+    system_log_scheduler, system_log_purge, receive_log_purge, device_log_purge, LogLevel
+)
 
 logger = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler()
@@ -124,11 +130,21 @@ async def task_fermentation_control():
     await fermentation_controller_run(datetime.now())
 
 
+async def task_update_rollups():
+    """Add new readings to the hourly and daily rollups."""
+    logger.info("Task: task_update_rollups is running at %s", datetime.now())
+    if await run_in_threadpool(update_rollups):
+        # The forecasts are fitted to the rollups
+        batch_forecasts.invalidate()
+
+
 async def task_check_database():
     """Check database health and purge old records."""
     logger.info("Task: task_check_database is running at %s", datetime.now())
-    system_log_purge(days=90)
-    receive_log_purge(days=90)
+    maintain_partitions()
+    system_log_purge()
+    receive_log_purge()
+    device_log_purge()
     system_log_scheduler(
         "Database maintenance task completed: purged old logs",
         error_code=0, log_level=LogLevel.INFO
@@ -151,6 +167,9 @@ def scheduler_setup(application: FastAPI):  # pylint: disable=unused-argument
         # Setting up task to scan for mdns data
         scheduler.add_job(task_check_database, "interval", hours=6, max_instances=1)
 
+        # Setting up task to keep the reading rollups up to date
+        scheduler.add_job(task_update_rollups, "interval", minutes=5, max_instances=1)
+
         # Setting up task to run fermentation control
         scheduler.add_job(
             task_fermentation_control, "interval", minutes=5, max_instances=1
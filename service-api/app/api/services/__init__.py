@@ -12,6 +12,8 @@ from .brewlogger import BrewLoggerService
 from .pour import PourService
 from .fermentationstep import FermentationStepService
 from .systemlog import SystemLogService
+from .devicelog import DeviceLogService
+from .receivelog import ReceiveLogService
 
 
 def get_device_service(db_session: Session = Depends(get_session)) -> DeviceService:
@@ -60,6 +62,20 @@ def get_systemlog_service(
     return SystemLogService(db_session)
 
 
+def get_devicelog_service(
+    db_session: Session = Depends(get_session),
+) -> DeviceLogService:
+    """Provide DeviceLogService dependency for endpoints."""
+    return DeviceLogService(db_session)
+
+
+def get_receivelog_service(
+    db_session: Session = Depends(get_session),
+) -> ReceiveLogService:
+    """Provide ReceiveLogService dependency for endpoints."""
+    return ReceiveLogService(db_session)
+
+
 __all__ = (
     "get_device_service",
     "get_batch_service",
@@ -69,4 +85,6 @@ __all__ = (
     "get_brewlogger_service",
     "get_fermentationstep_service",
     "get_systemlog_service",
+    "get_devicelog_service",
+    "get_receivelog_service",
 )
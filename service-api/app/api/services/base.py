@@ -1,15 +1,18 @@
 """Base service class providing generic CRUD operations for database models."""
 import logging
-from typing import Any, Generic, List, Optional, Type, TypeVar
+from datetime import datetime
+from time import monotonic
+from typing import Any, Generic, Hashable, List, Optional, Sequence, Tuple, Type, TypeVar
 
 import sqlalchemy
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import Row, func, select, tuple_
 from sqlalchemy.orm import Session
 from starlette.exceptions import HTTPException
 
 from api.db import models
 from api.db.models import Base
+from api.versions import mark_changed
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +20,11 @@ ModelType = TypeVar("ModelType", bound=Base)  # pylint: disable=invalid-name
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)  # pylint: disable=invalid-name
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)  # pylint: disable=invalid-name
 
+# Cached row counts, (table, filter key): (lowest id, highest id, count, time of full count)
+_count_cache: dict = {}
+COUNT_CACHE_TTL = 300
+COUNT_CACHE_SIZE = 256
+
 
 class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     """Generic base service class providing CRUD operations for database models."""
@@ -34,12 +42,19 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         objs: List[ModelType] = self.db_session.scalars(select(self.model)).all()
         return objs
 
-    def create(self, obj: CreateSchemaType) -> ModelType:
-        """Create a new item in the database."""
+    def create(self, obj: CreateSchemaType, commit: bool = True) -> ModelType:
+        """Create a new item in the database.
+
+        With commit=False the item is only flushed to the open transaction.
+        """
         db_obj: ModelType = self.model(**obj.model_dump())
         self.db_session.add(db_obj)
+        mark_changed(self.db_session, self.model.__tablename__)
         try:
-            self.db_session.commit()
+            if commit:
+                self.db_session.commit()
+            else:
+                self.db_session.flush()
         except sqlalchemy.exc.IntegrityError as e:
             self.db_session.rollback()
             if "duplicate key" in str(e):
@@ -55,6 +70,7 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             db_obj: ModelType = self.model(**obj.model_dump())
             self.db_session.add(db_obj)
             db_obj_lst.append(db_obj)
+        mark_changed(self.db_session, self.model.__tablename__)
         try:
             self.db_session.commit()
         except sqlalchemy.exc.IntegrityError as e:
@@ -72,6 +88,7 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             return None
         for column, value in obj.model_dump(exclude_unset=True).items():
             setattr(db_obj, column, value)
+        mark_changed(self.db_session, self.model.__tablename__)
         self.db_session.commit()
         return db_obj
 
@@ -82,6 +99,7 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             return False
 
         self.db_session.delete(db_obj)
+        mark_changed(self.db_session, self.model.__tablename__)
         self.db_session.commit()
         return True
 
@@ -96,6 +114,99 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             )
         return batch
 
+    def list_rows(self, columns: Sequence[Any], **filters) -> List[Row]:
+        """Retrieve the selected columns as row tuples, optionally filtered by column values."""
+        rows = self.db_session.execute(select(*columns).filter_by(**filters)).all()
+        logger.info(
+            "Fetched %s rows based on %s, records found %d",
+            self.model.__tablename__,
+            filters,
+            len(rows),
+        )
+        return rows
+
+    def count_cached(self, key: Hashable, *where: Any) -> int:
+        """Count rows matching the where clauses without scanning the whole table on every call.
+
+        The count is cached together with the lowest and highest id. As long as the lowest id
+        is the same (the purge removes the oldest rows) only rows added after the cached
+        highest id are counted, which is a range scan on the primary key. Rows deleted from the
+        middle of the table are not seen until the next full count, made every COUNT_CACHE_TTL
+        seconds.
+
+        Args:
+            key: Identifies the filter values, part of the cache key
+            where: Filter clauses
+
+        Returns:
+            Number of rows
+        """
+        model = self.model
+        low, high = self.db_session.execute(select(func.min(model.id), func.max(model.id))).one()
+        cache_key = (model.__tablename__, key)
+        cached = _count_cache.get(cache_key)
+
+        now = monotonic()
+
+        if high is None:
+            count, counted = 0, now
+        elif (
+            cached is not None
+            and cached[0] == low
+            and cached[1] <= high
+            and now - cached[3] < COUNT_CACHE_TTL
+        ):
+            added = self.db_session.scalar(
+                select(func.count())  # pylint: disable=not-callable
+                .select_from(model)
+                .where(model.id > cached[1], *where)
+            )
+            count, counted = cached[2] + added, cached[3]
+        else:
+            count = self.db_session.scalar(
+                select(func.count()).select_from(model).where(*where)  # pylint: disable=not-callable
+            )
+            counted = now
+
+        if len(_count_cache) >= COUNT_CACHE_SIZE and cache_key not in _count_cache:
+            _count_cache.clear()
+        _count_cache[cache_key] = (low, high, count, counted)
+        return count
+
+    def page_by_timestamp(
+        self, where: Sequence[Any], cursor: Optional[str], limit: int, skip: int = 0
+    ) -> Tuple[List[ModelType], Optional[str]]:
+        """Return one page of rows, newest first, using keyset pagination on (timestamp, id).
+
+        Args:
+            where: Filter clauses
+            cursor: Cursor from the previous page, None for the first page
+            limit: Max number of rows
+            skip: Offset, only used without a cursor
+
+        Returns:
+            The rows and the cursor for the next page, None if this is the last page
+        """
+        model = self.model
+        query = select(model).where(*where)
+        if cursor is not None:
+            try:
+                timestamp, _, last_id = cursor.rpartition("_")
+                position = tuple_(datetime.fromisoformat(timestamp), int(last_id))
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=f"Invalid cursor '{cursor}'") from e
+            query = query.where(tuple_(model.timestamp, model.id) < position)
+        elif skip > 0:
+            query = query.offset(skip)
+        query = query.order_by(model.timestamp.desc(), model.id.desc()).limit(limit + 1)
+
+        objs = list(self.db_session.scalars(query).all())
+        next_cursor = None
+        if len(objs) > limit:
+            objs = objs[:limit]
+            next_cursor = f"{objs[-1].timestamp.isoformat()}_{objs[-1].id}"
+        return objs, next_cursor
+
     def _search_by_filter(self, filters: dict) -> List[ModelType]:
         """Generic search by filter dictionary."""
         objs: List[self.model] = self.db_session.scalars(
@@ -0,0 +1,71 @@
+"""Device log service for storing and searching log lines collected from devices."""
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from api.db import schemas, models
+from .base import BaseService
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceLogService(
+    BaseService[models.DeviceLog, schemas.DeviceLogCreate, schemas.DeviceLogUpdate]
+):
+    """Service for ingesting and searching device log lines."""
+    def __init__(self, db_session: Session):
+        super().__init__(models.DeviceLog, db_session)
+
+    def insert_list(self, lst: List[schemas.DeviceLogCreate]) -> int:
+        """Insert log lines with one executemany, returns the number of lines."""
+        if len(lst) == 0:
+            return 0
+        self.db_session.execute(insert(models.DeviceLog), [obj.model_dump() for obj in lst])
+        self.db_session.commit()
+        return len(lst)
+
+    def search(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        chip_id: str,
+        q: Optional[str] = None,
+        from_time: Optional[datetime] = None,
+        to_time: Optional[datetime] = None,
+        level: Optional[int] = None,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+    ) -> List[models.DeviceLog]:
+        """Search log lines for a device, newest first.
+
+        The cursor is the id of the last line on the previous page.
+        """
+        query = select(models.DeviceLog).where(models.DeviceLog.chip_id == chip_id)
+
+        if cursor is not None:
+            query = query.where(models.DeviceLog.id < cursor)
+        if from_time is not None:
+            query = query.where(models.DeviceLog.timestamp >= from_time)
+        if to_time is not None:
+            query = query.where(models.DeviceLog.timestamp <= to_time)
+        if level is not None:
+            query = query.where(models.DeviceLog.level >= level)
+        if q:
+            query = query.where(models.DeviceLog.message.ilike(f"%{q}%"))
+
+        query = query.order_by(models.DeviceLog.id.desc()).limit(limit)
+        return self.db_session.scalars(query).all()
+
+    def delete_by_timestamp(self, days: int = 30):
+        """Delete device log lines older than the specified number of days."""
+        dt = datetime.now() - timedelta(days=days)
+        statement = delete(models.DeviceLog).where(models.DeviceLog.timestamp <= dt)
+        result = self.db_session.execute(statement)
+        self.db_session.commit()
+        return result.rowcount
+
+    def delete_by_chip_id(self, chip_id: str):
+        """Delete all stored log lines for a device."""
+        statement = delete(models.DeviceLog).where(models.DeviceLog.chip_id == chip_id)
+        result = self.db_session.execute(statement)
+        self.db_session.commit()
+        return result.rowcount
@@ -20,9 +20,9 @@ class GravityService(
     def __init__(self, db_session: Session):
         super().__init__(models.Gravity, db_session)
 
-    def create(self, obj: schemas.GravityCreate) -> models.Gravity:
+    def create(self, obj: schemas.GravityCreate, commit: bool = True) -> models.Gravity:
         self._validate_batch_exists(obj.batch_id)
-        return super().create(obj)
+        return super().create(obj, commit)
 
     def create_list(self, lst: List[schemas.GravityCreate]) -> List[models.Gravity]:
         logger.info("Adding %d gravity records for batch", len(lst))
@@ -52,6 +52,7 @@ class GravityService(
             models.Gravity.battery,
             models.Gravity.rssi,
             models.Gravity.corr_gravity,
+            models.Gravity.filtered_gravity,
             models.Gravity.run_time,
             models.Gravity.created,
             models.Gravity.active,
@@ -75,6 +76,7 @@ class GravityService(
                 'battery': row.battery,
                 'rssi': row.rssi,
                 'corrGravity': row.corr_gravity,
+                'filteredGravity': row.filtered_gravity,
                 'runTime': row.run_time,
                 'created': row.created,
                 'active': row.active,
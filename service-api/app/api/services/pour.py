@@ -18,9 +18,9 @@ class PourService(BaseService[models.Pour, schemas.PourCreate, schemas.PourUpdat
     def __init__(self, db_session: Session):
         super().__init__(models.Pour, db_session)
 
-    def create(self, obj: schemas.PourCreate) -> models.Pour:
+    def create(self, obj: schemas.PourCreate, commit: bool = True) -> models.Pour:
         self._validate_batch_exists(obj.batch_id)
-        return super().create(obj)
+        return super().create(obj, commit)
 
     def create_list(self, lst: List[schemas.PourCreate]) -> List[models.Pour]:
         logger.info("Adding %d pour records for batch", len(lst))
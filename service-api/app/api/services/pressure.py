@@ -20,9 +20,9 @@ class PressureService(
     def __init__(self, db_session: Session):
         super().__init__(models.Pressure, db_session)
 
-    def create(self, obj: schemas.PressureCreate) -> models.Pressure:
+    def create(self, obj: schemas.PressureCreate, commit: bool = True) -> models.Pressure:
         self._validate_batch_exists(obj.batch_id)
-        return super().create(obj)
+        return super().create(obj, commit)
 
     def create_list(self, lst: List[schemas.PressureCreate]) -> List[models.Pressure]:
         logger.info("Adding %d pressure records for batch", len(lst))
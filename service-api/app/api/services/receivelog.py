@@ -0,0 +1,35 @@
+"""Receive log service for browsing the stored payloads posted by devices."""
+import logging
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+from api.db import schemas, models
+from .base import BaseService
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiveLogService(
+    BaseService[models.ReceiveLog, schemas.ReceiveLogCreate, schemas.ReceiveLogCreate]
+):
+    """Service for paging receive log entries."""
+    def __init__(self, db_session: Session):
+        super().__init__(models.ReceiveLog, db_session)
+
+    def page(
+        self,
+        ip_address: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        skip: int = 0,
+    ) -> Tuple[List[models.ReceiveLog], Optional[str], int]:
+        """Return one page of entries newest first.
+
+        Returns:
+            The entries, the cursor for the next page and the total count
+        """
+        where = []
+        if ip_address is not None:
+            where.append(models.ReceiveLog.ip_address == ip_address)
+
+        objs, next_cursor = self.page_by_timestamp(where, cursor, limit, skip)
+        return objs, next_cursor, self.count_cached(ip_address, *where)
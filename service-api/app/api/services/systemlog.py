@@ -1,7 +1,7 @@
 """System log service for managing application event logging and retention."""
 import logging
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional, Tuple
 from sqlalchemy import delete
 from sqlalchemy.orm import Session
 from api.db import schemas, models
@@ -26,6 +26,28 @@ class SystemLogService(
         )
         return objs
 
+    def page(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        module: Optional[str] = None,
+        level: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        skip: int = 0,
+    ) -> Tuple[List[models.SystemLog], Optional[str], int]:
+        """Return one page of entries newest first.
+
+        Returns:
+            The entries, the cursor for the next page and the total count
+        """
+        where = []
+        if module is not None:
+            where.append(models.SystemLog.module == module)
+        if level is not None:
+            where.append(models.SystemLog.log_level >= level)
+
+        objs, next_cursor = self.page_by_timestamp(where, cursor, limit, skip)
+        return objs, next_cursor, self.count_cached((module, level), *where)
+
     def delete_by_timestamp(self, days: int = 30):
         """Delete system log entries older than the specified number of days."""
         dt = datetime.now() - timedelta(days=days)
@@ -0,0 +1,116 @@
+"""Table versions and conditional GET with ETags.
+
+The services mark the tables they create, update or delete rows in, together with the tables
+of all rows written by a flush (so cascades are included). The version of those tables is
+bumped when the session commits, writes that bypass the ORM (bulk inserts) bump it themselves.
+The ETag of a cached endpoint is derived from the versions of all tables its response is
+built from, so a request with a matching If-None-Match is answered with 304 without a
+database query. Serialized bodies are kept in Redis keyed by the ETag.
+
+The versions are kept in memory (the api runs as one worker), the ETag includes a random
+epoch so that tags from before a restart never match.
+"""
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Optional
+from uuid import uuid4
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session, SessionTransaction
+
+from .cache import read_key, write_bytes
+
+logger = logging.getLogger(__name__)
+
+ETAG_CACHE_TTL = 3600
+CHANGED_TABLES = "changed_tables"  # Key in Session.info with the tables changed in the transaction
+
+# Tables read by the cached endpoints, including child rows that are part of the response
+BATCH_TABLES = ("batch", "gravity", "pressure", "pour")
+DEVICE_TABLES = ("device", "fermentationstep")
+
+
+class TableVersions:
+    """Version counter per table."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.epoch = uuid4().hex[:8]
+        self.versions: Dict[str, int] = {}
+
+    def bump(self, *tables: str) -> None:
+        """Increase the version of the tables."""
+        with self.lock:
+            for table in tables:
+                self.versions[table] = self.versions.get(table, 0) + 1
+
+    def etag(self, tables: Iterable[str]) -> str:
+        """Return a strong ETag for the current versions of the tables."""
+        with self.lock:
+            versions = "-".join(str(self.versions.get(table, 0)) for table in tables)
+        return f'"{self.epoch}-{versions}"'
+
+
+table_versions = TableVersions()
+
+
+def mark_changed(session: Session, table: str) -> None:
+    """Record that a table is changed, its version is bumped when the session commits."""
+    session.info.setdefault(CHANGED_TABLES, set()).add(table)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flushed(session: Session, _flush_context) -> None:
+    # Also catches rows changed through relationship cascades, e.g. steps deleted with a device
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table is not None:
+            mark_changed(session, table)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_changed(session: Session) -> None:
+    # Bumped after the commit so a request in between does not cache old data with a new tag
+    tables = session.info.pop(CHANGED_TABLES, None)
+    if tables:
+        table_versions.bump(*tables)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changed(session: Session, previous_transaction: SessionTransaction) -> None:
+    if previous_transaction.parent is None:
+        session.info.pop(CHANGED_TABLES, None)
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def conditional_response(
+    request: Request, tables: Iterable[str], build: Callable[[], bytes]
+) -> Response:
+    """Answer a GET request using the versions of the tables it reads.
+
+    Args:
+        request: The request, If-None-Match is checked against the ETag
+        tables: Tables the response is built from
+        build: Queries the database and returns the JSON body, only called if not cached
+
+    Returns:
+        304 if the client has the current version, otherwise the body with the ETag
+    """
+    etag = table_versions.etag(tables)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    key = f"response:{request.url.path}?{request.url.query}:{etag}"
+    body: Optional[bytes] = read_key(key)
+    if body is None:
+        body = build()
+        write_bytes(key, body, ETAG_CACHE_TTL)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,4 +1,5 @@
 import time
+from datetime import datetime
 from sqlalchemy import text
 from sqlalchemy.exc import OperationalError, ProgrammingError, InternalError
 from pydantic_settings import BaseSettings
@@ -14,6 +15,9 @@ class Settings(BaseSettings):
     database_url: str = config(
         "DATABASE_URL", cast=str, default="sqlite:///./brewlogger.sqlite"
     )
+    log_partitioning: bool = config("LOG_PARTITIONING", cast=bool, default=False)
+    readings_partitioning: str = config("READINGS_PARTITIONING", cast=str, default="")
+    readings_hash_partitions: int = config("READINGS_HASH_PARTITIONS", cast=int, default=8)
 
 
 def get_settings() -> Settings:
@@ -146,6 +150,33 @@ def migrate_database():
         "ALTER TABLE systemlog ADD COLUMN log_level INTEGER DEFAULT 3",
         "UPDATE systemlog SET log_level = 3 WHERE log_level IS NULL",
         "ALTER TABLE systemlog ALTER COLUMN log_level SET NOT NULL",
+
+        # Device logs stored by the log collector
+        "CREATE TABLE IF NOT EXISTS devicelog (id SERIAL PRIMARY KEY, chip_id VARCHAR(6) NOT NULL, timestamp TIMESTAMP NOT NULL, level INTEGER NOT NULL, message TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_devicelog_id ON devicelog (id)",
+        "CREATE INDEX IF NOT EXISTS ix_devicelog_chip_id_timestamp ON devicelog (chip_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_devicelog_chip_id_id ON devicelog (chip_id, id)",
+
+        # Keyset pagination of the system and receive logs
+        "CREATE INDEX IF NOT EXISTS ix_systemlog_timestamp_id ON systemlog (timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_receivelog_timestamp_id ON receivelog (timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_receivelog_ip_address_timestamp ON receivelog (ip_address, timestamp)",
+
+        # Chunked retention of the device log
+        "CREATE INDEX IF NOT EXISTS ix_devicelog_timestamp ON devicelog (timestamp)",
+
+        # Batch queries on the readings, also used for partition pruning
+        "CREATE INDEX IF NOT EXISTS ix_gravity_batch_id_created ON gravity (batch_id, created)",
+        "CREATE INDEX IF NOT EXISTS ix_pressure_batch_id_created ON pressure (batch_id, created)",
+
+        # Hourly and daily rollups of the readings
+        "CREATE TABLE IF NOT EXISTS rollup (id SERIAL PRIMARY KEY, batch_id INTEGER NOT NULL REFERENCES batch (id), period VARCHAR(1) NOT NULL, bucket TIMESTAMP NOT NULL, metric VARCHAR(30) NOT NULL, count INTEGER NOT NULL, sum FLOAT NOT NULL, min FLOAT NOT NULL, max FLOAT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_rollup_id ON rollup (id)",
+        "CREATE INDEX IF NOT EXISTS ix_rollup_batch_id_period_bucket ON rollup (batch_id, period, bucket)",
+        "CREATE TABLE IF NOT EXISTS rollupwatermark (source VARCHAR(20) PRIMARY KEY, last_id INTEGER NOT NULL)",
+
+        # Filtered gravity from the ingest filter
+        "ALTER TABLE gravity ADD COLUMN filtered_gravity FLOAT",
     ]
 
     with engine.connect() as con:
@@ -158,9 +189,142 @@ def migrate_database():
                 con.rollback()
                 print(f"Error {e}")
 
+    settings = get_settings()
+    if settings.log_partitioning:
+        partition_by_month("systemlog", "timestamp", [
+            "CREATE INDEX ix_systemlog_id ON systemlog (id)",
+            "CREATE INDEX ix_systemlog_timestamp_id ON systemlog (timestamp, id)",
+        ])
+        partition_by_month("receivelog", "timestamp", [
+            "CREATE INDEX ix_receivelog_id ON receivelog (id)",
+            "CREATE INDEX ix_receivelog_timestamp_id ON receivelog (timestamp, id)",
+            "CREATE INDEX ix_receivelog_ip_address_timestamp ON receivelog (ip_address, timestamp)",
+        ])
+    if settings.readings_partitioning:
+        partition_readings(settings.readings_partitioning, settings.readings_hash_partitions)
+
     print("Completed postgres migration.")
 
 
+def month_start(dt, offset=0):
+    months = dt.year * 12 + dt.month - 1 + offset
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def is_partitioned(con, table):
+    return con.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :table"
+        ),
+        {"table": table},
+    ).first() is not None
+
+
+def convert_to_partitions(table, column, method, partitions, statements):
+    """Convert a table to a partitioned table, the rows are copied.
+
+    The primary key must include the partition column so it becomes (id, column), the column
+    must not contain NULL values.
+
+    Args:
+        table: Table to convert
+        column: Partition column
+        method: RANGE or HASH
+        partitions: Function returning (name, bound) for each partition, called with the connection
+        statements: Indexes and constraints to create on the new table
+    """
+    with engine.connect() as con:
+        if is_partitioned(con, table):
+            print(f"Table {table} is already partitioned")
+            return
+
+        nulls = con.execute(text(f"SELECT count(*) FROM {table} WHERE {column} IS NULL")).scalar()
+        if nulls > 0:
+            print(f"Table {table} has {nulls} rows where {column} is NULL, unable to partition")
+            return
+
+        print(f"Converting table {table} to {method} partitions on {column}")
+        try:
+            sequence = con.execute(
+                text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}
+            ).scalar()
+            con.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+            con.execute(
+                text(
+                    f"CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS) "
+                    f"PARTITION BY {method} ({column})"
+                )
+            )
+            con.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"))
+            for name, bound in partitions(con):
+                con.execute(text(f"CREATE TABLE {name} PARTITION OF {table} {bound}"))
+
+            con.execute(text(f"INSERT INTO {table} SELECT * FROM {table}_old"))
+            if sequence:
+                con.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+            con.execute(text(f"DROP TABLE {table}_old"))
+            con.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})"))
+            for statement in statements:
+                con.execute(text(statement))
+            con.commit()
+            print(f"Table {table} converted to partitions")
+        except (OperationalError, ProgrammingError, InternalError) as e:
+            con.rollback()
+            print(f"Error {e}")
+
+
+def partition_by_month(table, column, statements, months_ahead=2):
+    """Partition a table by month, named <table>_pYYYYMM, with a default partition.
+
+    The scheduler creates the partitions for the coming months, retention drops the old ones.
+    """
+    with engine.connect() as con:
+        if not is_partitioned(con, table):
+            con.execute(text(f"UPDATE {table} SET {column} = now() WHERE {column} IS NULL"))
+            con.commit()
+
+    def partitions(con):
+        yield f"{table}_default", "DEFAULT"
+        oldest = con.execute(text(f"SELECT min({column}) FROM {table}_old")).scalar()
+        now = datetime.now()
+        start = month_start(oldest or now)
+        while start <= month_start(now, months_ahead):
+            end = month_start(start, 1)
+            yield (
+                f"{table}_p{start.year:04d}{start.month:02d}",
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')",
+            )
+            start = end
+
+    convert_to_partitions(table, column, "RANGE", partitions, statements)
+
+
+def partition_by_hash(table, column, count, statements):
+    """Partition a table in count partitions on the hash of column, named <table>_hN."""
+    def partitions(_):
+        for i in range(count):
+            yield f"{table}_h{i}", f"FOR VALUES WITH (MODULUS {count}, REMAINDER {i})"
+
+    convert_to_partitions(table, column, "HASH", partitions, statements)
+
+
+def partition_readings(mode, hash_partitions):
+    """Partition gravity and pressure by month on created or by the hash of batch_id."""
+    for table in ("gravity", "pressure"):
+        statements = [
+            f"CREATE INDEX ix_{table}_id ON {table} (id)",
+            f"CREATE INDEX ix_{table}_batch_id_created ON {table} (batch_id, created)",
+            f"ALTER TABLE {table} ADD FOREIGN KEY (batch_id) REFERENCES batch (id)",
+        ]
+        if mode == "month":
+            partition_by_month(table, "created", statements)
+        elif mode == "hash":
+            partition_by_hash(table, "batch_id", hash_partitions, statements)
+        else:
+            print(f"Unknown partitioning mode {mode} for readings")
+
+
 if __name__ == "__main__":
     print("Checking postgres database.")
 
@@ -5,6 +5,10 @@ from fastapi.testclient import TestClient
 from api.db.session import engine, create_session
 from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+from api.db import schemas
+from api.services import BatchService, GravityService, PressureService, PourService
+from api.versions import BATCH_TABLES, DEVICE_TABLES, table_versions
 
 
 @pytest.fixture()
@@ -54,6 +58,14 @@ def truncate_database():
             con.rollback()
             print(e)
 
+        for table in ("rollup", "rollupwatermark"):
+            try:
+                con.execute(text(f"DELETE FROM {table}"))
+                con.commit()
+            except Exception as e:
+                con.rollback()
+                print(e)
+
         try:
             con.execute(text("DELETE FROM batch"))
             con.commit()
@@ -79,4 +91,53 @@ def truncate_database():
             con.commit()
         except Exception as e:
             con.rollback()
-            print(e)
\ No newline at end of file
+            print(e)
+        try:
+            con.execute(text("DELETE FROM devicelog"))
+            con.commit()
+        except Exception as e:
+            con.rollback()
+            print(e)
+
+    table_versions.bump(*BATCH_TABLES, *DEVICE_TABLES)
+
+
+def create_batch_with_readings():
+    """Create a batch with a few readings of each kind and return the id"""
+    truncate_database()
+    session = create_session()
+    batch = BatchService(session).create(
+        schemas.BatchCreate(
+            name="Rows",
+            description="",
+            chip_id_gravity="ROW001",
+            chip_id_pressure="",
+            active=True,
+            tap_list=True,
+            brew_date="2024-01-01",
+            style="",
+            brewer="",
+            abv=5.2,
+            ebc=10,
+            ibu=30,
+            brewfather_id="",
+            fermentation_steps="[]",
+        )
+    )
+    for i in range(3):
+        created = datetime(2024, 1, 1, 12, i, 0, 123456 * i)
+        GravityService(session).create(
+            schemas.GravityCreate(
+                temperature=20.5, gravity=1.05 - i / 1000, angle=30.2, battery=3.9, rssi=-70,
+                corr_gravity=None, batch_id=batch.id, created=created, active=i != 1,
+            )
+        )
+        PressureService(session).create(
+            schemas.PressureCreate(
+                temperature=None, pressure=100.5 + i, rssi=-70, batch_id=batch.id, created=created, active=True,
+            )
+        )
+        PourService(session).create(
+            schemas.PourCreate(pour=0.5, volume=10 - i, max_volume=19, batch_id=batch.id, created=created, active=True)
+        )
+    return batch.id
@@ -0,0 +1,86 @@
+"""Tests for the fermentation analytics"""
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from api.analytics import BatchAnalytics, batch_analytics
+from api.config import get_settings
+from .conftest import create_batch_with_readings
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+    "Content-Type": "application/json",
+}
+
+
+def readings(count, hours=1.0):
+    start = datetime(2024, 3, 1, 8, 0)
+    created = [start + timedelta(hours=i * hours) for i in range(count)]
+    # 10 points per day with some noise
+    gravity = [1.060 - i * hours / 24 * 0.010 + (0.0005 if i % 2 else -0.0005) for i in range(count)]
+    return created, gravity
+
+
+def test_incremental_matches_backfill():
+    created, gravity = readings(100)
+
+    incremental = BatchAnalytics()
+    for c, g in zip(created, gravity):
+        incremental.add(c, g)
+
+    backfill = BatchAnalytics()
+    backfill.load(np.array(created, dtype="datetime64[us]"), np.array(gravity))
+
+    assert incremental.result() == backfill.result()
+    assert len(incremental.window) == len(backfill.window) == 25
+    assert incremental.sums == pytest.approx(backfill.sums)
+
+
+def test_values():
+    created, gravity = readings(72)
+    analytics = BatchAnalytics()
+    for c, g in zip(created, gravity):
+        analytics.add(c, g)
+
+    og = max(gravity[:13])  # First 12 hours
+    result = analytics.result()
+    assert result.og == pytest.approx(og)
+    assert result.sg == pytest.approx(gravity[-1])
+    assert result.velocity == pytest.approx(-10, abs=0.5)
+    assert result.abv == pytest.approx((og - gravity[-1]) * 131.25, abs=0.01)
+    assert result.attenuation == pytest.approx((og - gravity[-1]) / (og - 1) * 100, abs=0.1)
+    assert result.readings == 72
+
+    assert BatchAnalytics().result().velocity is None
+
+
+def test_dashboard_analytics(app_client):
+    batch_id = create_batch_with_readings()
+    batch_analytics.invalidate()
+
+    r = app_client.get(f"/api/batch/{batch_id}/dashboard", headers=headers)
+    assert r.status_code == 200
+    analytics = r.json()["analytics"]
+    assert analytics["readings"] == 2  # One reading is inactive
+    assert analytics["og"] == pytest.approx(1.05)
+    assert analytics["sg"] == pytest.approx(1.048)
+
+    # A new reading is added to the loaded state
+    gravity = {
+        "temperature": 20, "gravity": 1.040, "angle": 30, "battery": 3.9, "rssi": -70,
+        "batchId": batch_id, "created": "2024-01-01T18:00:00", "active": True,
+    }
+    r = app_client.post("/api/gravity/", json=gravity, headers=headers)
+    assert r.status_code == 201
+    assert batch_analytics.batches[batch_id].readings == 3
+
+    r = app_client.get(f"/api/batch/{batch_id}/dashboard", headers=headers)
+    analytics = r.json()["analytics"]
+    assert analytics["sg"] == pytest.approx(1.040)
+    assert analytics["abv"] == pytest.approx(1.31, abs=0.01)
+    assert analytics["velocity"] < 0
+
+    # Readings older than the latest force a reload
+    r = app_client.post("/api/gravity/", json=dict(gravity, created="2024-01-01T13:00:00"), headers=headers)
+    assert batch_id not in batch_analytics.batches
+    r = app_client.get(f"/api/batch/{batch_id}/dashboard", headers=headers)
+    assert r.json()["analytics"]["readings"] == 4
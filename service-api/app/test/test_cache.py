@@ -7,7 +7,12 @@ from api.cache import (
     delete_key,
     find_key,
     write_key,
+    write_bytes,
+    write_registry,
+    remove_registry,
+    read_registry,
     read_key,
+    read_hash,
     exist_key,
 )
 
@@ -99,6 +104,24 @@ def test_write_key_with_pool():
         )
 
 
+def test_write_bytes_with_pool():
+    """Test write_bytes stores the value as is"""
+    with patch("api.cache.pool", MagicMock()), \
+         patch("api.cache.redis.Redis") as mock_redis_class:
+
+        mock_redis_instance = MagicMock()
+        mock_redis_class.return_value = mock_redis_instance
+
+        assert write_bytes("test_key", b"[1]", 60) is True
+        mock_redis_instance.set.assert_called_once_with(name="test_key", value=b"[1]", ex=60)
+
+
+def test_write_bytes_without_pool():
+    """Test write_bytes when pool is None"""
+    with patch("api.cache.pool", None):
+        assert write_bytes("test_key", b"[1]", 60) is False
+
+
 def test_write_key_without_pool():
     """Test write_key when pool is None"""
     with patch("api.cache.pool", None):
@@ -187,3 +210,113 @@ def test_exist_key_connection_error():
         
         result = exist_key("test_key")
         assert result is False
+
+
+def test_read_hash_with_pool():
+    """Test read_hash when pool is available"""
+    with patch("api.cache.pool", MagicMock()), \
+         patch("api.cache.redis.Redis") as mock_redis_class:
+        
+        mock_redis_instance = MagicMock()
+        mock_redis_instance.hgetall.return_value = {b"type": b"tilt", b"gravity": b"1.05"}
+        mock_redis_class.return_value = mock_redis_instance
+        
+        result = read_hash("ble_red")
+        
+        assert result == {b"type": b"tilt", b"gravity": b"1.05"}
+        mock_redis_instance.hgetall.assert_called_once_with("ble_red")
+
+
+def test_read_hash_without_pool():
+    """Test read_hash when pool is None"""
+    with patch("api.cache.pool", None):
+        result = read_hash("ble_red")
+        assert result == {}
+
+
+def test_read_hash_wrong_type():
+    """Test read_hash handles keys that are not a hash"""
+    with patch("api.cache.pool", MagicMock()), \
+         patch("api.cache.redis.Redis") as mock_redis_class:
+        
+        mock_redis_instance = MagicMock()
+        mock_redis_instance.hgetall.side_effect = redis.exceptions.ResponseError("WRONGTYPE")
+        mock_redis_class.return_value = mock_redis_instance
+        
+        result = read_hash("ble_red_last")
+        assert result == {}
+
+
+def test_write_registry_with_pool():
+    """Test write_registry updates the hash and last seen scores in one pipeline"""
+    with patch("api.cache.pool", MagicMock()), \
+         patch("api.cache.redis.Redis") as mock_redis_class:
+
+        mock_redis_instance = MagicMock()
+        mock_pipe = MagicMock()
+        mock_redis_instance.pipeline.return_value = mock_pipe
+        mock_redis_class.return_value = mock_redis_instance
+
+        result = write_registry("mdns", {"a": "1", "b": "2"}, 1000.0)
+
+        assert result is True
+        mock_pipe.hset.assert_called_once_with("mdns", mapping={"a": "1", "b": "2"})
+        mock_pipe.zadd.assert_called_once_with("mdns_seen", {"a": 1000.0, "b": 1000.0})
+        mock_pipe.execute.assert_called_once()
+
+
+def test_write_registry_connection_error():
+    """Test write_registry handles connection errors"""
+    with patch("api.cache.pool", MagicMock()), \
+         patch("api.cache.redis.Redis") as mock_redis_class:
+
+        mock_redis_instance = MagicMock()
+        mock_redis_instance.pipeline.return_value.execute.side_effect = redis.exceptions.ConnectionError("Connection failed")
+        mock_redis_class.return_value = mock_redis_instance
+
+        assert write_registry("mdns", {"a": "1"}, 1000.0) is False
+
+
+def test_remove_registry_with_pool():
+    """Test remove_registry removes entries from both the hash and sorted set"""
+    with patch("api.cache.pool", MagicMock()), \
+         patch("api.cache.redis.Redis") as mock_redis_class:
+
+        mock_redis_instance = MagicMock()
+        mock_pipe = MagicMock()
+        mock_redis_instance.pipeline.return_value = mock_pipe
+        mock_redis_class.return_value = mock_redis_instance
+
+        remove_registry("mdns", ["a", "b"])
+        mock_pipe.hdel.assert_called_once_with("mdns", "a", "b")
+        mock_pipe.zrem.assert_called_once_with("mdns_seen", "a", "b")
+
+        remove_registry("mdns", [])
+        mock_pipe.execute.assert_called_once()
+
+
+def test_read_registry_expires_stale():
+    """Test read_registry removes entries older than max_age before reading"""
+    with patch("api.cache.pool", MagicMock()), \
+         patch("api.cache.redis.Redis") as mock_redis_class:
+
+        mock_redis_instance = MagicMock()
+        mock_redis_instance.zrangebyscore.return_value = [b"old"]
+        mock_pipe = MagicMock()
+        mock_pipe.execute.return_value = [1, 1, {b"new": b"value"}]
+        mock_redis_instance.pipeline.return_value = mock_pipe
+        mock_redis_class.return_value = mock_redis_instance
+
+        result = read_registry("mdns", max_age=900, now=1000.0)
+
+        assert result == {b"new": b"value"}
+        mock_redis_instance.zrangebyscore.assert_called_once_with("mdns_seen", "-inf", 100.0)
+        mock_pipe.hdel.assert_called_once_with("mdns", b"old")
+        mock_pipe.zrem.assert_called_once_with("mdns_seen", b"old")
+        mock_pipe.hgetall.assert_called_once_with("mdns")
+
+
+def test_read_registry_without_pool():
+    """Test read_registry when pool is None"""
+    with patch("api.cache.pool", None):
+        assert read_registry("mdns", max_age=900, now=1000.0) == {}
@@ -682,14 +682,11 @@ def test_device_mdns_scan(app_client):
     from .conftest import truncate_database
     truncate_database()
     
-    with patch("api.routers.device.find_key") as mock_find, \
-         patch("api.routers.device.read_key") as mock_read:
-        
-        mock_find.return_value = ["device1.local.", "device2.local."]
-        mock_read.side_effect = [
-            b'{"name": "device1", "ip": "192.168.1.100"}',
-            b'{"name": "device2", "ip": "192.168.1.101"}',
-        ]
+    with patch("api.routers.device.read_registry") as mock_read:
+        mock_read.return_value = {
+            b"192.168.1.100:80_http._tcp.local.": b'{"name": "device1", "ip": "192.168.1.100"}',
+            b"192.168.1.101:80_http._tcp.local.": b'{"name": "device2", "ip": "192.168.1.101"}',
+        }
         
         r = app_client.get("/api/device/mdns/", headers=headers)
         assert r.status_code == 200
@@ -698,6 +695,8 @@ def test_device_mdns_scan(app_client):
         assert len(data) == 2
         assert data[0]["name"] == "device1"
         assert data[1]["ip"] == "192.168.1.101"
+        assert mock_read.call_args[0][0] == "mdns"
+        assert mock_read.call_args[1]["max_age"] == 900
 
 
 def test_device_create_fermentation_step(app_client):
@@ -882,4 +881,23 @@ def test_device_list_with_software_filter(app_client):
     
     devices = json.loads(r.text)
     assert len(devices) == 1
-    assert devices[0]["software"] == "iSpindel"
\ No newline at end of file
+    assert devices[0]["software"] == "iSpindel"
+
+def test_delete_device_logs(app_client):
+    files = ["log/CCCCCC.log", "log/CCCCCC.log.1", "log/CCCCCC.log.2.gz", "log/CCCCCD.log"]
+    for f in files:
+        with open(f, "w") as fp:
+            fp.write("line\n")
+
+    r = app_client.delete("/api/device/logs/CCCCCC", headers=headers)
+    assert r.status_code == 200
+
+    r = app_client.get("/api/device/logs/", headers=headers)
+    assert r.status_code == 200
+    logs = json.loads(r.text)
+    assert "CCCCCC.log" not in logs
+    assert "CCCCCC.log.1" not in logs
+    assert "CCCCCC.log.2.gz" not in logs
+    assert "CCCCCD.log" in logs
+
+    app_client.delete("/api/device/logs/CCCCCD", headers=headers)
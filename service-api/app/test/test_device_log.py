@@ -0,0 +1,115 @@
+"""Tests for the stored device log endpoints."""
+import json
+from datetime import datetime, timedelta
+from api.config import get_settings
+from api.log import device_log_purge
+from .conftest import truncate_database
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+    "Content-Type": "application/json",
+}
+
+
+def test_init(app_client):
+    truncate_database()
+
+
+def create_lines(app_client):
+    now = datetime.now()
+    lines = []
+    for i in range(10):
+        lines.append({
+            "chipId": "AAAAAA",
+            "timestamp": (now - timedelta(minutes=10 - i)).isoformat(),
+            "level": 3 if i == 5 else 1,
+            "message": f"Line {i} " + ("Failed to connect to wifi" if i == 5 else "Reading sensor"),
+        })
+    lines.append({"chipId": "BBBBBB", "timestamp": now.isoformat(), "message": "Other device"})
+
+    r = app_client.post("/api/device/logs/", json=lines, headers=headers)
+    assert r.status_code == 201
+    assert json.loads(r.text)["count"] == 11
+    return now
+
+
+def test_search(app_client):
+    test_init(app_client)
+    create_lines(app_client)
+
+    r = app_client.get("/api/device/AAAAAA/logs", headers=headers)
+    assert r.status_code == 200
+    page = json.loads(r.text)
+    assert len(page["data"]) == 10
+    assert page["data"][0]["message"].startswith("Line 9")
+    assert page["nextCursor"] is None
+
+    r = app_client.get("/api/device/AAAAAA/logs?q=wifi", headers=headers)
+    page = json.loads(r.text)
+    assert len(page["data"]) == 1
+    assert page["data"][0]["level"] == 3
+
+    r = app_client.get("/api/device/AAAAAA/logs?level=2", headers=headers)
+    assert len(json.loads(r.text)["data"]) == 1
+
+    r = app_client.get("/api/device/BBBBBB/logs", headers=headers)
+    page = json.loads(r.text)
+    assert len(page["data"]) == 1
+    assert page["data"][0]["level"] == 1
+
+
+def test_search_time_range(app_client):
+    test_init(app_client)
+    now = create_lines(app_client)
+
+    start = (now - timedelta(minutes=5, seconds=30)).isoformat()
+    end = (now - timedelta(minutes=2, seconds=30)).isoformat()
+    r = app_client.get(f"/api/device/AAAAAA/logs?from={start}&to={end}", headers=headers)
+    assert r.status_code == 200
+    page = json.loads(r.text)
+    assert [line["message"][:6] for line in page["data"]] == ["Line 7", "Line 6", "Line 5"]
+
+
+def test_search_pages(app_client):
+    test_init(app_client)
+    create_lines(app_client)
+
+    messages = []
+    cursor = ""
+    while True:
+        r = app_client.get(f"/api/device/AAAAAA/logs?limit=4{cursor}", headers=headers)
+        assert r.status_code == 200
+        page = json.loads(r.text)
+        messages += [line["message"] for line in page["data"]]
+        if page["nextCursor"] is None:
+            break
+        cursor = f"&cursor={page['nextCursor']}"
+
+    assert len(messages) == 10
+    assert messages[0].startswith("Line 9")
+    assert messages[-1].startswith("Line 0")
+
+
+def test_invalid_lines(app_client):
+    r = app_client.post("/api/device/logs/", json=[{"chipId": "AAA", "timestamp": "x", "message": ""}], headers=headers)
+    assert r.status_code == 422
+
+    r = app_client.get("/api/device/AAAAAA/logs", headers={"Content-Type": "application/json"})
+    assert r.status_code == 401
+
+
+def test_delete_and_purge(app_client):
+    test_init(app_client)
+    create_lines(app_client)
+
+    device_log_purge(days=0)
+    r = app_client.get("/api/device/AAAAAA/logs", headers=headers)
+    assert len(json.loads(r.text)["data"]) == 0
+
+    create_lines(app_client)
+    r = app_client.delete("/api/device/logs/AAAAAA", headers=headers)
+    assert r.status_code == 200
+    r = app_client.get("/api/device/AAAAAA/logs", headers=headers)
+    assert len(json.loads(r.text)["data"]) == 0
+    r = app_client.get("/api/device/BBBBBB/logs", headers=headers)
+    assert len(json.loads(r.text)["data"]) == 1
@@ -1,6 +1,4 @@
 import json
-from unittest.mock import AsyncMock, patch
-
 from api.config import get_settings
 from .conftest import truncate_database
 
@@ -46,64 +44,67 @@ def test_dispatch_empty_object(app_client):
     assert r.status_code == 400
 
 
-@patch("api.routers.dispatch.httpx.AsyncClient")
-def test_dispatch_gravity_forward_success(mock_client, app_client):
-    """Test successful forwarding of gravity data to brew_api"""
+def test_dispatch_gravity(app_client):
+    """Test that gravity data is stored with a single receive log entry"""
     test_init(app_client)
-    
-    # Mock the AsyncClient and response
-    mock_response = AsyncMock()
-    mock_response.content = b'{"status": "received"}'
-    
-    mock_async_client = AsyncMock()
-    mock_async_client.post = AsyncMock(return_value=mock_response)
-    mock_async_client.__aenter__ = AsyncMock(return_value=mock_async_client)
-    mock_async_client.__aexit__ = AsyncMock(return_value=None)
-    
-    mock_client.return_value = mock_async_client
-    
-    # Send gravity data
-    payload = {"gravity": 1.055, "angle": 45, "temperature": 68}
+
+    payload = {
+        "name": "name",
+        "ID": "DISP01",
+        "token": "token",
+        "interval": 1,
+        "temperature": 20.2,
+        "temp_units": "C",
+        "gravity": 1.05,
+        "angle": 34.45,
+        "battery": 3.85,
+        "RSSI": -76.2,
+    }
     r = app_client.post("/api/dispatch/public", json=payload)
-    
-    # Verify the response
     assert r.status_code == 200
-    # Verify httpx was called with correct parameters
-    mock_async_client.post.assert_called_once_with(
-        "http://brew_api:80/api/gravity/public",
-        json=payload
-    )
+
+    r = app_client.get("/api/batch/?chipId=DISP01", headers=headers)
+    assert r.status_code == 200
+    data = json.loads(r.text)
+    assert len(data) == 1
+    assert data[0]["gravityCount"] == 1
+
+    r = app_client.get("/api/system/receive/", headers=headers)
+    assert r.status_code == 200
+    assert json.loads(r.text)["total"] == 1
 
 
-@patch("api.routers.dispatch.httpx.AsyncClient")
-def test_dispatch_pressure_forward_success(mock_client, app_client):
-    """Test successful forwarding of pressure data to brew_api"""
+def test_dispatch_pressure(app_client):
+    """Test that pressure data is stored with a single receive log entry"""
     test_init(app_client)
-    
-    # Mock the AsyncClient and response
-    mock_response = AsyncMock()
-    mock_response.content = b'{"status": "received"}'
-    
-    mock_async_client = AsyncMock()
-    mock_async_client.post = AsyncMock(return_value=mock_response)
-    mock_async_client.__aenter__ = AsyncMock(return_value=mock_async_client)
-    mock_async_client.__aexit__ = AsyncMock(return_value=None)
-    
-    mock_client.return_value = mock_async_client
-    
-    # Send pressure data
-    payload = {"pressure": 15.5, "temperature": 68}
+
+    payload = {
+        "name": "name",
+        "id": "DISP02",
+        "interval": 10,
+        "temperature": 21.71,
+        "pressure": 1.5,
+        "pressure-unit": "BAR",
+        "battery": 3.9,
+        "rssi": -82,
+    }
     r = app_client.post("/api/dispatch/public", json=payload)
-    
-    # Verify the response
     assert r.status_code == 200
-    # Verify httpx was called with correct parameters
-    mock_async_client.post.assert_called_once_with(
-        "http://brew_api:80/api/pressure/public",
-        json=payload
-    )
 
+    r = app_client.get("/api/batch/?chipId=DISP02", headers=headers)
+    assert r.status_code == 200
+    data = json.loads(r.text)
+    assert len(data) == 1
+    assert data[0]["pressureCount"] == 1
 
+    r = app_client.get("/api/system/receive/", headers=headers)
+    assert r.status_code == 200
+    assert json.loads(r.text)["total"] == 1
 
 
+def test_dispatch_gravity_missing_field(app_client):
+    """Test that gravity data with missing fields is rejected"""
+    test_init(app_client)
 
+    r = app_client.post("/api/dispatch/public", json={"ID": "DISP03", "gravity": 1.05})
+    assert r.status_code == 422
@@ -0,0 +1,82 @@
+"""Tests for the streaming batch export"""
+import csv
+import io
+import json
+import pytest
+from api import export
+from api.config import get_settings
+from .conftest import create_batch_with_readings
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+}
+
+
+def test_export_csv(app_client):
+    batch_id = create_batch_with_readings()
+    expected = app_client.get(f"/api/gravity/?batchId={batch_id}", headers=headers).json()
+
+    r = app_client.get(f"/api/batch/{batch_id}/export", headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    assert f"batch_{batch_id}_gravity.csv" in r.headers["content-disposition"]
+
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert len(rows) == 3
+    assert rows[0]["created"] == expected[0]["created"]
+    assert float(rows[2]["gravity"]) == expected[2]["gravity"]
+    assert rows[0]["corrGravity"] == ""
+
+
+def test_export_ndjson(app_client):
+    batch_id = create_batch_with_readings()
+    expected = app_client.get(f"/api/pour/?batchId={batch_id}", headers=headers).json()
+
+    r = app_client.get(f"/api/batch/{batch_id}/export?format=ndjson&type=pour", headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert rows == sorted(expected, key=lambda x: x["created"])
+
+
+def test_export_chunks(app_client, monkeypatch):
+    batch_id = create_batch_with_readings()
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 2)
+
+    r = app_client.get(f"/api/batch/{batch_id}/export?format=ndjson&type=pressure", headers=headers)
+    assert r.status_code == 200
+    assert len(r.text.splitlines()) == 3
+
+    r = app_client.get(f"/api/batch/{batch_id}/export?type=pressure", headers=headers)
+    assert r.status_code == 200
+    assert len(r.text.splitlines()) == 4
+
+
+def test_export_parquet(app_client, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    batch_id = create_batch_with_readings()
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 2)
+
+    r = app_client.get(f"/api/batch/{batch_id}/export?format=parquet", headers=headers)
+    assert r.status_code == 200
+    table = pq.read_table(io.BytesIO(r.content))
+    assert table.num_rows == 3
+    assert table.schema.field("gravity").type == "double"
+    assert str(table.schema.field("created").type) == "timestamp[us]"
+    assert table.column("active").to_pylist() == [True, False, True]
+    assert pq.ParquetFile(io.BytesIO(r.content)).metadata.num_row_groups == 2
+
+
+def test_export_errors(app_client, monkeypatch):
+    batch_id = create_batch_with_readings()
+
+    r = app_client.get("/api/batch/999999/export", headers=headers)
+    assert r.status_code == 404
+    r = app_client.get(f"/api/batch/{batch_id}/export?format=xml", headers=headers)
+    assert r.status_code == 422
+    r = app_client.get(f"/api/batch/{batch_id}/export?type=device", headers=headers)
+    assert r.status_code == 422
+
+    monkeypatch.setattr(export, "pyarrow", None)
+    r = app_client.get(f"/api/batch/{batch_id}/export?format=parquet", headers=headers)
+    assert r.status_code == 400
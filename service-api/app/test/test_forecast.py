@@ -0,0 +1,93 @@
+"""Tests for the fermentation forecast"""
+import asyncio
+from datetime import datetime, timedelta
+import math
+import numpy as np
+import pytest
+from api.config import get_settings
+from api.db import models, schemas
+from api.db.session import create_session
+from api.rollup import refresh_batch_rollups, update_rollups
+from api.forecast import batch_forecasts, fit_exponential, with_remaining
+from api.scheduler import task_update_rollups
+from api.services import GravityService
+from .conftest import create_batch_with_readings
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+    "Content-Type": "application/json",
+}
+
+START = datetime(2024, 6, 1, 0, 0)
+
+
+def curve(days):
+    return 1.012 + 0.040 * math.exp(-0.8 * days)
+
+
+def test_fit_exponential():
+    days = np.linspace(0, 3, 72)
+    gravity = np.array([curve(d) for d in days]) + np.random.default_rng(1).normal(0, 0.0003, 72)
+    fit = fit_exponential(days, gravity)
+    assert fit["fg"] == pytest.approx(1.012, abs=0.001)
+    assert fit["g0"] == pytest.approx(1.052, abs=0.001)
+    assert fit["rate"] == pytest.approx(0.8, rel=0.1)
+
+    # Rising gravity has no attenuation curve
+    assert fit_exponential(days, 1.0 + days / 100) is None
+
+
+def test_forecast_endpoint(app_client):
+    batch_id = create_batch_with_readings()
+    update_rollups()
+    batch_forecasts.invalidate()
+
+    r = app_client.get(f"/api/batch/{batch_id}/forecast", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["points"] == 1
+    assert r.json()["terminalGravity"] is None
+
+    session = create_session()
+    session.query(models.Gravity).filter(models.Gravity.batch_id == batch_id).delete()
+    service = GravityService(session)
+    for i in range(0, 96 * 4):
+        created = START + timedelta(minutes=15 * i)
+        service.create(
+            schemas.GravityCreate(
+                temperature=20, gravity=curve(i / 96), angle=30, battery=3.9, rssi=-70,
+                batch_id=batch_id, created=created, active=True,
+            ),
+            commit=False,
+        )
+    session.commit()
+    refresh_batch_rollups(batch_id)
+    batch_forecasts.invalidate(batch_id)
+
+    r = app_client.get(f"/api/batch/{batch_id}/forecast", headers=headers)
+    data = r.json()
+    assert data["points"] == 96
+    assert data["terminalGravity"] == pytest.approx(1.012, abs=0.001)
+    # 0.040 * exp(-0.8 t) = 0.001 gives t = 4.6 days
+    completion = datetime.fromisoformat(data["completion"])
+    assert abs(completion - (START + timedelta(days=4.6))) < timedelta(hours=6)
+    assert data["completed"] is True
+
+    result = with_remaining(schemas.Forecast(**data), START + timedelta(days=4))
+    assert result.hours_remaining == pytest.approx(14.4, abs=6)
+    assert result.completed is False
+
+    # The forecast is dropped when a new reading is added to the rollups
+    gravity = {
+        "temperature": 20, "gravity": 1.012, "angle": 30, "battery": 3.9, "rssi": -70,
+        "batchId": batch_id, "created": (START + timedelta(days=5)).isoformat(), "active": True,
+    }
+    r = app_client.post("/api/gravity/", json=gravity, headers=headers)
+    r = app_client.get(f"/api/batch/{batch_id}/forecast", headers=headers)
+    assert r.json()["points"] == 96
+    asyncio.run(task_update_rollups())
+    assert batch_id not in batch_forecasts.batches
+    r = app_client.get(f"/api/batch/{batch_id}/forecast", headers=headers)
+    assert r.json()["points"] == 97
+
+    r = app_client.get("/api/batch/999999/forecast", headers=headers)
+    assert r.status_code == 404
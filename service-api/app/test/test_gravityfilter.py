@@ -0,0 +1,140 @@
+"""Tests for the gravity outlier and noise filter"""
+import json
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import pytest
+from sqlalchemy.exc import OperationalError
+from api.config import get_settings
+from api.gravityfilter import HampelFilter, KalmanFilter, gravity_filters
+from api.services import GravityService
+from .conftest import create_batch_with_readings, truncate_database
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+    "Content-Type": "application/json",
+}
+
+START = datetime(2024, 5, 1, 10, 0)
+
+
+def series(values):
+    return [(START + timedelta(minutes=15 * i), v) for i, v in enumerate(values)]
+
+
+def run(gravity_filter, values):
+    return [gravity_filter.update(created, value) for created, value in series(values)]
+
+
+@pytest.mark.parametrize("gravity_filter", [HampelFilter(7, 3.0), KalmanFilter(3.0)])
+def test_spike(gravity_filter):
+    values = [1.050, 1.0502, 1.0499, 1.0501, 1.0500, 1.030, 1.0499, 1.0498]
+    result = run(gravity_filter, values)
+    assert [outlier for _, outlier in result] == [False] * 5 + [True, False, False]
+    assert result[5][0] == pytest.approx(1.050, abs=0.0005)
+
+
+@pytest.mark.parametrize("gravity_filter", [HampelFilter(7, 3.0), KalmanFilter(3.0)])
+def test_level_shift(gravity_filter):
+    # A lasting change is accepted after a few readings
+    values = [1.050, 1.050, 1.050, 1.050, 1.040, 1.040, 1.040, 1.040, 1.040]
+    result = run(gravity_filter, values)
+    assert [outlier for _, outlier in result[4:]] == [True, True, True, False, False]
+    assert result[-1][0] == pytest.approx(1.040, abs=0.0005)
+
+
+def test_ingest_filter(app_client, monkeypatch):
+    truncate_database()
+    gravity_filters.invalidate()
+    settings = get_settings()
+    monkeypatch.setattr(settings, "gravity_filter", "hampel")
+    monkeypatch.setattr(settings, "gravity_filter_deactivate", True)
+
+    for gravity in (1.050, 1.0501, 1.0499, 1.0500, 1.020, 1.0498):
+        data = {"ID": "FLT001", "temperature": 20, "gravity": gravity, "angle": 30, "battery": 3.9, "RSSI": -70}
+        r = app_client.post("/api/gravity/public", json=data)
+        assert r.status_code == 200
+
+    r = app_client.get("/api/batch/?chipId=FLT001", headers=headers)
+    batch_id = json.loads(r.text)[0]["id"]
+    r = app_client.get(f"/api/gravity/?batchId={batch_id}", headers=headers)
+    readings = sorted(json.loads(r.text), key=lambda g: g["id"])
+
+    spike = readings[4]
+    assert spike["gravity"] == 1.020
+    assert spike["filteredGravity"] == pytest.approx(1.05, abs=0.0002)
+    assert spike["active"] is False
+    assert all(g["active"] for g in readings if g is not spike)
+    assert readings[5]["filteredGravity"] == 1.0498
+
+    # Disabled by default, the filtered value is not set
+    monkeypatch.setattr(settings, "gravity_filter", "")
+    data = {"ID": "FLT001", "temperature": 20, "gravity": 1.030, "angle": 30, "battery": 3.9, "RSSI": -70}
+    r = app_client.post("/api/gravity/public", json=data)
+    r = app_client.get(f"/api/gravity/?batchId={batch_id}", headers=headers)
+    latest = max(json.loads(r.text), key=lambda g: g["id"])
+    assert latest["filteredGravity"] is None
+    assert latest["active"] is True
+
+
+def test_filter_invalidated(app_client, monkeypatch):
+    truncate_database()
+    gravity_filters.invalidate()
+    monkeypatch.setattr(get_settings(), "gravity_filter", "hampel")
+    data = {"ID": "FLT002", "temperature": 20, "gravity": 1.050, "angle": 30, "battery": 3.9, "RSSI": -70}
+
+    r = app_client.post("/api/gravity/public", json=data)
+    assert r.status_code == 200
+    r = app_client.get("/api/batch/?chipId=FLT002", headers=headers)
+    batch_id = json.loads(r.text)[0]["id"]
+    assert batch_id in gravity_filters.batches
+
+    # A reading that is not committed must not stay in the filter state
+    with monkeypatch.context() as m:
+        m.setattr(GravityService, "create", Mock(side_effect=OperationalError("insert", None, None)))
+        with pytest.raises(OperationalError):
+            app_client.post("/api/gravity/public", json=data)
+    assert batch_id not in gravity_filters.batches
+
+    app_client.post("/api/gravity/public", json=data)
+    r = app_client.get(f"/api/gravity/?batchId={batch_id}", headers=headers)
+    reading = json.loads(r.text)[0]
+    gravity_id = reading["id"]
+    reading["active"] = False
+    r = app_client.patch(f"/api/gravity/{gravity_id}", json=reading, headers=headers)
+    assert r.status_code == 200
+    assert batch_id not in gravity_filters.batches
+
+    app_client.post("/api/gravity/public", json=data)
+    r = app_client.delete(f"/api/gravity/{gravity_id}", headers=headers)
+    assert r.status_code == 204
+    assert batch_id not in gravity_filters.batches
+
+
+def test_create_filter(app_client, monkeypatch):
+    batch_id = create_batch_with_readings()
+    gravity_filters.invalidate()
+    settings = get_settings()
+    monkeypatch.setattr(settings, "gravity_filter", "hampel")
+    monkeypatch.setattr(settings, "gravity_filter_deactivate", True)
+
+    # Uploaded in any order, filtered in the order they were created
+    readings = [
+        {
+            "temperature": 20, "gravity": gravity, "angle": 30, "battery": 3.9, "rssi": -70,
+            "batchId": batch_id, "created": created.isoformat(), "active": True,
+        }
+        for created, gravity in series([1.050, 1.0501, 1.0499, 1.0500, 1.020, 1.0498])
+    ]
+    r = app_client.post("/api/gravity/", json=readings[::-1], headers=headers)
+    assert r.status_code == 201
+    result = {g["created"]: g for g in r.json()}
+    spike = result[readings[4]["created"]]
+    assert spike["filteredGravity"] == pytest.approx(1.05, abs=0.0002)
+    assert spike["active"] is False
+    assert result[readings[5]["created"]]["filteredGravity"] == 1.0498
+
+    reading = {**readings[5], "created": (START + timedelta(hours=2)).isoformat()}
+    r = app_client.post("/api/gravity/", json=reading, headers=headers)
+    assert r.status_code == 201
+    assert r.json()["filteredGravity"] == 1.0498
+    assert r.json()["active"] is True
@@ -0,0 +1,128 @@
+"""Tests for the bulk import of batch readings"""
+import json
+from api import importer
+from api.config import get_settings
+from .conftest import create_batch_with_readings
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+}
+
+
+def test_import_roundtrip(app_client):
+    batch_id = create_batch_with_readings()
+
+    for reading_type in ("gravity", "pressure", "pour"):
+        exported = {}
+        for import_format in ("csv", "ndjson"):
+            r = app_client.get(f"/api/batch/{batch_id}/export?format={import_format}&type={reading_type}", headers=headers)
+            assert r.status_code == 200
+            exported[import_format] = r.content
+
+        for import_format, content in exported.items():
+            r = app_client.post(
+                f"/api/batch/{batch_id}/import?format={import_format}&type={reading_type}",
+                content=content,
+                headers=headers,
+            )
+            assert r.status_code == 200
+            result = json.loads(r.text)
+            assert result["rows"] == 3
+            assert result["rejected"] == 0
+            assert result["elapsedMs"] >= 0
+
+        r = app_client.get(f"/api/{reading_type}/?batchId={batch_id}", headers=headers)
+        rows = json.loads(r.text)
+        assert len(rows) == 9
+        # Each reading should now exist three times with the same values
+        groups = {}
+        for x in rows:
+            x.pop("id")
+            groups.setdefault(x["created"], []).append(x)
+        assert len(groups) == 3
+        assert all(len(g) == 3 and g[0] == g[1] == g[2] for g in groups.values())
+
+
+def test_import_units_and_rejects(app_client, monkeypatch):
+    batch_id = create_batch_with_readings()
+    monkeypatch.setattr(importer, "IMPORT_CHUNK_SIZE", 2)
+
+    data = "\n".join([
+        "created,gravity,angle,battery,rssi,temperature,active",
+        "2024-02-01T10:00:00,12.5,30,4.0,-70,68,true",
+        "2024-02-01T10:15:00,12.0,30,4.0,-70,,",
+        "2024-02-01T10:30:00,bad,30,4.0,-70,68,true",
+        "2024-02-01T10:45:00,11.0,30,4.0",
+        "not a date,11.0,30,4.0,-70,68,true",
+        "2024-02-01T11:00:00,11.5,30,4.0,-70,68,false",
+    ])
+    r = app_client.post(
+        f"/api/batch/{batch_id}/import?tempUnit=F&gravityUnit=P",
+        content=data.encode(),
+        headers=headers,
+    )
+    assert r.status_code == 200
+    result = json.loads(r.text)
+    assert result["rows"] == 3
+    assert result["rejected"] == 3
+    assert result["errors"][0].startswith("Line 4:")
+    assert "expected 7 values" in result["errors"][1]
+
+    r = app_client.get(f"/api/gravity/?batchId={batch_id}", headers=headers)
+    imported = {x["created"]: x for x in json.loads(r.text) if x["created"].startswith("2024-02-01")}
+    assert imported["2024-02-01T10:00:00"]["gravity"] == 1.0505
+    assert imported["2024-02-01T10:00:00"]["temperature"] == 20.0
+    assert imported["2024-02-01T10:15:00"]["temperature"] is None
+    assert imported["2024-02-01T10:15:00"]["active"] is True
+    assert imported["2024-02-01T11:00:00"]["active"] is False
+
+
+def test_import_plato(app_client):
+    batch_id = create_batch_with_readings()
+    record = {
+        "created": "2024-02-01T10:00:00", "gravity": 12.5, "corrGravity": 12.5,
+        "filteredGravity": 12.5, "angle": 30, "battery": 4.0, "rssi": -70, "active": True,
+    }
+    r = app_client.post(
+        f"/api/batch/{batch_id}/import?format=ndjson&gravityUnit=P",
+        content=json.dumps(record).encode(),
+        headers=headers,
+    )
+    assert r.status_code == 200
+    assert json.loads(r.text)["rows"] == 1
+
+    r = app_client.get(f"/api/gravity/?batchId={batch_id}", headers=headers)
+    imported = next(x for x in json.loads(r.text) if x["created"] == "2024-02-01T10:00:00")
+    assert imported["gravity"] == 1.0505
+    assert imported["corrGravity"] == 1.0505
+    assert imported["filteredGravity"] == 1.0505
+
+
+def test_import_ndjson_rejects(app_client):
+    batch_id = create_batch_with_readings()
+
+    data = b'{"created": "2024-02-01T10:00:00", "pressure": 1.5, "rssi": -70}\n[1, 2]\n{broken\n\n{"pressure": 1.0, "rssi": -70}'
+    r = app_client.post(f"/api/batch/{batch_id}/import?format=ndjson&type=pressure&pressureUnit=BAR", content=data, headers=headers)
+    assert r.status_code == 200
+    result = json.loads(r.text)
+    assert result["rows"] == 1
+    assert result["rejected"] == 3
+    assert result["errors"] == [
+        "Line 2: not an object",
+        "Line 3: invalid json",
+        "Line 5: missing value for created",
+    ]
+
+    r = app_client.get(f"/api/pressure/?batchId={batch_id}", headers=headers)
+    assert [x["pressure"] for x in json.loads(r.text) if x["created"] == "2024-02-01T10:00:00"] == [1500.0]
+
+
+def test_import_errors(app_client):
+    batch_id = create_batch_with_readings()
+
+    r = app_client.post("/api/batch/999999/import", content=b"", headers=headers)
+    assert r.status_code == 404
+    r = app_client.post(f"/api/batch/{batch_id}/import?format=parquet", content=b"", headers=headers)
+    assert r.status_code == 422
+    r = app_client.post(f"/api/batch/{batch_id}/import", content=b"")
+    assert r.status_code in (401, 403)
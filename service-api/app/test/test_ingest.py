@@ -0,0 +1,88 @@
+import json
+from api.config import get_settings
+from api.ingest import detect_format, fahrenheit_to_celsius, plato_to_sg, pressure_to_kpa, ingest_stats
+from .conftest import truncate_database
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+    "Content-Type": "application/json",
+}
+
+
+def test_init(app_client):
+    truncate_database()
+
+
+def test_detect_format():
+    ispindel = {"ID": "A", "gravity": 1.05, "angle": 30, "battery": 4, "RSSI": -70}
+    assert detect_format(ispindel).name == "ispindel"
+    assert detect_format(dict(ispindel, **{"corr-gravity": 1.049})).name == "gravitymon"
+    assert detect_format({"color": "red", "gravity": 1.05}).name == "tilt"
+    assert detect_format({"id": "A", "pressure": 1.0}).name == "pressuremon"
+    assert detect_format({"id": "1", "pour": 0.3}).name == "kegmon"
+    assert detect_format({"id": "1", "volume": 10}).name == "kegmon"
+
+    # Unknown payloads use the last format of the kind when the endpoint decides the kind
+    assert detect_format({"something": 1}) is None
+    assert detect_format({"something": 1}, "gravity").name == "ispindel"
+    assert detect_format({"something": 1}, "pressure").name == "pressuremon"
+    assert detect_format([1, 2], "gravity") is None
+
+
+def test_conversions():
+    assert fahrenheit_to_celsius(68) == 20.0
+    assert plato_to_sg(12.5) == 1.0505
+    assert pressure_to_kpa(1.5, "bar") == 1500.0
+    assert pressure_to_kpa(10, "PSI") == 68.9476
+    assert pressure_to_kpa(100, "kPa") == 100
+
+
+def test_single_transaction(app_client):
+    test_init(app_client)
+
+    # The reading is rejected after the batch and device are created, nothing should be stored
+    data = {
+        "ID": "ING001",
+        "temperature": 20.2,
+        "gravity": 1.05,
+        "angle": "not a number",
+        "battery": 3.85,
+        "RSSI": -76.2,
+    }
+    r = app_client.post("/api/gravity/public", json=data)
+    assert r.status_code == 422
+
+    r = app_client.get("/api/batch/?chipId=ING001", headers=headers)
+    assert r.status_code == 200
+    assert len(json.loads(r.text)) == 0
+
+    r = app_client.get("/api/device/?chipId=ING001", headers=headers)
+    assert r.status_code == 200
+    assert len(json.loads(r.text)) == 0
+
+    data["angle"] = 34.45
+    r = app_client.post("/api/gravity/public", json=data)
+    assert r.status_code == 200
+
+    r = app_client.get("/api/batch/?chipId=ING001", headers=headers)
+    assert len(json.loads(r.text)) == 1
+    r = app_client.get("/api/device/?chipId=ING001", headers=headers)
+    assert len(json.loads(r.text)) == 1
+
+
+def test_ingest_stats(app_client):
+    test_init(app_client)
+    ingest_stats.clear()
+
+    data = {"name": "name", "id": "ING002", "temperature": 21.7, "pressure": 1.2, "rssi": -82}
+    r = app_client.post("/api/pressure/public", json=data)
+    assert r.status_code == 200
+    r = app_client.post("/api/pressure/public", json=data)
+    assert r.status_code == 200
+
+    r = app_client.get("/api/system/ingest/", headers=headers)
+    assert r.status_code == 200
+    stages = {s["stage"]: s for s in json.loads(r.text) if s["format"] == "pressuremon"}
+    assert set(stages.keys()) == {"parse", "normalize", "batch", "device", "insert", "total"}
+    assert stages["total"]["count"] == 2
+    assert stages["total"]["maxMs"] >= stages["total"]["avgMs"]
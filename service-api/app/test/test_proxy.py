@@ -0,0 +1,163 @@
+"""Tests for the pooled device proxy"""
+import asyncio
+import pytest
+import httpx
+from unittest.mock import AsyncMock, MagicMock, patch
+from api.proxy import DeviceProxy
+
+
+def make_client(response, delay=0):
+    """Create a mocked httpx client that counts the requests sent"""
+    client = AsyncMock()
+    client.active = 0
+    client.peak = 0
+
+    async def send(*args, **kwargs):
+        client.active += 1
+        client.peak = max(client.peak, client.active)
+        await asyncio.sleep(delay)
+        client.active -= 1
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    client.get = AsyncMock(side_effect=send)
+    client.post = AsyncMock(side_effect=send)
+    client.put = AsyncMock(side_effect=send)
+    client.delete = AsyncMock(side_effect=send)
+    return client
+
+
+def make_response(status_code=200):
+    response = MagicMock()
+    response.status_code = status_code
+    return response
+
+
+@pytest.mark.asyncio
+async def test_proxy_get_cached():
+    """Test that a successful get is served from the cache"""
+    response = make_response()
+    client = make_client(response)
+    with patch("api.proxy.httpx.AsyncClient", return_value=client):
+        proxy = DeviceProxy(1, 10)
+        assert await proxy.request("get", "http://192.168.1.10/api/config") is response
+        assert await proxy.request("get", "http://192.168.1.10/api/config") is response
+        assert client.get.call_count == 1
+
+        # Different headers are different requests
+        await proxy.request("get", "http://192.168.1.10/api/config", headers={"Authorization": "Bearer x"})
+        assert client.get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_proxy_error_not_cached():
+    """Test that error responses are not cached"""
+    client = make_client(make_response(500))
+    with patch("api.proxy.httpx.AsyncClient", return_value=client):
+        proxy = DeviceProxy(1, 10)
+        await proxy.request("get", "http://192.168.1.10/api/status")
+        await proxy.request("get", "http://192.168.1.10/api/status")
+        assert client.get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_proxy_write_invalidates():
+    """Test that a write request clears the cached responses for the device"""
+    client = make_client(make_response())
+    with patch("api.proxy.httpx.AsyncClient", return_value=client):
+        proxy = DeviceProxy(1, 10)
+        await proxy.request("get", "http://192.168.1.10/api/config")
+        await proxy.request("get", "http://192.168.1.11/api/config")
+        await proxy.request("post", "http://192.168.1.10/api/config", body="{}")
+        await proxy.request("get", "http://192.168.1.10/api/config")
+        await proxy.request("get", "http://192.168.1.11/api/config")
+        assert client.post.call_count == 1
+        assert client.get.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_proxy_coalesce():
+    """Test that identical requests in flight share one device request"""
+    response = make_response()
+    client = make_client(response, delay=0.05)
+    with patch("api.proxy.httpx.AsyncClient", return_value=client):
+        proxy = DeviceProxy(1, 0)
+        results = await asyncio.gather(
+            *[proxy.request("get", "http://192.168.1.10/api/status") for _ in range(5)]
+        )
+        assert all(r is response for r in results)
+        assert client.get.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_proxy_coalesce_error():
+    """Test that a failed request is reported to all waiting callers"""
+    client = make_client(httpx.ConnectError("failed"), delay=0.05)
+    with patch("api.proxy.httpx.AsyncClient", return_value=client):
+        proxy = DeviceProxy(1, 10)
+        results = await asyncio.gather(
+            *[proxy.request("get", "http://192.168.1.10/api/status") for _ in range(3)],
+            return_exceptions=True,
+        )
+        assert all(isinstance(r, httpx.ConnectError) for r in results)
+        assert client.get.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_proxy_concurrency():
+    """Test that requests to one device are limited while other devices run in parallel"""
+    clients = {}
+
+    def create_client(*args, **kwargs):
+        client = make_client(make_response(), delay=0.02)
+        clients[len(clients)] = client
+        return client
+
+    with patch("api.proxy.httpx.AsyncClient", side_effect=create_client):
+        proxy = DeviceProxy(1, 0)
+        await asyncio.gather(
+            *[proxy.request("get", f"http://192.168.1.10/api/{i}") for i in range(4)],
+            *[proxy.request("get", f"http://192.168.1.11/api/{i}") for i in range(4)],
+        )
+        assert len(clients) == 2
+        assert all(c.peak == 1 and c.get.call_count == 4 for c in clients.values())
+
+        await proxy.close()
+        assert all(c.aclose.call_count == 1 for c in clients.values())
+
+
+@pytest.mark.asyncio
+async def test_proxy_coalesce_cancel():
+    """Test that cancelling the first caller does not cancel the callers waiting on it"""
+    response = make_response()
+    client = make_client(response, delay=0.05)
+    with patch("api.proxy.httpx.AsyncClient", return_value=client):
+        proxy = DeviceProxy(1, 0)
+        first = asyncio.create_task(proxy.request("get", "http://192.168.1.10/api/status"))
+        await asyncio.sleep(0.01)
+        waiters = [
+            asyncio.create_task(proxy.request("get", "http://192.168.1.10/api/status"))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        assert all(r is response for r in await asyncio.gather(*waiters))
+        assert first.cancelled()
+        assert client.get.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_proxy_write_during_get_not_cached():
+    """Test that a get in flight during a write does not cache the old response"""
+    client = make_client(make_response(), delay=0.05)
+    with patch("api.proxy.httpx.AsyncClient", return_value=client):
+        proxy = DeviceProxy(2, 10)
+        get = asyncio.create_task(proxy.request("get", "http://192.168.1.10/api/config"))
+        await asyncio.sleep(0.01)
+        await proxy.request("post", "http://192.168.1.10/api/config", body="{}")
+        await get
+
+        await proxy.request("get", "http://192.168.1.10/api/config")
+        assert client.get.call_count == 2
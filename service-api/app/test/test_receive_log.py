@@ -1,5 +1,5 @@
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from api.config import get_settings
 from api.db import models
 from api.db.session import create_session
@@ -210,3 +210,64 @@ def test_receive_logs_ip_address_formats(app_client):
     ip_addresses = [record["ipAddress"] for record in data["data"]]
     assert "192.168.1.1" in ip_addresses
     assert "2001:0db8:85a3:0000:0000:8a2e:0370:7334" in ip_addresses
+
+
+def test_receive_logs_cursor(app_client):
+    """Test paging with the cursor and filtering by ip address"""
+    test_init(app_client)
+
+    session = create_session()
+    now = datetime.now()
+    for i in range(5):
+        session.add(models.ReceiveLog(
+            ip_address="10.0.0.1" if i % 2 == 0 else "10.0.0.2",
+            payload=json.dumps({"index": i}),
+            timestamp=now.replace(microsecond=0) - timedelta(seconds=i // 2),
+        ))
+    session.commit()
+    session.close()
+
+    payloads = []
+    cursor = None
+    while True:
+        url = "/api/system/receive?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        r = app_client.get(url, headers=headers)
+        assert r.status_code == 200
+        data = r.json()
+        assert data["total"] == 5
+        payloads += [json.loads(record["payload"])["index"] for record in data["data"]]
+        cursor = data["nextCursor"]
+        if cursor is None:
+            break
+    assert sorted(payloads) == [0, 1, 2, 3, 4]
+    assert len(set(payloads)) == 5
+
+    r = app_client.get("/api/system/receive?ip=10.0.0.1", headers=headers)
+    data = r.json()
+    assert data["total"] == 3
+    assert data["nextCursor"] is None
+    assert all(record["ipAddress"] == "10.0.0.1" for record in data["data"])
+
+    r = app_client.get("/api/system/receive?cursor=invalid", headers=headers)
+    assert r.status_code == 422
+
+
+def test_receive_logs_count_cache(app_client):
+    """Test that the cached total follows inserts and deletes of the oldest rows"""
+    test_init(app_client)
+
+    session = create_session()
+    for i in range(3):
+        session.add(models.ReceiveLog(ip_address="10.0.0.1", payload="{}", timestamp=datetime.now()))
+    session.commit()
+    assert app_client.get("/api/system/receive", headers=headers).json()["total"] == 3
+
+    session.add(models.ReceiveLog(ip_address="10.0.0.1", payload="{}", timestamp=datetime.now()))
+    session.commit()
+    assert app_client.get("/api/system/receive", headers=headers).json()["total"] == 4
+
+    oldest = session.query(models.ReceiveLog).order_by(models.ReceiveLog.id).first()
+    session.delete(oldest)
+    session.commit()
+    session.close()
+    assert app_client.get("/api/system/receive", headers=headers).json()["total"] == 3
@@ -0,0 +1,53 @@
+"""Tests that the row encoded list responses match the pydantic response models."""
+import json
+from api.config import get_settings
+from api.db import schemas
+from api.db.session import create_session
+from api.services import BatchService, GravityService, PressureService, PourService
+from .conftest import create_batch_with_readings
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+    "Content-Type": "application/json",
+}
+
+
+def as_json(schema, objs):
+    """Serialize the way FastAPI does with a response_model"""
+    return [json.loads(schema.model_validate(o).model_dump_json(by_alias=True)) for o in objs]
+
+
+def test_list_responses(app_client):
+    batch_id = create_batch_with_readings()
+    session = create_session()
+
+    for path, service, schema in (
+        ("gravity", GravityService(session), schemas.Gravity),
+        ("pressure", PressureService(session), schemas.Pressure),
+        ("pour", PourService(session), schemas.Pour),
+    ):
+        r = app_client.get(f"/api/{path}/?batchId={batch_id}", headers=headers)
+        assert r.status_code == 200
+        assert r.headers["content-type"] == "application/json"
+        assert r.json() == as_json(schema, service.search_by_batch_id(batch_id))
+
+        r = app_client.get(f"/api/{path}/", headers=headers)
+        assert r.status_code == 200
+        assert r.json() == as_json(schema, service.list())
+
+
+def test_batch_response(app_client):
+    batch_id = create_batch_with_readings()
+    session = create_session()
+    session.expire_all()
+
+    r = app_client.get(f"/api/batch/{batch_id}", headers=headers)
+    assert r.status_code == 200
+    expected = json.loads(
+        schemas.Batch.model_validate(BatchService(session).get(batch_id)).model_dump_json(by_alias=True)
+    )
+    assert r.json() == expected
+    assert len(r.json()["gravity"]) == 3
+
+    r = app_client.get("/api/batch/999999", headers=headers)
+    assert r.status_code == 404
@@ -0,0 +1,74 @@
+"""Tests for the chunked retention of the log tables"""
+from datetime import datetime, timedelta
+from api import retention
+from api.db import models
+from api.db.partition import (
+    is_partitioned,
+    maintain_partitions,
+    month_partition_name,
+    month_start,
+    partition_strategy,
+)
+from api.db.session import create_session, engine
+from api.log import system_log_purge
+from .conftest import truncate_database
+
+
+def add_system_logs(days_old, count):
+    session = create_session()
+    for i in range(count):
+        session.add(models.SystemLog(
+            timestamp=datetime.now() - timedelta(days=days_old),
+            message=f"Message {i}",
+            module="retention",
+            error_code=0,
+            log_level=1,
+        ))
+    session.commit()
+    session.close()
+
+
+def count_system_logs():
+    session = create_session()
+    count = session.query(models.SystemLog).count()
+    session.close()
+    return count
+
+
+def test_apply_retention_chunks(app_client):
+    truncate_database()
+    add_system_logs(120, 5)
+    add_system_logs(1, 2)
+
+    policy = retention.retention_policies()["systemlog"]
+    policy.chunk_size = 2
+    assert retention.apply_retention(policy) == 5
+    assert count_system_logs() == 2
+
+    assert retention.apply_retention(policy) == 0
+    assert count_system_logs() == 2
+
+
+def test_retention_days(app_client):
+    truncate_database()
+    add_system_logs(40, 3)
+    add_system_logs(1, 1)
+
+    assert retention.retention_policies()["systemlog"].days == 90
+    assert system_log_purge() == 0
+    assert count_system_logs() == 4
+
+    assert system_log_purge(days=30) == 3
+    assert count_system_logs() == 1
+
+
+def test_partition_helpers(app_client):
+    assert month_start(datetime(2025, 12, 15)) == datetime(2025, 12, 1)
+    assert month_start(datetime(2025, 12, 15), 1) == datetime(2026, 1, 1)
+    assert month_start(datetime(2025, 1, 31), -1) == datetime(2024, 12, 1)
+    assert month_partition_name("systemlog", datetime(2026, 3, 1)) == "systemlog_p202603"
+
+    with engine.connect() as con:
+        assert not is_partitioned(con, "systemlog")
+        assert partition_strategy(con, "gravity") is None
+    assert maintain_partitions() == []
@@ -0,0 +1,160 @@
+"""Tests for the hourly and daily rollups of the readings"""
+from datetime import datetime
+import pytest
+from sqlalchemy import func, insert, select
+from api import rollup
+from api.config import get_settings
+from api.db import models, schemas
+from api.db.session import create_session, engine
+from api.services import BatchService, GravityService
+from .conftest import create_batch_with_readings
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+    "Content-Type": "application/json",
+}
+
+
+def by_metric(data):
+    return {(d["bucket"], d["metric"]): d for d in data}
+
+
+def test_aggregate():
+    rows = [
+        (datetime(2024, 1, 1, 10, 5), 1.050, None),
+        (datetime(2024, 1, 1, 10, 55), 1.040, 20.0),
+        (datetime(2024, 1, 1, 11, 0), 1.030, 22.0),
+    ]
+    buckets = rollup.aggregate(rows, ["gravity", "temperature"])
+    assert buckets[("h", datetime(2024, 1, 1, 10), "gravity")] == [2, pytest.approx(2.09), 1.040, 1.050]
+    assert buckets[("h", datetime(2024, 1, 1, 10), "temperature")] == [1, 20.0, 20.0, 20.0]
+    assert buckets[("d", datetime(2024, 1, 1), "gravity")][0] == 3
+    assert buckets[("d", datetime(2024, 1, 1), "temperature")] == [2, 42.0, 20.0, 22.0]
+
+
+def test_rollup_endpoint(app_client):
+    batch_id = create_batch_with_readings()
+    rollup.update_rollups()  # Run by the scheduler, the endpoint only reads the rollups
+
+    r = app_client.get(f"/api/batch/{batch_id}/rollup", headers=headers)
+    assert r.status_code == 200
+    data = by_metric(r.json())
+    gravity = data[("2024-01-01T12:00:00", "gravity")]
+    assert gravity["count"] == 2  # The inactive reading is skipped
+    assert gravity["min"] == pytest.approx(1.048)
+    assert gravity["max"] == pytest.approx(1.05)
+    assert gravity["avg"] == pytest.approx(1.049)
+    assert data[("2024-01-01T12:00:00", "pressure")]["count"] == 3
+    assert data[("2024-01-01T12:00:00", "pour")]["avg"] == pytest.approx(0.5)
+    assert ("2024-01-01T12:00:00", "corr_gravity") not in data
+    assert ("2024-01-01T12:00:00", "pressure_temperature") not in data
+
+    r = app_client.get(f"/api/batch/{batch_id}/rollup?period=day", headers=headers)
+    assert by_metric(r.json())[("2024-01-01T00:00:00", "pressure")]["max"] == pytest.approx(102.5)
+
+    r = app_client.get(f"/api/batch/{batch_id}/rollup?period=week", headers=headers)
+    assert r.status_code == 422
+    r = app_client.get("/api/batch/999999/rollup", headers=headers)
+    assert r.status_code == 404
+
+
+def test_rollup_watermark(app_client, monkeypatch):
+    batch_id = create_batch_with_readings()
+    monkeypatch.setattr(rollup, "ROLLUP_CHUNK_SIZE", 2)
+    assert rollup.update_rollups() == 9
+    assert rollup.update_rollups() == 0
+
+    session = create_session()
+    GravityService(session).create(
+        schemas.GravityCreate(
+            temperature=21, gravity=1.02, angle=30, battery=3.9, rssi=-70,
+            corr_gravity=None, batch_id=batch_id, created=datetime(2024, 1, 2, 8, 30), active=True,
+        )
+    )
+    assert rollup.update_rollups() == 1
+
+    data = by_metric(rollup.batch_rollups(batch_id, "day"))
+    assert data[(datetime(2024, 1, 1), "gravity")]["count"] == 2
+    assert data[(datetime(2024, 1, 2), "gravity")]["count"] == 1
+
+
+def test_rollup_late_commit(app_client):
+    batch_id = create_batch_with_readings()
+    rollup.update_rollups()
+    reading = {
+        "temperature": 21, "gravity": 1.02, "angle": 30, "battery": 3.9, "rssi": -70,
+        "batch_id": batch_id, "created": datetime(2024, 1, 2, 8, 30), "active": True,
+    }
+    with engine.begin() as con:
+        last_id = con.execute(select(func.max(models.Gravity.id))).scalar()
+        con.execute(insert(models.Gravity), {**reading, "id": last_id + 10})
+    assert rollup.update_rollups() == 1
+
+    # A lower id committed after the watermark moved past it
+    with engine.begin() as con:
+        con.execute(insert(models.Gravity), {**reading, "id": last_id + 5})
+    rollup.update_rollups()
+
+    data = by_metric(rollup.batch_rollups(batch_id, "day"))
+    assert data[(datetime(2024, 1, 2), "gravity")]["count"] == 2
+
+
+def test_rollup_refresh(app_client):
+    batch_id = create_batch_with_readings()
+    r = app_client.get(f"/api/gravity/?batchId={batch_id}", headers=headers)
+    first = r.json()[0]
+
+    r = app_client.patch(f"/api/gravity/{first['id']}", json={**first, "active": False}, headers=headers)
+    assert r.status_code == 200
+
+    r = app_client.get(f"/api/batch/{batch_id}/rollup", headers=headers)
+    assert by_metric(r.json())[("2024-01-01T12:00:00", "gravity")]["count"] == 1
+
+
+def test_compare_batches(app_client):
+    first = create_batch_with_readings()
+
+    # Second batch pitched a month later, aligned to its own first reading
+    session = create_session()
+    second = BatchService(session).create(
+        schemas.BatchCreate(
+            name="Second", description="", chip_id_gravity="", chip_id_pressure="", active=True,
+            tap_list=False, brew_date="2024-02-01", style="", brewer="", abv=5.0, ebc=10, ibu=30,
+            brewfather_id="", fermentation_steps="[]",
+        )
+    ).id
+    service = GravityService(session)
+    for hour, gravity in ((0, 1.050), (1, 1.040), (2, 1.030), (2, 1.032), (5, 1.020)):
+        service.create(
+            schemas.GravityCreate(
+                temperature=20, gravity=gravity, angle=30, battery=3.9, rssi=-70,
+                corr_gravity=None, batch_id=second, created=datetime(2024, 2, 1, 8 + hour, 30), active=True,
+            ),
+            commit=False,
+        )
+    session.commit()
+    rollup.update_rollups()
+
+    r = app_client.get(f"/api/batch/compare?batchId={first}&batchId={second}&batchId=999999", headers=headers)
+    assert r.status_code == 200
+    data = {d["batchId"]: d for d in r.json()}
+    assert data[first]["start"] == "2024-01-01T12:00:00"
+    assert data[first]["hours"] == [0.0]
+    assert data[first]["values"] == [pytest.approx(1.049)]
+    assert data[second]["start"] == "2024-02-01T08:00:00"
+    assert data[second]["hours"] == [0.0, 1.0, 2.0, 5.0]
+    assert data[second]["values"][2] == pytest.approx(1.031)
+    assert data[999999] == {"batchId": 999999, "metric": "gravity", "start": None, "hours": [], "values": []}
+
+    # Buckets of 2 hours are averaged by the number of readings
+    r = app_client.get(f"/api/batch/compare?batchId={second}&hours=2", headers=headers)
+    assert r.json()[0]["hours"] == [0.0, 2.0, 4.0]
+    assert r.json()[0]["values"][0] == pytest.approx(1.045)
+    assert r.json()[0]["values"][1] == pytest.approx(1.031)
+
+    r = app_client.get(f"/api/batch/compare?batchId={first}&metric=pressure", headers=headers)
+    assert r.json()[0]["values"] == [pytest.approx(101.5)]
+    r = app_client.get(f"/api/batch/compare?batchId={first}&metric=volume", headers=headers)
+    assert r.status_code == 422
+    r = app_client.get("/api/batch/compare", headers=headers)
+    assert r.status_code == 422
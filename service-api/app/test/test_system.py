@@ -1,5 +1,6 @@
 import json
 from datetime import datetime
+from unittest.mock import patch
 from api.config import get_settings
 from .conftest import truncate_database
 
@@ -36,6 +37,24 @@ def test_self_test_endpoint(app_client):
     assert isinstance(data["ble"], list)
 
 
+def test_self_test_ble_status(app_client):
+    """Test that BLE device hashes are flattened into name/value pairs"""
+    test_init(app_client)
+
+    with patch("api.routers.system.find_key") as mock_find, \
+         patch("api.routers.system.read_hash") as mock_hash:
+        mock_find.side_effect = lambda pattern: [b"ble_red"] if pattern == "ble_*" else []
+        mock_hash.return_value = {b"type": b"tilt", b"gravity": b"1.05"}
+
+        r = app_client.get("/api/system/self_test/", headers=headers)
+        assert r.status_code == 200
+        data = json.loads(r.text)
+
+        assert {"name": "ble_red_type", "value": "tilt"} in data["ble"]
+        assert {"name": "ble_red_gravity", "value": "1.05"} in data["ble"]
+        mock_hash.assert_called_once_with(b"ble_red")
+
+
 def test_scheduler_status_endpoint(app_client):
     """Test the scheduler status endpoint"""
     test_init(app_client)
@@ -174,3 +193,60 @@ def test_system_mdns_post(app_client):
     r = app_client.post("/api/system/mdns", json=mdns_data, headers=headers)
     assert r.status_code == 201
 
+
+def test_system_mdns_post_list(app_client):
+    """Test posting and removing a batch of MDNS entries"""
+    from unittest.mock import patch
+
+    mdns_list = [
+        {"name": "gravitymon1", "type": "_gravitymon._tcp.local.", "host": "192.168.1.100:80"},
+        {"name": "kegmon1", "type": "_kegmon._tcp.local.", "host": "192.168.1.101:80"},
+    ]
+
+    with patch("api.routers.system.write_registry") as mock_write:
+        r = app_client.post("/api/system/mdns", json=mdns_list, headers=headers)
+        assert r.status_code == 201
+        assert mock_write.call_args[0][0] == "mdns"
+        values = mock_write.call_args[0][1]
+        assert list(values) == ["192.168.1.100:80_gravitymon._tcp.local.", "192.168.1.101:80_kegmon._tcp.local."]
+        assert json.loads(values["192.168.1.101:80_kegmon._tcp.local."])["name"] == "kegmon1"
+
+    with patch("api.routers.system.remove_registry") as mock_remove:
+        r = app_client.post("/api/system/mdns/remove", json=mdns_list[1:], headers=headers)
+        assert r.status_code == 204
+        mock_remove.assert_called_once_with("mdns", ["192.168.1.101:80_kegmon._tcp.local."])
+
+
+
+def test_system_log_filters(app_client):
+    """Test filtering system logs by module and minimum level with cursor paging"""
+    test_init(app_client)
+
+    for i in range(6):
+        log_data = {
+            "message": f"Message {i}",
+            "module": "filter_a" if i < 4 else "filter_b",
+            "errorCode": 0,
+            "logLevel": i % 3,
+            "timestamp": datetime.now().isoformat(),
+        }
+        r = app_client.post("/api/system/log/", json=log_data, headers=headers)
+        assert r.status_code == 201
+
+    r = app_client.get("/api/system/log/?module=filter_a&limit=2", headers=headers)
+    data = r.json()
+    assert data["total"] == 4
+    assert [d["message"] for d in data["data"]] == ["Message 3", "Message 2"]
+
+    r = app_client.get(f"/api/system/log/?module=filter_a&limit=2&cursor={data['nextCursor']}", headers=headers)
+    data = r.json()
+    assert [d["message"] for d in data["data"]] == ["Message 1", "Message 0"]
+    assert data["nextCursor"] is None
+
+    r = app_client.get("/api/system/log/?module=filter_a&level=2", headers=headers)
+    data = r.json()
+    assert data["total"] == 1
+    assert data["data"][0]["message"] == "Message 2"
+
+    r = app_client.get("/api/system/log/?module=filter_a&skip=3", headers=headers)
+    assert [d["message"] for d in r.json()["data"]] == ["Message 0"]
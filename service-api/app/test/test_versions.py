@@ -0,0 +1,141 @@
+"""Tests for the table versions and conditional GET with ETags"""
+from unittest.mock import patch
+import pytest
+from api.config import get_settings
+from api.db import schemas
+from api.db.session import create_session
+from api.services import BatchService, DeviceService
+from api.versions import TableVersions, mark_changed, table_versions
+from .conftest import create_batch_with_readings
+
+headers = {
+    "Authorization": "Bearer " + get_settings().api_key,
+    "Content-Type": "application/json",
+}
+
+
+def test_table_versions():
+    versions = TableVersions()
+    first = versions.etag(("batch", "gravity"))
+    versions.bump("gravity")
+    assert versions.etag(("batch", "gravity")) != first
+    assert versions.etag(("batch", "gravity")) == f'"{versions.epoch}-0-1"'
+    assert TableVersions().etag(("batch", "gravity")) != first  # New epoch after a restart
+
+
+def test_bumped_after_commit(app_client):
+    session = create_session()
+    etag = table_versions.etag(("device",))
+
+    session.connection()
+    mark_changed(session, "device")
+    assert table_versions.etag(("device",)) == etag
+    session.rollback()
+    session.commit()
+    assert table_versions.etag(("device",)) == etag
+
+    mark_changed(session, "device")
+    session.commit()
+    assert table_versions.etag(("device",)) != etag
+
+
+@pytest.mark.parametrize("url", ["/api/batch/", "/api/batch/taplist", "/api/device/"])
+def test_not_modified(app_client, url):
+    create_batch_with_readings()
+
+    r = app_client.get(url, headers=headers)
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+
+    # The version matches, answered without a database query
+    with patch.object(BatchService, "list_filtered", side_effect=AssertionError), \
+         patch.object(BatchService, "search_tap_list", side_effect=AssertionError), \
+         patch.object(DeviceService, "list", side_effect=AssertionError):
+        r = app_client.get(url, headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+
+    r = app_client.get(url, headers={**headers, "If-None-Match": '"other"'})
+    assert r.status_code == 200
+
+
+def test_dashboard_etag(app_client):
+    batch_id = create_batch_with_readings()
+    r = app_client.get(f"/api/batch/{batch_id}/dashboard", headers=headers)
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    r = app_client.get(f"/api/batch/{batch_id}/dashboard", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+
+    # A new reading changes the version of the gravity table
+    r = app_client.post("/api/gravity/", json={
+        "temperature": 20, "gravity": 1.03, "angle": 30, "battery": 3.9, "rssi": -70,
+        "corrGravity": None, "batchId": batch_id, "created": "2024-01-02T12:00:00", "active": True,
+    }, headers=headers)
+    assert r.status_code == 201
+    r = app_client.get(f"/api/batch/{batch_id}/dashboard", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert r.json()["gravity"][-1]["gravity"] == pytest.approx(1.03)
+
+
+def test_device_change(app_client):
+    create_batch_with_readings()
+    r = app_client.get("/api/device/", headers=headers)
+    etag = r.headers["ETag"]
+
+    DeviceService(create_session()).create(
+        schemas.DeviceCreate(
+            chip_id="VER001", chip_family="esp32", software="Gravitymon", mdns="gravity1",
+            config="", ble_color="", url="", description="", collect_logs=False,
+        )
+    )
+    r = app_client.get("/api/device/", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()[0]["chipId"] == "VER001"
+
+
+def test_cached_body(app_client):
+    create_batch_with_readings()
+    with patch("api.versions.read_key", return_value=b'[{"cached": true}]'), \
+         patch.object(BatchService, "search_tap_list", side_effect=AssertionError):
+        r = app_client.get("/api/batch/taplist", headers=headers)
+    assert r.status_code == 200
+    assert r.json() == [{"cached": True}]
+
+    with patch("api.versions.write_bytes") as write_bytes:
+        r = app_client.get("/api/batch/taplist", headers=headers)
+    key, body, _ = write_bytes.call_args[0]
+    assert key.endswith(r.headers["ETag"])
+    assert body == r.content
+
+
+def test_fermentation_step_change(app_client):
+    create_batch_with_readings()
+    device = DeviceService(create_session()).create(
+        schemas.DeviceCreate(
+            chip_id="VER002", chip_family="esp32", software="Chamber-Controller", mdns="chamber1",
+            config="", ble_color="", url="", description="", collect_logs=False,
+        )
+    )
+    r = app_client.get("/api/device/", headers=headers)
+    etag = r.headers["ETag"]
+
+    step = {
+        "order": 0, "name": "Primary", "type": "Primary", "date": "2024-10-05",
+        "temp": 20.0, "days": 7, "deviceId": device.id,
+    }
+    r = app_client.post(f"/api/device/{device.id}/step", json=[step], headers=headers)
+    assert r.status_code == 201
+    r = app_client.get("/api/device/", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert r.json()[0]["fermentationStep"][0]["name"] == "Primary"
+
+    # Steps removed by the cascade when the device is deleted
+    etag = r.headers["ETag"]
+    r = app_client.delete(f"/api/device/{device.id}", headers=headers)
+    assert r.status_code == 204
+    r = app_client.get("/api/device/", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json() == []
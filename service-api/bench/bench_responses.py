@@ -0,0 +1,104 @@
+#
+# Benchmark for the gravity list response, ORM objects and response_model compared to row encoding
+#
+#   cd service-api/app && python3 ../bench/bench_responses.py [rows] [rounds]
+#
+# Creates a temporary sqlite database with one batch and the requested number of gravity
+# readings (default 100000) and measures GET /api/gravity/?batchId= with the previous
+# implementation (ORM objects validated and serialized through response_model) and the
+# current one (row tuples encoded with orjson). The two responses are compared to make
+# sure they contain the same data.
+#
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+database = os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+os.environ["DATABASE_URL"] = "sqlite:///" + database
+sys.path.insert(0, os.getcwd())
+
+from typing import List, Optional
+
+from fastapi import Depends, FastAPI, Query
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from api.config import get_settings
+from api.db import models, schemas
+from api.db.session import create_session, engine
+from api.main import register_handlers
+from api.services import GravityService, get_gravity_service
+
+headers = {"Authorization": "Bearer " + get_settings().api_key}
+
+
+def populate(rows):
+    session = create_session()
+    batch = models.Batch(
+        name="Benchmark", description="", chip_id_gravity="BENCH1", chip_id_pressure="", active=True,
+        tap_list=True, brew_date="", style="", brewer="", abv=0, ebc=0, ibu=0, brewfather_id="",
+        fermentation_steps="",
+    )
+    session.add(batch)
+    session.commit()
+
+    start = datetime(2024, 1, 1)
+    values = [
+        {
+            "temperature": 20 + (i % 50) / 10, "gravity": 1.060 - i / rows / 50, "velocity": None,
+            "angle": 45 - i / rows * 20, "battery": 4.1, "rssi": -70, "corr_gravity": 1.059,
+            "run_time": 1.5, "created": start + timedelta(seconds=i * 30, microseconds=i % 1000),
+            "active": True, "batch_id": batch.id,
+        }
+        for i in range(rows)
+    ]
+    with engine.begin() as con:
+        con.execute(insert(models.Gravity), values)
+    return batch.id
+
+
+def legacy_app():
+    """The list endpoint as it was, ORM objects serialized through response_model"""
+    app = FastAPI()
+
+    @app.get("/legacy/gravity/", response_model=List[schemas.Gravity])
+    async def list_gravities(
+        batch_id: Optional[int] = Query(None, alias="batchId"),
+        gravity_service: GravityService = Depends(get_gravity_service),
+    ) -> List[models.Gravity]:
+        return gravity_service.search_by_batch_id(batch_id)
+
+    register_handlers(app)
+    return app
+
+
+def measure(client, url, rounds):
+    best = None
+    for _ in range(rounds):
+        create_session().expunge_all()  # Start without loaded objects
+        start = time.perf_counter()
+        r = client.get(url, headers=headers)
+        elapsed = time.perf_counter() - start
+        assert r.status_code == 200, r.text
+        best = elapsed if best is None else min(best, elapsed)
+    return best, r
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print(f"Creating {rows} gravity readings in {database}")
+    batch_id = populate(rows)
+    client = TestClient(legacy_app())
+
+    legacy, r1 = measure(client, f"/legacy/gravity/?batchId={batch_id}", rounds)
+    print(f"response_model (ORM + pydantic) {legacy * 1000:8.1f} ms  {len(r1.content) / 1e6:.1f} MB")
+    current, r2 = measure(client, f"/api/gravity/?batchId={batch_id}", rounds)
+    print(f"row tuples + orjson             {current * 1000:8.1f} ms  {len(r2.content) / 1e6:.1f} MB")
+
+    assert r1.json() == r2.json(), "Responses differ"
+    print(f"\nRow encoding is {legacy / current:.1f}x faster, best of {rounds} rounds")
+    os.remove(database)
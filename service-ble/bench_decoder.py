@@ -0,0 +1,86 @@
+#
+# Micro-benchmark for the BLE advertisement decoder
+#
+#   python3 bench_decoder.py [iterations]
+#
+# Feeds one sample advertisement of each supported format (and one unknown ibeacon)
+# through decoder.decode and reports the time per advertisement. If the construct
+# package is installed the previous approach, trying every parser in turn and
+# relying on exceptions, is measured as a reference.
+#
+import struct
+import sys
+import timeit
+from uuid import UUID
+
+from decoder import APPLE_ID, RAPT_ID, EDDYSTONE_UUID, decode
+
+samples = {
+    "gravitymon": ("", {APPLE_ID: b"\x03\x15GRAVMON." + struct.pack(">IHHHH", 0xabcdef, 2500, 4100, 10450, 20500)}, {}),
+    "pressuremon": ("", {APPLE_ID: b"\x03\x15PRESMON." + struct.pack(">IHHHH", 0xabcdef, 1500, 0xffff, 4100, 20500)}, {}),
+    "chamber": ("", {APPLE_ID: b"\x03\x15CHAMBER." + struct.pack(">IHH", 0xabcdef, 18000, 19500)}, {}),
+    "tilt": ("", {APPLE_ID: b"\x02\x15" + UUID("A495BB10-C5B1-4B44-B512-1370F02D74DE").bytes + struct.pack(">HHb", 68, 1045, -59)}, {}),
+    "rapt": ("", {RAPT_ID: b"PT\x01" + bytes(6) + struct.pack(">HfHHHH", 37500, 1.045, 16, 16, 16, 1000)}, {}),
+    "rapt2": ("", {RAPT_ID: b"PT\x02\x00\x01" + struct.pack(">fHfHHHH", 1.5, 37500, 1.045, 16, 16, 16, 1000)}, {}),
+    "eddystone": ("gravitymon", {}, {EDDYSTONE_UUID: b"\x20\x00" + struct.pack(">HHHHI", 4100, 20500, 10450, 2500, 0xabcdef)}),
+    "unknown": ("", {APPLE_ID: b"\x02\x15" + bytes(16) + struct.pack(">HHb", 1, 2, -59)}, {}),
+}
+
+
+def legacy_decoder():
+    try:
+        from construct import Array, Byte, Const, Int8sl, Int16ub, Int32ub, Float32b, Struct
+        from construct.core import ConstError
+    except ImportError:
+        return None
+
+    formats = [
+        (APPLE_ID, Struct("type_length" / Const(b"\x03\x15"), "name" / Const(b"GRAVMON."), "chipid" / Int32ub, "angle" / Int16ub, "battery" / Int16ub, "gravity" / Int16ub, "temp" / Int16ub)),
+        (APPLE_ID, Struct("type_length" / Const(b"\x03\x15"), "name" / Const(b"PRESMON."), "chipid" / Int32ub, "pressure" / Int16ub, "pressure1" / Int16ub, "battery" / Int16ub, "temp" / Int16ub)),
+        (APPLE_ID, Struct("type_length" / Const(b"\x03\x15"), "name" / Const(b"CHAMBER."), "chipid" / Int32ub, "chamberTemp" / Int16ub, "beerTemp" / Int16ub)),
+        (APPLE_ID, Struct("type_length" / Const(b"\x02\x15"), "uuid" / Array(16, Byte), "major" / Int16ub, "minor" / Int16ub, "power" / Int8sl)),
+        (RAPT_ID, Struct("tag" / Const(b"PT\x01"), "mac" / Array(6, Byte), "temp" / Int16ub, "gravity" / Float32b, "x" / Int16ub, "y" / Int16ub, "z" / Int16ub, "battery" / Int16ub)),
+        (RAPT_ID, Struct("tag" / Const(b"PT\x02"), "padding" / Byte, "velocity_valid" / Byte, "velocity" / Float32b, "temp" / Int16ub, "gravity" / Float32b, "x" / Int16ub, "y" / Int16ub, "z" / Int16ub, "battery" / Int16ub)),
+    ]
+    eddystone = Struct("type_length" / Const(b"\x20\x00"), "battery" / Int16ub, "temp" / Int16ub, "gravity" / Int16ub, "angle" / Int16ub, "chipid" / Int32ub)
+
+    def decode_all(name, manufacturer_data, service_data):
+        if name == "gravitymon" and EDDYSTONE_UUID in service_data:
+            return eddystone.parse(service_data[EDDYSTONE_UUID])
+        result = None
+        for id, format in formats:
+            try:
+                result = format.parse(manufacturer_data[id])
+            except (KeyError, ConstError):
+                pass
+        return result
+
+    return decode_all
+
+
+def run(name, func, iterations):
+    print(f"{name}:")
+    total = 0.0
+    for sample, args in samples.items():
+        t = timeit.timeit(lambda: func(*args), number=iterations)
+        total += t
+        print(f"  {sample:<12} {t / iterations * 1e6:8.2f} us/adv")
+    print(f"  {'average':<12} {total / (iterations * len(samples)) * 1e6:8.2f} us/adv")
+    return total
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    for sample, args in samples.items():
+        print(f"{sample:<12} {decode(*args)}")
+    print()
+
+    dispatch = run("Dispatch decoder", decode, iterations)
+
+    legacy = legacy_decoder()
+    if legacy is None:
+        print("\nconstruct is not installed, skipping the legacy decoder.")
+    else:
+        legacy = run("Legacy decoder (construct, try every format)", legacy, iterations)
+        print(f"\nDispatch decoder is {legacy / dispatch:.1f}x faster")
@@ -0,0 +1,80 @@
+#
+# On-disk ring buffer for readings that could not be posted to the API
+#
+# Readings are stored in a small sqlite database and returned per device in the order
+# they were read, readings can arrive late from the retry path. When the buffer is
+# full the first inserted readings are removed so disk usage stays bounded.
+#
+import json
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+class OfflineBuffer:
+    def __init__(self, file_name, max_rows):
+        self.max_rows = max_rows
+        self.db = sqlite3.connect(file_name)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS reading ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "kind TEXT NOT NULL, "
+            "device TEXT NOT NULL, "
+            "created REAL NOT NULL, "
+            "payload TEXT NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS ix_reading_device ON reading (device, created)")
+        self.db.commit()
+
+        # Devices with buffered readings, new readings for these are buffered to keep the order
+        self.pending = set(r[0] for r in self.db.execute("SELECT DISTINCT device FROM reading"))
+        logger.info(f"Offline buffer {file_name} opened, {self.count()} readings waiting.")
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM reading").fetchone()[0]
+
+    def has_pending(self, device):
+        return device in self.pending
+
+    def add(self, kind, device, created, payload):
+        cur = self.db.execute(
+            "INSERT INTO reading (kind, device, created, payload) VALUES (?, ?, ?, ?)",
+            (kind, device, created, json.dumps(payload)),
+        )
+        # Keep the newest max_rows readings
+        removed = self.db.execute("DELETE FROM reading WHERE id <= ?", (cur.lastrowid - self.max_rows,)).rowcount
+        self.db.commit()
+        self.pending.add(device)
+
+        if removed > 0:
+            logger.warning(f"Offline buffer is full, removed {removed} oldest readings.")
+            self.pending = set(r[0] for r in self.db.execute("SELECT DISTINCT device FROM reading"))
+
+    def devices(self):
+        """Return (kind, device) with buffered readings, the device with the oldest reading first."""
+        return self.db.execute(
+            "SELECT kind, device FROM reading GROUP BY kind, device ORDER BY MIN(created)"
+        ).fetchall()
+
+    def peek(self, kind, device, limit):
+        """Return the oldest buffered readings of a kind for a device as (id, kind, created, payload)."""
+        rows = self.db.execute(
+            "SELECT id, kind, created, payload FROM reading WHERE kind = ? AND device = ? "
+            "ORDER BY created, id LIMIT ?",
+            (kind, device, limit),
+        ).fetchall()
+        return [(id, kind, created, json.loads(payload)) for id, kind, created, payload in rows]
+
+    def remove(self, device, ids):
+        """Remove buffered readings for a device that have been uploaded."""
+        self.db.executemany("DELETE FROM reading WHERE id = ?", [(id,) for id in ids])
+        self.db.commit()
+
+        if self.db.execute("SELECT 1 FROM reading WHERE device = ? LIMIT 1", (device,)).fetchone() is None:
+            self.pending.discard(device)
+
+    def close(self):
+        self.db.close()
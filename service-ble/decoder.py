@@ -0,0 +1,210 @@
+#
+# Decoders for the BLE advertisement formats handled by the scanner.
+#
+# Each advertisement is routed on manufacturer id (or service uuid) and the first
+# payload bytes to exactly one decoder, the decoders use precompiled struct formats.
+#
+#   Apple 0x004C   \x03\x15GRAVMON.  gravitymon ibeacon
+#                  \x03\x15PRESMON.  pressuremon ibeacon
+#                  \x03\x15CHAMBER.  chamber controller ibeacon
+#                  \x02\x15          tilt ibeacon
+#   RAPT 0x4152    PT\x01            rapt v1
+#                  PT\x02            rapt v2
+#   Eddystone      \x20\x00          gravitymon eddystone (device name gravitymon)
+#
+# Gravitymon sends its eddystone data as a TLM frame (\x20\x00) of the same length as a
+# standard TLM frame, so the device name is used to tell them apart. Passive scans get no
+# scan response and often no name, then the frame is accepted when the gravity and angle
+# fields are in the range of a hydrometer. In a standard TLM frame these fields hold the
+# advertisement counter, which is far outside these ranges for any device in practice.
+#
+import struct
+from uuid import UUID
+
+APPLE_ID = 0x004C
+RAPT_ID = 0x4152
+EDDYSTONE_UUID = "0000feaa-0000-1000-8000-00805f9b34fb"
+
+gravitymon_ibeacon_format = struct.Struct(">IHHHH") # chipid, angle, battery, gravity, temp
+pressuremon_ibeacon_format = struct.Struct(">IHHHH") # chipid, pressure, pressure1, battery, temp
+chamber_ibeacon_format = struct.Struct(">IHH") # chipid, chamberTemp, beerTemp
+gravitymon_eddystone_format = struct.Struct(">HHHHI") # battery, temp, gravity, angle, chipid
+tilt_format = struct.Struct(">16sHHb") # uuid, major, minor, power
+rapt_v1_format = struct.Struct(">6sHfHHHH") # mac, temp, gravity, x, y, z, battery
+rapt_v2_format = struct.Struct(">BBfHfHHHH") # padding, velocity_valid, velocity, temp, gravity, x, y, z, battery
+
+tilt_colors = {
+    UUID("A495BB10-C5B1-4B44-B512-1370F02D74DE").bytes: "red",
+    UUID("A495BB20-C5B1-4B44-B512-1370F02D74DE").bytes: "green",
+    UUID("A495BB30-C5B1-4B44-B512-1370F02D74DE").bytes: "black",
+    UUID("A495BB40-C5B1-4B44-B512-1370F02D74DE").bytes: "purple",
+    UUID("A495BB50-C5B1-4B44-B512-1370F02D74DE").bytes: "orange",
+    UUID("A495BB60-C5B1-4B44-B512-1370F02D74DE").bytes: "blue",
+    UUID("A495BB70-C5B1-4B44-B512-1370F02D74DE").bytes: "yellow",
+    UUID("A495BB80-C5B1-4B44-B512-1370F02D74DE").bytes: "pink",
+}
+
+
+class Reading:
+    def __init__(self, type, id, values):
+        self.type = type # gravitymon/pressuremon/chamber/tilt/rapt/rapt2
+        self.id = id # chip id, tilt color or mac address
+        self.values = values # decoded and scaled values, None when not available
+
+    def __repr__(self):
+        return f"Reading({self.type}, {self.id}, {self.values})"
+
+
+# Raw limits for an unnamed gravitymon eddystone frame: gravity 0.9-1.3 SG, angle 0-90 degrees
+eddystone_gravity_range = (9000, 13000)
+eddystone_max_angle = 9000
+
+
+def scale(value, divider):
+    return None if value == 0xffff else float(value) / divider
+
+
+def decode_gravitymon(data):
+    chipid, angle, battery, gravity, temp = gravitymon_ibeacon_format.unpack_from(data, 10)
+    return Reading("gravitymon", hex(chipid)[2:], {
+        "battery": scale(battery, 1000),
+        "gravity": scale(gravity, 10000),
+        "angle": scale(angle, 100),
+        "temperature": scale(temp, 1000),
+    })
+
+
+def decode_gravitymon_eddystone(data):
+    battery, temp, gravity, angle, chipid = gravitymon_eddystone_format.unpack_from(data, 2)
+    return Reading("gravitymon", hex(chipid)[2:], {
+        "battery": scale(battery, 1000),
+        "gravity": scale(gravity, 10000),
+        "angle": scale(angle, 100),
+        "temperature": scale(temp, 1000),
+    })
+
+
+def is_gravitymon_eddystone(data):
+    """Check that a TLM frame without device name holds gravitymon values."""
+    if len(data) != gravitymon_eddystone_format.size + 2:
+        return False
+    _, _, gravity, angle, _ = gravitymon_eddystone_format.unpack_from(data, 2)
+    low, high = eddystone_gravity_range
+    return low <= gravity <= high and angle <= eddystone_max_angle
+
+
+def decode_pressuremon(data):
+    chipid, pressure, pressure1, battery, temp = pressuremon_ibeacon_format.unpack_from(data, 10)
+    return Reading("pressuremon", hex(chipid)[2:], {
+        "battery": scale(battery, 1000),
+        "pressure": scale(pressure, 100),
+        "pressure1": scale(pressure1, 100),
+        "temperature": scale(temp, 1000),
+    })
+
+
+def decode_chamber(data):
+    chipid, chamber_temp, beer_temp = chamber_ibeacon_format.unpack_from(data, 10)
+    return Reading("chamber", hex(chipid)[2:], {
+        "chamber-temp": scale(chamber_temp, 1000),
+        "beer-temp": scale(beer_temp, 1000),
+    })
+
+
+def decode_tilt(data):
+    uuid, major, minor, _ = tilt_format.unpack_from(data, 2)
+    color = tilt_colors.get(uuid)
+    if color is None:
+        return None # Some other ibeacon
+
+    if minor > 5000: # Check if the data is related to TILT PRO (higher resolution)
+        temp = major / 10
+        gravity = minor / 10000
+    else:
+        temp = major
+        gravity = minor / 1000
+
+    return Reading("tilt", color, {
+        "gravity": float(gravity),
+        "temperature": float(temp), # Farenheit
+    })
+
+
+def decode_rapt_v1(data):
+    mac, temp, gravity, x, y, z, battery = rapt_v1_format.unpack_from(data, 3)
+    return Reading("rapt", ":".join(f"{b:02x}" for b in mac), {
+        "temperature": float(temp) / 128 - 273.15,
+        "gravity": float(gravity),
+        "x": x / 16,
+        "y": y / 16,
+        "z": z / 16,
+        "battery": float(battery) / 256,
+    })
+
+
+def decode_rapt_v2(data):
+    _, velocity_valid, velocity, temp, gravity, x, y, z, battery = rapt_v2_format.unpack_from(data, 3)
+    return Reading("rapt2", None, { # The v2 format has no mac, the device address is used
+        "temperature": temp / 128 - 273.15,
+        "velocity_valid": velocity_valid == 1,
+        "velocity": 0.0 if velocity_valid == 0 else velocity,
+        "gravity": gravity,
+        "x": x / 16,
+        "y": y / 16,
+        "z": z / 16,
+        "battery": battery / 256,
+    })
+
+
+# (manufacturer id or service uuid, payload prefix) -> decoder
+decoders = {
+    (APPLE_ID, b"\x03\x15GRAVMON."): decode_gravitymon,
+    (APPLE_ID, b"\x03\x15PRESMON."): decode_pressuremon,
+    (APPLE_ID, b"\x03\x15CHAMBER."): decode_chamber,
+    (APPLE_ID, b"\x02\x15"): decode_tilt,
+    (RAPT_ID, b"PT\x01"): decode_rapt_v1,
+    (RAPT_ID, b"PT\x02"): decode_rapt_v2,
+    (EDDYSTONE_UUID, b"\x20\x00"): decode_gravitymon_eddystone,
+}
+
+# Prefix lengths to try for each manufacturer id or service uuid, longest first
+prefix_lengths = {}
+for source, prefix in decoders:
+    prefix_lengths.setdefault(source, set()).add(len(prefix))
+prefix_lengths = {k: sorted(v, reverse=True) for k, v in prefix_lengths.items()}
+
+
+def lookup(source, data):
+    for length in prefix_lengths.get(source, ()):
+        decoder = decoders.get((source, bytes(data[:length])))
+        if decoder is not None:
+            return decoder
+    return None
+
+
+def decode(name, manufacturer_data, service_data):
+    """
+    Route an advertisement to the one decoder that matches its manufacturer id and
+    payload prefix. Returns a Reading or None if the format is not supported.
+    """
+    sources = []
+    for id, data in manufacturer_data.items():
+        sources.append((id, data))
+
+    # Eddystone TLM frames share the prefix so only accept them from gravitymon, or from
+    # an unnamed device (passive scan) when the values fit a gravitymon
+    eddystone = service_data.get(EDDYSTONE_UUID)
+    if eddystone is not None and (
+        name == "gravitymon" or (name is None and is_gravitymon_eddystone(eddystone))
+    ):
+        sources.append((EDDYSTONE_UUID, eddystone))
+
+    for source, data in sources:
+        decoder = lookup(source, data)
+        if decoder is None:
+            continue
+        try:
+            return decoder(data)
+        except struct.error:
+            return None # Payload is too short for the format
+    return None
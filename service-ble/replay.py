@@ -0,0 +1,103 @@
+#
+# Replay recorded BLE advertisements through the scanner pipeline without bluetooth hardware
+#
+#   python3 replay.py <capture file> [--push] [--realtime] [--dedup <seconds>]
+#
+# Capture files are written by scan.py when CAPTURE_FILE is set, one json object per line:
+#
+#   {"time": 1700000000.0, "address": "AA:BB:CC:DD:EE:FF", "name": "gravitymon", "rssi": -60,
+#    "manufacturer_data": {"76": "0315475241564d4f4e2e..."}, "service_data": {}}
+#
+# By default nothing is sent to the API or redis, use --push (with API_HOST and optionally
+# REDIS_HOST defined) to post the readings. The advertisement timestamps are honored by the
+# duplicate filter; with --realtime the replay also sleeps between advertisements.
+#
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+os.environ.setdefault("API_HOST", "localhost")
+
+import httpx
+import redis
+
+import scan
+
+logger = logging.getLogger(__name__)
+
+
+def load(file_name):
+    with open(file_name) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            record = json.loads(line)
+            yield (
+                record.get("time", 0),
+                record.get("address", ""),
+                record.get("name"),
+                record.get("rssi", 0),
+                {int(k): bytes.fromhex(v) for k, v in record.get("manufacturer_data", {}).items()},
+                {k: bytes.fromhex(v) for k, v in record.get("service_data", {}).items()},
+            )
+
+
+async def replay(file_name, realtime):
+    clock = [0.0]
+    scan.clock = lambda: clock[0] # Use the recorded time for interval and duplicate checks
+
+    readings = {}
+    previous = None
+
+    for timestamp, address, name, rssi, manufacturer_data, service_data in load(file_name):
+        if realtime and previous is not None and timestamp > previous:
+            await asyncio.sleep(timestamp - previous)
+        previous = timestamp
+        clock[0] = timestamp
+
+        reading = scan.process_advertisement(address, name, rssi, manufacturer_data, service_data)
+        if reading is not None:
+            readings[reading.type] = readings.get(reading.type, 0) + 1
+            logger.info(f"{address} {reading}")
+
+        await asyncio.sleep(0) # Let the posting workers run
+
+    return readings
+
+
+async def main(args):
+    scan.skip_push = not args.push
+    scan.minium_interval = int(os.getenv("MIN_INTERVAL", 5 * 60))
+    scan.dedup_interval = args.dedup
+    scan.post_queue = asyncio.Queue(maxsize=scan.post_queue_size)
+
+    redis_host = os.getenv("REDIS_HOST")
+    if args.push and redis_host is not None:
+        scan.redis_client = redis.Redis(connection_pool=redis.ConnectionPool(host=redis_host, port=6379, db=0))
+
+    async with httpx.AsyncClient(headers=scan.headers) as client:
+        workers = [asyncio.create_task(scan.post_worker(client)) for _ in range(scan.post_workers)]
+        readings = await replay(args.file, args.realtime)
+        await scan.post_queue.join()
+        for w in workers:
+            w.cancel()
+
+    print(f"Advertisements: {scan.stats}")
+    print(f"Readings: {readings}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)-15s %(name)-8s %(levelname)s: %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(description="Replay captured BLE advertisements")
+    parser.add_argument("file", help="Capture file, one json advertisement per line")
+    parser.add_argument("--push", action="store_true", help="Post readings to API_HOST and status to REDIS_HOST")
+    parser.add_argument("--realtime", action="store_true", help="Sleep between advertisements as recorded")
+    parser.add_argument("--dedup", type=int, default=scan.dedup_interval, help="Duplicate filter interval in seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -1,19 +1,20 @@
 import asyncio
 import logging
 import json
-import requests
+import random
 import time
 import os
+from datetime import datetime
+import httpx
 import redis
-from uuid import UUID
-
-from construct import Array, Byte, Const, Int8sl, Int16ub, Int32ub, Float32b, Struct
-from construct.core import ConstError
 
 from bleak import BleakScanner
 from bleak.backends.device import BLEDevice
 from bleak.backends.scanner import AdvertisementData
 
+from buffer import OfflineBuffer
+from decoder import Reading, decode
+
 logger = logging.getLogger(__file__)
 
 # Configuration options for this script
@@ -23,180 +24,297 @@ skip_pressuremon = False # Dont detect pressuremon devices
 skip_gravitymon = False # Dont detect gravitymon devices
 skip_null_values = True # Will remove attributes with null values before sending to API
 
-# Write the following keys to redis to share the current status
-# ble_<chipid>_last : <update time>
-# ble_<chipid>_type : tilt/gravitymon/pressuremon/rapt/rapt2
+# Write the current status of each device as one redis hash to share it
+# ble_<chipid> : last=<update time>
+#                type=tilt/gravitymon/pressuremon/chamber/rapt/rapt2
+#                gravity/temp/pressure/pressure1/chambertemp/beertemp=<value>
 
 endpoint_gravity = "http://" + os.getenv("API_HOST") + "/api/gravity/public"
-endpoint_pressure = "http://" + os.getenv("API_HOST") + "/api/gravity/public"
+endpoint_pressure = "http://" + os.getenv("API_HOST") + "/api/pressure/public"
+endpoint_gravity_list = "http://" + os.getenv("API_HOST") + "/api/gravity/"
+endpoint_pressure_list = "http://" + os.getenv("API_HOST") + "/api/pressure/"
+endpoint_batch = "http://" + os.getenv("API_HOST") + "/api/batch/"
+endpoint_device = "http://" + os.getenv("API_HOST") + "/api/device/"
+endpoint_health = "http://" + os.getenv("API_HOST") + "/health"
 headers = {
     "Content-Type": "application/json",
 }
+api_key = None # Needed for the bulk upload of buffered readings
 
 minium_interval = 0
-pool = None
-
-def writeKey(key, value):
-    if pool is None or skip_push is True:
+clock = time.time # Time source, replaced when replaying captured advertisements
+redis_client = None
+status_interval = 10 # Min seconds between status writes for the same device
+status_written = {} # Dict of devices (ID: time of last status write)
+
+scan_mode = "active" # active/passive scan continuously, cycle restarts the scanner every 100 ms
+dedup_interval = 60 # Unchanged advertisements from a device are dropped for this many seconds
+capture_file = None # Append all received advertisements to this file (json lines)
+seen = {} # Dict of advertisement sources ((address, sources): (payload hash, time))
+stats = {"received": 0, "duplicates": 0, "unknown": 0, "decoded": 0}
+
+# Readings are posted to the API from a bounded queue by a few worker tasks so a
+# slow API never blocks the bleak detection callback.
+post_queue = None
+post_queue_size = 100 # Max readings waiting to be posted, oldest is dropped when full
+post_workers = 2 # Number of concurrent posting tasks
+post_retries = 3 # Attempts per reading before giving up
+post_backoff = 2.0 # Seconds before first retry, doubled for each new attempt
+
+# Readings that could not be posted are kept in an on-disk ring buffer and uploaded
+# in bulk through the list endpoints when the API is reachable again. Once a device
+# has buffered readings its new readings are buffered as well to keep them in order.
+# The upload needs an active batch for the device, until there is one the readings
+# stay buffered and new readings are posted to the public endpoint, which creates the
+# batch. Without API_KEY the buffered readings can only be posted to the public
+# endpoint and are stored with the time they are posted.
+offline_buffer = None
+buffer_file = "/data/ble_buffer.sqlite" # Keep on a mounted volume so it survives a new container
+buffer_max_rows = 10000 # Oldest readings are removed when the buffer is full
+flush_interval = 30 # Seconds between checks if buffered readings can be uploaded
+flush_chunk = 100 # Max readings per bulk upload
+flush_max_interval = 600 # Max seconds between attempts while uploads keep failing
+rejected_codes = (409, 422) # The readings themselves are invalid, retrying will not help
+no_batch = set() # Devices with buffered readings but no active batch to upload them to
+
+def writeStatus(id, type, values):
+    if redis_client is None or skip_push is True:
         return True
 
+    now = clock()
+    if now - status_written.get(id, 0) < status_interval:
+        return True # Throttled, status for this device was recently written
+
+    status_written[id] = now
+    key = f"ble_{id}"
     ttl = 60*60*6 # 6 hours
 
-    logger.info(f"Writing key {key} = {value} ttl:{ttl}.")
+    mapping = {"last": int(now), "type": type}
+    missing = []
+    for field, value in values.items():
+        if value is None:
+            missing.append(field)
+        else:
+            mapping[field] = str(value)
+
+    logger.info(f"Writing status {key} = {mapping} ttl:{ttl}.")
     try:
-        r = redis.Redis(connection_pool=pool)
-        r.set(name=key, value=str(value), ex=ttl)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(key, mapping=mapping)
+        if len(missing):
+            pipe.hdel(key, *missing)
+        pipe.expire(key, ttl)
+        pipe.execute()
         return True
     except redis.exceptions.ConnectionError as e:
         logger.error(f"Failed to connect with redis {e}.")
     return False
 
-gravitymon_tilt_format = Struct(
-    "type_length" / Const(b"\x02\x15"),
-    "uuid" / Array(16, Byte),
-    "major" / Int16ub,
-    "minor" / Int16ub,
-    "power" / Int8sl,
-)
-
-gravitymon_ibeacon_format = Struct(
-    "type_length" / Const(b"\x03\x15"),
-    "name" / Const(b"GRAVMON."),
-    # "name" / Array(8, Byte),
-    "chipid" / Int32ub,
-    "angle" / Int16ub,
-    "battery" / Int16ub,
-    "gravity" / Int16ub,
-    "temp" / Int16ub,
-)
-
-gravitymon_eddystone_format = Struct(
-    "type_length" / Const(b"\x20\x00"),
-    "battery" / Int16ub,
-    "temp" / Int16ub,
-    "gravity" / Int16ub,
-    "angle" / Int16ub,
-    "chipid" / Int32ub,
-)
-
-pressuremon_ibeacon_format = Struct(
-    "type_length" / Const(b"\x03\x15"),
-    "name" / Const(b"PRESMON."),
-    # "name" / Array(8, Byte),
-    "chipid" / Int32ub,
-    "pressure" / Int16ub,
-    "pressure1" / Int16ub,
-    "battery" / Int16ub,
-    "temp" / Int16ub,
-)
-
-chamber_ibeacon_format = Struct(
-    "type_length" / Const(b"\x03\x15"),
-    "name" / Const(b"CHAMBER."),
-    # "name" / Array(8, Byte),
-    "chipid" / Int32ub,
-    "chamberTemp" / Int16ub,
-    "beerTemp" / Int16ub,
-)
-
-rapt_v1_ibeacon_format = Struct(
-    "tag" / Const(b"PT\x01"),
-    "mac" / Array(6, Byte),
-    "temp" / Int16ub,
-    "gravity" / Float32b,    # float
-    "x" / Int16ub,
-    "y" / Int16ub,
-    "z" / Int16ub,
-    "battery" / Int16ub
-)
-
-rapt_v2_ibeacon_format = Struct(
-    "tag" / Const(b"PT\x02"),
-    "padding" / Byte,
-    "velocity_valid" / Byte,
-    "velocity" / Float32b,
-    "temp" / Int16ub,
-    "gravity" / Float32b,
-    "x" / Int16ub,
-    "y" / Int16ub,
-    "z" / Int16ub,
-    "battery" / Int16ub
-)
-
-class tilt:
-    def __init__(self, color, uuid, time):
-        self.color = color
-        self.uuid = uuid
-        self.time = time
-
-
-# List of tilts (class tilt)
-tilts = []
+def device_key(data):
+    return data.get("ID", data.get("id", data.get("color")))
+
+def buffer_reading(data, name, created):
+    if offline_buffer is None:
+        logger.error(f"No offline buffer, dropping {name} reading {json.dumps(data)}.")
+        return
+
+    offline_buffer.add(name, device_key(data), created, data)
+    logger.info(f"Buffered {name} reading, {offline_buffer.count()} readings waiting for the API.")
+
+def queue_post(endpoint, data, name):
+    if skip_push or post_queue is None:
+        return
+
+    created = clock()
+    key = device_key(data)
+    if offline_buffer is not None and offline_buffer.has_pending(key) and key not in no_batch:
+        buffer_reading(data, name, created) # Keep the order behind the buffered readings
+        return
+
+    if post_queue.full():
+        _, dropped, dropped_name, dropped_created = post_queue.get_nowait()
+        post_queue.task_done()
+        logger.warning(f"Outbound queue is full, moving oldest {dropped_name} reading to the offline buffer.")
+        buffer_reading(dropped, dropped_name, dropped_created)
+
+    post_queue.put_nowait((endpoint, data, name, created))
+    logger.debug(f"Queued {name} data, {post_queue.qsize()} readings waiting.")
+
+async def post_data(client, endpoint, data, name):
+    delay = post_backoff
+
+    for attempt in range(1, post_retries + 1):
+        try:
+            logger.info(f"Posting {name} data, attempt {attempt}.")
+            r = await client.post(endpoint, json=data)
+            logger.info(f"Response {r}.")
+
+            if r.status_code < 500: # Client errors will not improve by retrying
+                if not r.is_success:
+                    logger.error(f"API rejected {name} data, code {r.status_code}.")
+                return True
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to post {name} data, Error: {e}")
+
+        if attempt < post_retries:
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            delay *= 2
+
+    logger.error(f"Failed to post {name} data after {post_retries} attempts.")
+    return False
+
+async def post_worker(client):
+    while True:
+        endpoint, data, name, created = await post_queue.get()
+        try:
+            if not await post_data(client, endpoint, data, name):
+                buffer_reading(data, name, created)
+        except Exception as e:
+            logger.error(f"Unexpected error when posting {name} data, Error: {e}")
+        finally:
+            post_queue.task_done()
+
+def to_gravity(batch_id, created, data):
+    if data.get("gravity") is None:
+        return None
+
+    temperature = data.get("temperature")
+    if temperature is not None and "color" in data: # Tilt reports Farenheit
+        temperature = float(f"{(temperature - 32) * 5 / 9:.2f}")
+
+    return {
+        "batchId": batch_id,
+        "temperature": temperature,
+        "gravity": data["gravity"],
+        "angle": data.get("angle", 0),
+        "battery": data.get("battery", 0),
+        "rssi": data.get("RSSI", 0),
+        "created": datetime.fromtimestamp(created).isoformat(),
+        "active": True,
+    }
+
+def to_pressure(batch_id, created, data):
+    if data.get("pressure") is None:
+        return None
+
+    # Same conversion from PSI to kPa as the public endpoint
+    pressure1 = data.get("pressure1")
+    if pressure1 is not None and pressure1 != 0.0:
+        pressure1 = float(f"{pressure1 * 6.89476:.4f}")
+
+    return {
+        "batchId": batch_id,
+        "temperature": data.get("temperature"),
+        "pressure": float(f"{data['pressure'] * 6.89476:.4f}"),
+        "pressure1": pressure1,
+        "battery": data.get("battery"),
+        "rssi": data.get("rssi", 0),
+        "created": datetime.fromtimestamp(created).isoformat(),
+        "active": True,
+    }
+
+# Buffered reading type: (public endpoint, list endpoint, conversion)
+uploads = {
+    "gravitymon": (endpoint_gravity, endpoint_gravity_list, to_gravity),
+    "tilt": (endpoint_gravity, endpoint_gravity_list, to_gravity),
+    "pressuremon": (endpoint_pressure, endpoint_pressure_list, to_pressure),
+}
+
+async def find_batch(client, name, device):
+    auth = {"Authorization": "Bearer " + api_key}
+    chip_id = device
+
+    if name == "tilt": # Buffered by color, find the device that is assigned the color
+        r = await client.get(endpoint_device, headers=auth)
+        r.raise_for_status()
+        match = [d["chipId"] for d in r.json() if d.get("bleColor") == device]
+        if len(match) == 0:
+            return None
+        chip_id = match[0]
+
+    r = await client.get(endpoint_batch, params={"chipId": chip_id, "active": "true"}, headers=auth)
+    r.raise_for_status()
+    batches = r.json()
+    return batches[0]["id"] if len(batches) else None
+
+async def flush_device(client, name, device):
+    endpoint, endpoint_list, convert = uploads[name]
+    batch_id = None
+
+    rows = offline_buffer.peek(name, device, flush_chunk)
+    while len(rows):
+        if batch_id is None and api_key is not None:
+            batch_id = await find_batch(client, name, device)
+            if batch_id is None:
+                # Wait for a batch, new readings go to the public endpoint that creates it
+                if device not in no_batch:
+                    logger.warning(f"No active batch for {name} {device}, keeping buffered readings.")
+                no_batch.add(device)
+                return True
+            no_batch.discard(device)
+
+        if batch_id is None:
+            # Without an API key only the public endpoint can be used, it stores the
+            # reading with the current time.
+            id, _, _, data = rows[0]
+            if not await post_data(client, endpoint, data, name):
+                return False
+            offline_buffer.remove(device, [id])
+        else:
+            readings = [convert(batch_id, created, data) for _, _, created, data in rows]
+            readings = [r for r in readings if r is not None]
+            if len(readings):
+                r = await client.post(endpoint_list, json=readings, headers={"Authorization": "Bearer " + api_key})
+                if r.is_success:
+                    logger.info(f"Uploaded {len(readings)} buffered {name} readings for {device}.")
+                elif r.status_code in rejected_codes:
+                    logger.error(f"API rejected buffered {name} readings for {device}, code {r.status_code}, dropping them.")
+                else:
+                    # Wrong API key, proxy errors etc, keep the readings and try again later
+                    logger.warning(f"Failed to upload buffered {name} readings, code {r.status_code}.")
+                    return False
+            offline_buffer.remove(device, [row[0] for row in rows])
+
+        rows = offline_buffer.peek(name, device, flush_chunk)
+    return True
+
+async def flush_worker(client):
+    delay = flush_interval
+
+    while True:
+        await asyncio.sleep(delay)
+
+        waiting = offline_buffer.count()
+        if waiting == 0:
+            delay = flush_interval
+            continue
+
+        delay = min(delay * 2, flush_max_interval) # Reset when all devices are uploaded
+        try:
+            r = await client.get(endpoint_health)
+            if not r.is_success:
+                continue
+
+            logger.info(f"API is available, uploading {waiting} buffered readings.")
+            for name, device in offline_buffer.devices():
+                if not await flush_device(client, name, device):
+                    logger.warning(f"Upload of buffered readings failed, next attempt in {delay} seconds.")
+                    break
+            else:
+                delay = flush_interval
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to upload buffered readings, Error: {e}")
+        except Exception as e:
+            logger.error(f"Unexpected error when uploading buffered readings, Error: {e}")
+
+# Dict of tilt devices (color: time)
+tilts = {}
 # Dict of gravitymon devices (ID: time)
 gravitymons = {}
 # Dict of pressuremon devices (ID: time)
 pressuremons = {}
 
 
-def init():
-    tilts.append(
-        tilt(
-            "red",
-            UUID("A495BB10-C5B1-4B44-B512-1370F02D74DE"),
-            time.time() - minium_interval,
-        )
-    )
-    tilts.append(
-        tilt(
-            "green",
-            UUID("A495BB20-C5B1-4B44-B512-1370F02D74DE"),
-            time.time() - minium_interval,
-        )
-    )
-    tilts.append(
-        tilt(
-            "black",
-            UUID("A495BB30-C5B1-4B44-B512-1370F02D74DE"),
-            time.time() - minium_interval,
-        )
-    )
-    tilts.append(
-        tilt(
-            "purple",
-            UUID("A495BB40-C5B1-4B44-B512-1370F02D74DE"),
-            time.time() - minium_interval,
-        )
-    )
-    tilts.append(
-        tilt(
-            "orange",
-            UUID("A495BB50-C5B1-4B44-B512-1370F02D74DE"),
-            time.time() - minium_interval,
-        )
-    )
-    tilts.append(
-        tilt(
-            "blue",
-            UUID("A495BB60-C5B1-4B44-B512-1370F02D74DE"),
-            time.time() - minium_interval,
-        )
-    )
-    tilts.append(
-        tilt(
-            "yellow",
-            UUID("A495BB70-C5B1-4B44-B512-1370F02D74DE"),
-            time.time() - minium_interval,
-        )
-    )
-    tilts.append(
-        tilt(
-            "pink",
-            UUID("A495BB80-C5B1-4B44-B512-1370F02D74DE"),
-            time.time() - minium_interval,
-        )
-    )
-
-
 def remove_none_values(obj):
     if skip_null_values is False:
         return obj
@@ -213,363 +331,284 @@ def remove_none_values(obj):
         return obj
 
 
-def contains(list, filter):
-    for x in list:
-        if filter(x):
-            return True
-    return False
-
-
-def first(iterable, default=None):
-    for item in iterable:
-        return item
-    return default
-
-
-async def parse_gravitymon(device: BLEDevice, advertisement_data: AdvertisementData):
-    if skip_gravitymon:
-        return
-
-    global gravitymons
-
-    try:
-        apple_data = advertisement_data.manufacturer_data[0x004C]
-        ibeacon = gravitymon_ibeacon_format.parse(apple_data)
-        chipId = hex(ibeacon.chipid)[2:]
-
-        logger.info(f"Parsing gravitymon ibeacon: {device}")
-
-        data = {
-            "name": "",
-            "ID": chipId,
-            "token": "",
-            "interval": 0,
-            "battery": None if ibeacon.battery == 0xffff else float(ibeacon.battery) / 1000,
-            "gravity": None if ibeacon.gravity == 0xffff else float(ibeacon.gravity) / 10000,
-            "angle": None if ibeacon.angle == 0xffff else float(ibeacon.angle) / 100,
-            "temperature": None if ibeacon.temp == 0xffff else float(ibeacon.temp) / 1000,
-            "temp_units": "C",
-            "RSSI": 0,
-        }
-        data = remove_none_values(data) 
-        logger.info(f"Gravitymon data received: {json.dumps(data)} {device.address}")
-        now = time.time()
-
-        writeKey(f"ble_{chipId}_last", int(now))
-        writeKey(f"ble_{chipId}_gravity", None if ibeacon.gravity == 0xffff else float(ibeacon.gravity) / 10000)
-        writeKey(f"ble_{chipId}_temp", None if ibeacon.temp == 0xffff else float(ibeacon.temp) / 1000)
-        writeKey(f"ble_{chipId}_type", "gravitymon")
-
-        logger.debug(
-            f"Found gravitymon device, checking if time has expired, min={minium_interval}s"
-        )
-
-        if (
-            abs(gravitymons.get(data["ID"], now - minium_interval * 2) - now)
-            > minium_interval
-        ):
-            gravitymons[data["ID"]] = now
-            logger.info(f"Gravitymon data received: {json.dumps(data)}")
-            if not skip_push:
-                try:
-                    logger.info("Posting gravitymon data.")
-                    r = requests.post(endpoint_gravity, json=data, headers=headers)
-                    logger.info(f"Response {r}.")
-                except Exception as e:
-                    logger.error(f"Failed to post gravitymon data, Error: {e}")
-    except KeyError:
-        pass
-    except ConstError:
-        pass
-    
-
-def parse_gravitymon_eddystone(device: BLEDevice, advertisement_data: AdvertisementData):
+def handle_gravitymon(reading: Reading, address, rssi):
     if skip_gravitymon:
         return
 
-    global gravitymons
+    chipId = reading.id
+    values = reading.values
+
+    logger.info(f"Parsing gravitymon: {address}")
+
+    data = {
+        "name": "",
+        "ID": chipId,
+        "token": "",
+        "interval": 0,
+        "battery": values["battery"],
+        "gravity": values["gravity"],
+        "angle": values["angle"],
+        "temperature": values["temperature"],
+        "temp_units": "C",
+        "RSSI": 0,
+    }
+    data = remove_none_values(data) 
+    logger.info(f"Gravitymon data received: {json.dumps(data)} {address}")
+    now = clock()
+
+    writeStatus(chipId, "gravitymon", {
+        "gravity": values["gravity"],
+        "temp": values["temperature"],
+    })
+
+    logger.debug(
+        f"Found gravitymon device, checking if time has expired, min={minium_interval}s"
+    )
 
-    try:
-        uuid = advertisement_data.service_uuids[0]
-        data = advertisement_data.service_data.get(uuid)
-        eddy = gravitymon_eddystone_format.parse(data)
-        chipId = hex(eddy.chipid)[2:]
+    if (
+        abs(gravitymons.get(chipId, now - minium_interval * 2) - now)
+        > minium_interval
+    ):
+        gravitymons[chipId] = now
+        logger.info(f"Gravitymon data received: {json.dumps(data)}")
+        queue_post(endpoint_gravity, data, "gravitymon")
 
-        logger.info(f"Parsing gravitymon eddystone: {device}")
 
-        data = {
-            "name": "",
-            "ID": chipId,
-            "token": "",
-            "interval": 0,
-            "battery": None if eddy.battery == 0xffff else float(eddy.battery) / 1000,
-            "gravity": None if eddy.gravity == 0xffff else float(eddy.gravity) / 10000,
-            "angle": None if eddy.angle == 0xffff else float(eddy.angle) / 100,
-            "temperature": None if eddy.temp == 0xffff else float(eddy.temp) / 1000,
-            "temp_units": "C",
-            "RSSI": 0,
-        }
-
-        data = remove_none_values(data) 
-        logger.info(f"Gravitymon data received: {json.dumps(data)} {device.address}")
-
-        now = time.time()
-
-        writeKey(f"ble_{chipId}_last", int(now))
-        writeKey(f"ble_{chipId}_gravity", None if eddy.gravity == 0xffff else float(eddy.gravity) / 10000)
-        writeKey(f"ble_{chipId}_temp", None if eddy.temp == 0xffff else float(eddy.temp) / 1000)
-        writeKey(f"ble_{chipId}_type", "gravitymon")
-
-        logger.debug(
-            f"Found gravitymon device, checking if time has expired, min={minium_interval}s"
-        )
-
-        if (
-            abs(gravitymons.get(data["ID"], now - minium_interval * 2) - now)
-            > minium_interval
-        ):
-            gravitymons[data["ID"]] = now
-            logger.info(f"Gravitymon data received: {json.dumps(data)}")
-            if not skip_push:
-                try:
-                    logger.info("Posting gravitymon data.")
-                    r = requests.post(endpoint_gravity, json=data, headers=headers)
-                    logger.info(f"Response {r}.")
-                except Exception as e:
-                    logger.error(f"Failed to post gravitymon data, Error: {e}")
-    except KeyError:
-        pass
-    except ConstError:
-        pass
-
-async def parse_pressuremon(device: BLEDevice, advertisement_data: AdvertisementData):
+def handle_pressuremon(reading: Reading, address, rssi):
     if skip_pressuremon:
         return
 
-    global pressuremons
-
-    try:
-        apple_data = advertisement_data.manufacturer_data[0x004C]
-        ibeacon = pressuremon_ibeacon_format.parse(apple_data)
-        chipId = hex(ibeacon.chipid)[2:]
+    chipId = reading.id
+    values = reading.values
+
+    logger.info(f"Parsing pressuremon ibeacon: {address}")
+
+    data = {
+        "name": "",
+        "id": chipId,
+        "token": "",
+        "interval": 0,
+        "battery": values["battery"],
+        "pressure": values["pressure"],
+        "pressure1": values["pressure1"],
+        "temperature": values["temperature"],
+        "pressure-unit": "PSI",
+        "temperature-unit": "C",
+        "rssi": 0,
+    }
+
+    data = remove_none_values(data) 
+    logger.info(f"Pressuremon data received: {json.dumps(data)} {address}")
+
+    now = clock()
+
+    writeStatus(chipId, "pressuremon", {
+        "pressure": values["pressure"],
+        "pressure1": values["pressure1"],
+        "temp": values["temperature"],
+    })
+
+    logger.debug(
+        f"Found pressuremon device, checking if time has expired, min={minium_interval}s"
+    )
 
-        logger.info(f"Parsing pressuremon ibeacon: {device}")
+    if (
+        abs(pressuremons.get(chipId, now - minium_interval * 2) - now)
+        > minium_interval
+    ):
+        pressuremons[chipId] = now
+        logger.info(f"Pressuremon data received: {json.dumps(data)}")
+        queue_post(endpoint_pressure, data, "pressuremon")
 
-        data = {
-            "name": "",
-            "ID": chipId,
-            "token": "",
-            "interval": 0,
-            "battery": None if ibeacon.battery == 0xffff else float(ibeacon.battery) / 1000,
-            "pressure": None if ibeacon.pressure == 0xffff else float(ibeacon.pressure) / 100,
-            "pressure1": None if ibeacon.pressure1 == 0xffff else float(ibeacon.pressure1) / 100,
-            "temperature": None if ibeacon.temp == 0xffff else float(ibeacon.temp) / 1000,
-            "pressure-unit": "PSI",
-            "temperature-unit": "C",
-            "RSSI": 0,
-        }
 
-        data = remove_none_values(data) 
-        logger.info(f"Pressuremon data received: {json.dumps(data)} {device.address}")
-
-        now = time.time()
-
-        writeKey(f"ble_{chipId}_last", int(now))
-        writeKey(f"ble_{chipId}_pressure", None if ibeacon.pressure == 0xffff else float(ibeacon.pressure) / 100)
-        writeKey(f"ble_{chipId}_pressure1", None if ibeacon.pressure1 == 0xffff else float(ibeacon.pressure1) / 100)
-        writeKey(f"ble_{chipId}_temp", None if ibeacon.temp == 0xffff else float(ibeacon.temp) / 1000)
-        writeKey(f"ble_{chipId}_type", "pressuremon")
-
-        logger.debug(
-            f"Found pressuremon device, checking if time has expired, min={minium_interval}s"
-        )
-
-        if (
-            abs(pressuremons.get(data["ID"], now - minium_interval * 2) - now)
-            > minium_interval
-        ):
-            pressuremons[data["ID"]] = now
-            logger.info(f"Pressuremon data received: {json.dumps(data)}")
-            if not skip_push:
-                try:
-                    logger.info("Posting pressuremon data.")
-                    r = requests.post(endpoint_pressure, json=data, headers=headers)
-                    logger.info(f"Response {r}.")
-                except Exception as e:
-                    logger.error(f"Failed to post pressuremon data, Error: {e}")
-    except KeyError:
-        pass
-    except ConstError:
-        pass
-
-async def parse_chamber(device: BLEDevice, advertisement_data: AdvertisementData):
+def handle_chamber(reading: Reading, address, rssi):
     if skip_chamber:
         return
 
-    try:
-        apple_data = advertisement_data.manufacturer_data[0x004C]
-        ibeacon = chamber_ibeacon_format.parse(apple_data)
-        chipId = hex(ibeacon.chipid)[2:]
+    chipId = reading.id
+    values = reading.values
 
-        logger.info(f"Parsing chamber ibeacon: {device}")
+    logger.info(f"Parsing chamber ibeacon: {address}")
 
-        data = {
-            "ID": chipId,
-            "beer-temp": None if ibeacon.beerTemp == 0xffff else float(ibeacon.beerTemp) / 1000,
-            "chamber-temp": None if ibeacon.chamberTemp == 0xffff else float(ibeacon.chamberTemp) / 1000,
-            "temperature-unit": "C",
-        }
+    data = {
+        "ID": chipId,
+        "beer-temp": values["beer-temp"],
+        "chamber-temp": values["chamber-temp"],
+        "temperature-unit": "C",
+    }
 
-        data = remove_none_values(data) 
-        logger.info(f"Chamber data received: {json.dumps(data)} {device.address}")
+    data = remove_none_values(data) 
+    logger.info(f"Chamber data received: {json.dumps(data)} {address}")
 
-        now = time.time()
+    writeStatus(chipId, "chamber", {
+        "chambertemp": values["chamber-temp"],
+        "beertemp": values["beer-temp"],
+    })
 
-        writeKey(f"ble_{chipId}_last", int(now))
-        writeKey(f"ble_{chipId}_chambertemp", float(ibeacon.chamberTemp)/ 1000)
-        writeKey(f"ble_{chipId}_beertemp", float(ibeacon.beerTemp) / 1000)
-        writeKey(f"ble_{chipId}_type", "chamber")
 
-    except KeyError:
-        pass
-    except ConstError:
-        pass
+def handle_tilt(reading: Reading, address, rssi):
+    color = reading.id
+    values = reading.values
 
+    logger.debug(
+        f"Found tilt device, checking if time has expired, min={minium_interval}s"
+    )
 
-def parse_gravitymon_tilt(advertisement_data: AdvertisementData):
-    try:
-        apple_data = advertisement_data.manufacturer_data[0x004C]
-        ibeacon = gravitymon_tilt_format.parse(apple_data)
-        uuid = UUID(bytes=bytes(ibeacon.uuid))
-        tilt = first(x for x in tilts if x.uuid == uuid)
-
-        if tilt is not None:
-            logger.debug(
-                f"Found tilt device, checking if time has expired, min={minium_interval}s"
-            )
-
-            if ibeacon.minor > 5000: # Check if the data is related to TILT PRO (higher resolution)
-                tempF = ibeacon.major / 10
-                gravitySG = ibeacon.minor / 10000
-            else:
-                tempF = ibeacon.major
-                gravitySG = ibeacon.minor / 1000
-
-            now = time.time()
-
-            writeKey(f"ble_{tilt.color}_last", int(now))
-            writeKey(f"ble_{tilt.color}_gravity", float(gravitySG))
-            writeKey(f"ble_{tilt.color}_temp", float(tempF))
-            writeKey(f"ble_{tilt.color}_type", "tilt")
-
-            if abs(tilt.time - now) > minium_interval:
-                tilt.time = now
-
-                data = {
-                    "color": tilt.color,
-                    "gravity": gravitySG,
-                    "temperature": tempF,
-                    "RSSI": advertisement_data.rssi,
-                }
-
-                logger.info(f"Tilt data received: {json.dumps(data)}")
-                if not skip_push:
-                    try:
-                        logger.info("Posting tilt data.")
-                        r = requests.post(endpoint_gravity, json=data, headers=headers)
-                        logger.info(f"Response {r}.")
-                    except Exception as e:
-                        logger.error(f"Failed to post tilt data, Error: {e}")
-    except KeyError:
-        pass
-    except ConstError:
-        pass
-
-def parse_rapt_v1(device: BLEDevice, advertisement_data: AdvertisementData):
-    if skip_gravitymon:
-        return
+    now = clock()
 
-    try:
-        apple_data = advertisement_data.manufacturer_data[0x4152]
-        ibeacon = rapt_v1_ibeacon_format.parse(apple_data)
+    writeStatus(color, "tilt", {
+        "gravity": values["gravity"],
+        "temp": values["temperature"],
+    })
+
+    if abs(tilts.get(color, now - minium_interval * 2) - now) > minium_interval:
+        tilts[color] = now
 
         data = {
-            "temperature": float(ibeacon.temp) / 128 - 273.15,
-            "gravity": float(ibeacon.gravity),
-            "mac": ":".join(f"{b:02x}" for b in ibeacon.mac),
-            "x": ibeacon.x / 16,
-            "y": ibeacon.y / 16,
-            "z": ibeacon.z / 16,
-            "battery": float(ibeacon.battery) / 256,
-            "rssi": advertisement_data.rssi,
+            "color": color,
+            "gravity": values["gravity"],
+            "temperature": values["temperature"],
+            "RSSI": rssi,
         }
-        logger.info(f"RAPT v1 data received: {json.dumps(data)}")
 
-        now = time.time()
+        logger.info(f"Tilt data received: {json.dumps(data)}")
+        queue_post(endpoint_gravity, data, "tilt")
 
-        writeKey(f"ble_{device.address}_last", int(now))
-        writeKey(f"ble_{device.address}_gravity", float(ibeacon.gravity))
-        writeKey(f"ble_{device.address}_temp", float(ibeacon.temp / 128 - 273.15))
-        writeKey(f"ble_{device.address}_type", "rapt")
 
-    except KeyError:
-        pass
-    except ConstError:
-        pass
-
-def parse_rapt_v2(device: BLEDevice, advertisement_data: AdvertisementData):
+def handle_rapt(reading: Reading, address, rssi):
     if skip_gravitymon:
         return
 
-    try:
-        apple_data = advertisement_data.manufacturer_data[0x4152]
-        ibeacon = rapt_v2_ibeacon_format.parse(apple_data)
+    data = dict(reading.values)
+    if reading.id is not None:
+        data["mac"] = reading.id
+    data["rssi"] = rssi
+    logger.info(f"RAPT {reading.type} data received: {json.dumps(data)}")
+
+    writeStatus(address, reading.type, {
+        "gravity": float(data["gravity"]),
+        "temp": float(data["temperature"]),
+    })
+
+
+handlers = {
+    "gravitymon": handle_gravitymon,
+    "pressuremon": handle_pressuremon,
+    "chamber": handle_chamber,
+    "tilt": handle_tilt,
+    "rapt": handle_rapt,
+    "rapt2": handle_rapt,
+}
 
-        data = {
-            "temperature": ibeacon.temp / 128 - 273.15,
-            "velocity_valid": True if ibeacon.velocity_valid == 1 else False,
-            "velocity": 0.0 if ibeacon.velocity_valid == 0 else ibeacon.velocity,
-            "gravity": ibeacon.gravity,
-            "x": ibeacon.x / 16,
-            "y": ibeacon.y / 16,
-            "z": ibeacon.z / 16,
-            "battery": ibeacon.battery / 256,
-            "rssi": advertisement_data.rssi,
-        }
-        logger.info(f"RAPT v2 data received: {json.dumps(data)}")
 
-        now = time.time()
+def payload_key(address, manufacturer_data, service_data):
+    # Devices can alternate between formats (ibeacon/eddystone) so each source has its own entry
+    key = (address, tuple(manufacturer_data), tuple(service_data))
+    payload = hash((tuple(manufacturer_data.values()), tuple(service_data.values())))
+    return key, payload
 
-        writeKey(f"ble_{device.address}_last", int(now))
-        writeKey(f"ble_{device.address}_gravity", float(ibeacon.gravity))
-        writeKey(f"ble_{device.address}_temp", float(ibeacon.temp / 128 - 273.15))
-        writeKey(f"ble_{device.address}_type", "rapt2")
 
-    except KeyError:
-        pass
-    except ConstError:
-        pass
+def process_advertisement(address, name, rssi, manufacturer_data, service_data):
+    """
+    Run one advertisement through the pipeline, duplicate filter, decoder and handler.
+    Returns the decoded reading or None if it was dropped or not recognized.
+    """
+    stats["received"] += 1
+    now = clock()
+
+    # Drop unchanged advertisements before doing any decoding
+    key, payload = payload_key(address, manufacturer_data, service_data)
+    last = seen.get(key)
+    if last is not None and last[0] == payload and now - last[1] < dedup_interval:
+        stats["duplicates"] += 1
+        return None
+    seen[key] = (payload, now)
+
+    reading = decode(name, manufacturer_data, service_data)
+    if reading is None:
+        stats["unknown"] += 1
+        return None
+
+    stats["decoded"] += 1
+    handlers[reading.type](reading, address, rssi)
+    return reading
+
+
+def prune_seen(max_age):
+    now = clock()
+    for key in [k for k, v in seen.items() if now - v[1] > max_age]:
+        seen.pop(key)
+
+
+def capture(device: BLEDevice, advertisement_data: AdvertisementData):
+    # Record the raw advertisement so it can be replayed with replay.py
+    record = {
+        "time": time.time(),
+        "address": device.address,
+        "name": device.name,
+        "rssi": advertisement_data.rssi,
+        "manufacturer_data": {str(k): v.hex() for k, v in advertisement_data.manufacturer_data.items()},
+        "service_data": {k: v.hex() for k, v in advertisement_data.service_data.items()},
+    }
+    with open(capture_file, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
 
 async def device_found(device: BLEDevice, advertisement_data: AdvertisementData):
     # logger.info(f"Found: {device.name} {advertisement_data.service_uuids}")
 
-    if device.name == "gravitymon" and any(
-        "0000feaa-" in s for s in advertisement_data.service_uuids
-    ):
-        parse_gravitymon_eddystone(device=device, advertisement_data=advertisement_data)
-    else:
-        # Try the other formats and see what matches
-        await parse_gravitymon(device=device, advertisement_data=advertisement_data)
-        await parse_pressuremon(device=device, advertisement_data=advertisement_data)
-        await parse_chamber(device=device, advertisement_data=advertisement_data)
-        parse_gravitymon_tilt(advertisement_data=advertisement_data)
-        parse_rapt_v1(device=device, advertisement_data=advertisement_data)
-        parse_rapt_v2(device=device, advertisement_data=advertisement_data)
+    if capture_file is not None:
+        capture(device, advertisement_data)
+
+    process_advertisement(
+        device.address,
+        device.name,
+        advertisement_data.rssi,
+        advertisement_data.manufacturer_data,
+        advertisement_data.service_data,
+    )
+
+
+def create_scanner(mode):
+    if mode != "passive":
+        return BleakScanner(detection_callback=device_found, scanning_mode="active")
+
+    # BlueZ requires patterns for passive scanning, match the formats that the decoder
+    # supports. Scan responses are not requested so device names are not always known.
+    logger.warning(
+        "Passive scan, gravitymon eddystone frames without device name are only accepted when "
+        "gravity is 0.9-1.3 SG, use the ibeacon format or active scan for other gravity units."
+    )
+    from bleak.assigned_numbers import AdvertisementDataType
+    from bleak.backends.bluezdbus.advertisement_monitor import OrPattern
+
+    patterns = [
+        OrPattern(0, AdvertisementDataType.MANUFACTURER_SPECIFIC_DATA, b"\x4c\x00"), # Apple ibeacon
+        OrPattern(0, AdvertisementDataType.MANUFACTURER_SPECIFIC_DATA, b"\x52\x41"), # RAPT
+        OrPattern(0, AdvertisementDataType.SERVICE_DATA_UUID16, b"\xaa\xfe"), # Eddystone
+    ]
+    return BleakScanner(
+        detection_callback=device_found,
+        scanning_mode="passive",
+        bluez={"or_patterns": patterns},
+    )
 
 
 async def main():
     global minium_interval
-    global pool
+    global redis_client
+    global status_interval
+    global scan_mode
+    global dedup_interval
+    global capture_file
+    global post_queue
+    global post_queue_size
+    global post_workers
+    global post_retries
+    global api_key
+    global offline_buffer
+    global buffer_file
+    global buffer_max_rows
 
     redis_host = os.getenv("REDIS_HOST")
 
@@ -578,6 +617,7 @@ async def main():
     else:
         logger.info(f"Using redis {redis_host}")
         pool = redis.ConnectionPool(host=redis_host, port=6379, db=0)
+        redis_client = redis.Redis(connection_pool=pool)
 
     logging.basicConfig(
         level=logging.INFO,
@@ -588,17 +628,67 @@ async def main():
     minium_interval = 5 * 60  # seconds
     if t is not None:
         minium_interval = int(t)
+
+    t = os.getenv("STATUS_INTERVAL")
+    if t is not None:
+        status_interval = int(t)
+
+    scan_mode = os.getenv("SCAN_MODE", scan_mode).lower()
+    t = os.getenv("DEDUP_INTERVAL")
+    if t is not None:
+        dedup_interval = int(t)
+    capture_file = os.getenv("CAPTURE_FILE")
+
+    t = os.getenv("POST_QUEUE_SIZE")
+    if t is not None:
+        post_queue_size = int(t)
+    t = os.getenv("POST_WORKERS")
+    if t is not None:
+        post_workers = int(t)
+    t = os.getenv("POST_RETRIES")
+    if t is not None:
+        post_retries = int(t)
+
+    buffer_file = os.getenv("BUFFER_FILE", buffer_file)
+    t = os.getenv("BUFFER_MAX_ROWS")
+    if t is not None:
+        buffer_max_rows = int(t)
+    api_key = os.getenv("API_KEY")
+    if api_key is None:
+        logger.warning("No API_KEY env variable, buffered readings are posted one at a time to the public endpoints and get the time they are posted.")
     # logger.info(f"Minium interval = {minium_interval}, reporting to {endpoint_gravity} + {endpoint_pressure}")
 
-    init()
-    scanner = BleakScanner(detection_callback=device_found, scanning_mode="active")
+    post_queue = asyncio.Queue(maxsize=post_queue_size)
+    if len(buffer_file):
+        if os.path.dirname(buffer_file):
+            os.makedirs(os.path.dirname(buffer_file), exist_ok=True)
+        offline_buffer = OfflineBuffer(buffer_file, buffer_max_rows)
+    timeout = httpx.Timeout(10.0, connect=5.0)
+    limits = httpx.Limits(max_connections=post_workers, max_keepalive_connections=post_workers)
+
+    async with httpx.AsyncClient(headers=headers, timeout=timeout, limits=limits) as client:
+        workers = [asyncio.create_task(post_worker(client)) for _ in range(post_workers)]
+        logger.info(f"Started {len(workers)} posting workers, queue size {post_queue_size}")
+        if offline_buffer is not None:
+            workers.append(asyncio.create_task(flush_worker(client)))
+
+        scanner = create_scanner(scan_mode)
+
+        logger.info(f"Scanning for tilt/gravitymon/pressuremon BLE devices, mode {scan_mode}...")
+        if scan_mode == "cycle":
+            while True:
+                await scanner.start()
+                await asyncio.sleep(0.1)
+                await scanner.stop()
 
-    logger.info("Scanning for tilt/gravitymon/pressuremon BLE devices...")
-    while True:
         await scanner.start()
-        await asyncio.sleep(0.1)
-        await scanner.stop()
+        while True:
+            await asyncio.sleep(60)
+            prune_seen(max(dedup_interval, 60) * 10)
+            buffered = 0 if offline_buffer is None else offline_buffer.count()
+            logger.info(f"Advertisements {stats}, tracking {len(seen)} sources, {post_queue.qsize()} readings waiting, {buffered} buffered.")
 
 
-asyncio.run(main())
-logger.info("Exit from scanner")
+if __name__ == "__main__":
+    asyncio.run(main())
+    logger.info("Exit from scanner")
@@ -0,0 +1,71 @@
+"""Tests for the advertisement decoders, run with pytest from service-ble."""
+import struct
+from uuid import UUID
+
+import pytest
+
+from bench_decoder import samples
+from decoder import APPLE_ID, EDDYSTONE_UUID, decode
+
+# Gravitymon eddystone: battery 4.1 V, 20.5 C, gravity 1.045, angle 25, chip id abcdef
+GRAVITYMON_FRAME = bytes.fromhex("20001004501428d209c400abcdef")
+# Standard eddystone TLM: 3 V, 20 C, advertisement and seconds counters
+TLM_FRAME = bytes.fromhex("20000bb81400000123450000ffff")
+
+
+def test_eddystone_named():
+    reading = decode("gravitymon", {}, {EDDYSTONE_UUID: GRAVITYMON_FRAME})
+    assert reading.type == "gravitymon"
+    assert reading.id == "abcdef"
+    assert reading.values["gravity"] == 1.045
+
+
+def test_eddystone_passive_without_name():
+    reading = decode(None, {}, {EDDYSTONE_UUID: GRAVITYMON_FRAME})
+    assert reading.id == "abcdef"
+    assert reading.values["angle"] == 25.0
+
+    assert decode(None, {}, {EDDYSTONE_UUID: TLM_FRAME}) is None
+    assert decode("beacon", {}, {EDDYSTONE_UUID: GRAVITYMON_FRAME}) is None
+
+
+# Samples of each format built by the benchmark
+EXPECTED = {
+    "gravitymon": ("gravitymon", "abcdef", {"battery": 4.1, "gravity": 1.045, "angle": 25.0, "temperature": 20.5}),
+    "pressuremon": ("pressuremon", "abcdef", {"battery": 4.1, "pressure": 15.0, "pressure1": None, "temperature": 20.5}),
+    "chamber": ("chamber", "abcdef", {"chamber-temp": 18.0, "beer-temp": 19.5}),
+    "tilt": ("tilt", "red", {"gravity": 1.045, "temperature": 68.0}),
+    "rapt": ("rapt", "00:00:00:00:00:00", {
+        "temperature": 37500 / 128 - 273.15, "gravity": 1.045, "x": 1.0, "y": 1.0, "z": 1.0, "battery": 3.90625,
+    }),
+    "rapt2": ("rapt2", None, {
+        "temperature": 37500 / 128 - 273.15, "velocity_valid": True, "velocity": 1.5, "gravity": 1.045,
+        "x": 1.0, "y": 1.0, "z": 1.0, "battery": 3.90625,
+    }),
+    "eddystone": ("gravitymon", "abcdef", {"battery": 4.1, "gravity": 1.045, "angle": 25.0, "temperature": 20.5}),
+}
+
+
+@pytest.mark.parametrize("sample", list(EXPECTED))
+def test_decode_formats(sample):
+    reading = decode(*samples[sample])
+    type, id, values = EXPECTED[sample]
+    assert reading.type == type
+    assert reading.id == id
+    assert reading.values == pytest.approx(values)
+
+
+def test_decode_unknown():
+    assert decode(*samples["unknown"]) is None
+    assert decode("", {0x1234: b"\x03\x15GRAVMON."}, {}) is None
+
+    # Known prefix but too short for the format
+    name, manufacturer_data, service_data = samples["gravitymon"]
+    assert decode(name, {APPLE_ID: manufacturer_data[APPLE_ID][:-2]}, service_data) is None
+
+
+def test_decode_tilt_pro():
+    data = b"\x02\x15" + UUID("A495BB20-C5B1-4B44-B512-1370F02D74DE").bytes + struct.pack(">HHb", 685, 10452, -59)
+    reading = decode("", {APPLE_ID: data}, {})
+    assert reading.id == "green"
+    assert reading.values == pytest.approx({"gravity": 1.0452, "temperature": 68.5})
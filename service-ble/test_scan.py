@@ -0,0 +1,223 @@
+"""Tests for the upload of buffered readings, run with pytest from service-ble."""
+import asyncio
+import json
+import os
+
+import httpx
+
+os.environ.setdefault("API_HOST", "localhost")
+
+import scan  # noqa: E402
+from buffer import OfflineBuffer  # noqa: E402
+
+
+def flush(tmp_path, monkeypatch, status_code):
+    buffer = OfflineBuffer(str(tmp_path / "buffer.sqlite"), 100)
+    buffer.add("gravitymon", "ABC123", 1700000000.0, {"ID": "ABC123", "gravity": 1.05, "temperature": 20})
+    buffer.add("gravitymon", "ABC123", 1700000060.0, {"ID": "ABC123", "gravity": 1.04, "temperature": 20})
+    monkeypatch.setattr(scan, "offline_buffer", buffer)
+    monkeypatch.setattr(scan, "api_key", "wrong")
+
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(200, json=[{"id": 1}])
+        return httpx.Response(status_code)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await scan.flush_device(client, "gravitymon", "ABC123")
+
+    return asyncio.run(run()), buffer
+
+
+def test_flush_unauthorized_keeps_readings(tmp_path, monkeypatch):
+    uploaded, buffer = flush(tmp_path, monkeypatch, 401)
+    assert uploaded is False
+    assert buffer.count() == 2
+    assert buffer.has_pending("ABC123")
+
+
+def test_flush_rejected_drops_readings(tmp_path, monkeypatch):
+    uploaded, buffer = flush(tmp_path, monkeypatch, 422)
+    assert uploaded is True
+    assert buffer.count() == 0
+
+
+def test_flush_uploaded(tmp_path, monkeypatch):
+    uploaded, buffer = flush(tmp_path, monkeypatch, 201)
+    assert uploaded is True
+    assert buffer.count() == 0
+
+
+def test_flush_only_kind(tmp_path, monkeypatch):
+    buffer = OfflineBuffer(str(tmp_path / "buffer.sqlite"), 100)
+    buffer.add("gravitymon", "ABC123", 1700000000.0, {"ID": "ABC123", "gravity": 1.05, "temperature": 20})
+    buffer.add("pressuremon", "ABC123", 1700000010.0, {"id": "ABC123", "pressure": 10.0, "temperature": 20})
+    monkeypatch.setattr(scan, "offline_buffer", buffer)
+    monkeypatch.setattr(scan, "api_key", "key")
+    posted = []
+
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(200, json=[{"id": 1}])
+        posted.append((str(request.url), json.loads(request.content)))
+        return httpx.Response(201)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await scan.flush_device(client, "gravitymon", "ABC123")
+
+    assert asyncio.run(run()) is True
+    assert [(url, len(readings)) for url, readings in posted] == [(scan.endpoint_gravity_list, 1)]
+    assert buffer.peek("pressuremon", "ABC123", 10)[0][1] == "pressuremon"
+    assert buffer.count() == 1
+
+
+def test_flush_no_batch_keeps_readings(tmp_path, monkeypatch):
+    buffer = OfflineBuffer(str(tmp_path / "buffer.sqlite"), 100)
+    buffer.add("gravitymon", "ABC123", 1700000000.0, {"ID": "ABC123", "gravity": 1.05, "temperature": 20})
+    monkeypatch.setattr(scan, "offline_buffer", buffer)
+    monkeypatch.setattr(scan, "api_key", "key")
+    monkeypatch.setattr(scan, "no_batch", set())
+    monkeypatch.setattr(scan, "post_queue", asyncio.Queue(maxsize=10))
+
+    def handler(request):
+        assert request.method == "GET"
+        return httpx.Response(200, json=[])
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await scan.flush_device(client, "gravitymon", "ABC123")
+
+    assert asyncio.run(run()) is True
+    assert buffer.count() == 1
+    assert "ABC123" in scan.no_batch
+
+    # A new reading is posted to the public endpoint so the batch is created
+    scan.queue_post(scan.endpoint_gravity, {"ID": "ABC123", "gravity": 1.04}, "gravitymon")
+    assert scan.post_queue.qsize() == 1
+    assert buffer.count() == 1
+
+
+def test_queue_full_moves_oldest_to_buffer(tmp_path, monkeypatch):
+    buffer = OfflineBuffer(str(tmp_path / "buffer.sqlite"), 100)
+    monkeypatch.setattr(scan, "offline_buffer", buffer)
+    monkeypatch.setattr(scan, "post_queue", asyncio.Queue(maxsize=2))
+
+    for i in range(3):
+        scan.queue_post(scan.endpoint_gravity, {"ID": f"DEV{i}", "gravity": 1.05}, "gravitymon")
+
+    assert scan.post_queue.qsize() == 2
+    assert buffer.count() == 1
+    assert buffer.has_pending("DEV0")
+
+    # Readings for a device with buffered readings are buffered behind them
+    scan.queue_post(scan.endpoint_gravity, {"ID": "DEV0", "gravity": 1.04}, "gravitymon")
+    assert buffer.count() == 2
+    assert [scan.post_queue.get_nowait()[1]["ID"] for _ in range(2)] == ["DEV1", "DEV2"]
+
+
+def post(monkeypatch, responses):
+    monkeypatch.setattr(scan, "post_backoff", 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        response = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return httpx.Response(response)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await scan.post_data(client, scan.endpoint_gravity, {"ID": "ABC123"}, "gravitymon")
+
+    return asyncio.run(run()), len(calls)
+
+
+def test_post_retry(monkeypatch):
+    assert post(monkeypatch, [503, httpx.ConnectError("refused"), 200]) == (True, 3)
+
+
+def test_post_gives_up(monkeypatch):
+    assert post(monkeypatch, [503]) == (False, scan.post_retries)
+
+
+def test_post_client_error_not_retried(monkeypatch):
+    assert post(monkeypatch, [422]) == (True, 1)
+
+
+def test_post_worker_buffers_failed(tmp_path, monkeypatch):
+    buffer = OfflineBuffer(str(tmp_path / "buffer.sqlite"), 100)
+    monkeypatch.setattr(scan, "offline_buffer", buffer)
+    monkeypatch.setattr(scan, "post_backoff", 0)
+
+    def handler(request):
+        return httpx.Response(500)
+
+    async def run():
+        monkeypatch.setattr(scan, "post_queue", asyncio.Queue(maxsize=10))
+        scan.queue_post(scan.endpoint_gravity, {"ID": "ABC123", "gravity": 1.05}, "gravitymon")
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            worker = asyncio.create_task(scan.post_worker(client))
+            await scan.post_queue.join()
+            worker.cancel()
+
+    asyncio.run(run())
+    assert buffer.count() == 1
+    assert buffer.peek("gravitymon", "ABC123", 10)[0][3] == {"ID": "ABC123", "gravity": 1.05}
+
+
+class FakePipeline:
+    def __init__(self, commands):
+        self.commands = commands
+
+    def hset(self, key, mapping):
+        self.commands.append(("hset", key, mapping))
+
+    def hdel(self, key, *fields):
+        self.commands.append(("hdel", key, fields))
+
+    def expire(self, key, ttl):
+        self.commands.append(("expire", key, ttl))
+
+    def execute(self):
+        self.commands.append(("execute",))
+
+
+class FakeRedis:
+    def __init__(self):
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self.commands)
+
+
+def test_write_status(monkeypatch):
+    client = FakeRedis()
+    now = [1700000000.0]
+    monkeypatch.setattr(scan, "redis_client", client)
+    monkeypatch.setattr(scan, "clock", lambda: now[0])
+    monkeypatch.setattr(scan, "status_written", {})
+    monkeypatch.setattr(scan, "status_interval", 10)
+
+    assert scan.writeStatus("ABC123", "pressuremon", {"pressure": 1.5, "pressure1": None, "temp": 20})
+    assert client.commands == [
+        ("hset", "ble_ABC123", {"last": 1700000000, "type": "pressuremon", "pressure": "1.5", "temp": "20"}),
+        ("hdel", "ble_ABC123", ("pressure1",)),
+        ("expire", "ble_ABC123", 60 * 60 * 6),
+        ("execute",),
+    ]
+
+    # Throttled per device within the status interval
+    client.commands.clear()
+    now[0] += 5
+    assert scan.writeStatus("ABC123", "pressuremon", {"pressure": 1.6})
+    assert scan.writeStatus("DEF456", "gravitymon", {"gravity": 1.05})
+    assert [c[1] for c in client.commands if c[0] == "hset"] == ["ble_DEF456"]
+
+    client.commands.clear()
+    now[0] += 5
+    assert scan.writeStatus("ABC123", "pressuremon", {"pressure": 1.6})
+    assert client.commands[0] == ("hset", "ble_ABC123", {"last": 1700000010, "type": "pressuremon", "pressure": "1.6"})
+    assert [c[0] for c in client.commands] == ["hset", "expire", "execute"]
@@ -11,16 +11,32 @@
 #   --chipid <chipid> Collect from device with this ID
 #   --software <software> Collect from all devices with this software
 #
+# Optional environment variables
+#
+#   REDIS_HOST: Share collection status in redis
+#   MAX_FILE_SIZE: Rotate the log file when it is larger than this
+#   MAX_GENERATIONS: Number of rotated log files to keep, <chipid>.log.1 ... <chipid>.log.N
+#   COMPRESS_LOGS: Gzip rotated log files (true/false)
+#   STORE_LOGS: Post received lines to the API for searching (true/false), default true
+#   POLL_INTERVAL: Seconds between refreshing the device list (changes are also notified by the API)
+#
 # Data will be stored in the current director with filename <chipid>.log
 #
-import threading
 import asyncio
+import gzip
+import json
 import logging
+import random
+import re
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from time import time
-import requests
+import httpx
 import redis
 import os
-from websockets.sync.client import connect
+from websockets.asyncio.client import connect
 from websockets.exceptions import WebSocketException
 
 logger = logging.getLogger(__name__)
@@ -32,94 +48,317 @@ logger = logging.getLogger(__name__)
 # log_<chipid>_size  : <number of bytes read>
 
 endpoint = ""
+endpoint_logs = ""
+notify_uri = ""
 headers = {}
-threads = dict()
+collectors = dict() # Dict of running collectors (chipId: (url, task))
+writers = dict() # Dict of log writers (chipId: LogWriter)
 maxFileSize = 100000
+maxGenerations = 1 # Rotated files kept, <chipid>.log.1 is the newest
+compress = False # Compress rotated files, <chipid>.log.1.gz
+flushSize = 4096 # Bytes buffered before writing to the log file
+flushInterval = 2 # Max seconds a received line is buffered
+statusInterval = 5 # Seconds between publishing the counters to redis
+storeLogs = True # Post received lines to the API so they can be searched
+maxPending = 5000 # Max lines per device waiting to be posted, oldest are dropped
+postChunk = 500 # Max lines per post to the API
 pool = None
+rotator = ThreadPoolExecutor(max_workers=1) # Moves and compresses rotated files
+
+# The device list is refreshed when the API notifies a change to the device table, it is
+# also polled slowly in case a notification is missed and faster while not connected.
+poll_interval = 300
+fallback_interval = 30
+reconnect_min = 1 # Seconds before reconnecting to a device, doubled for each failed attempt
+reconnect_max = 120
+refresh = None
+notify_connected = False
+
+# Log level from the start of the line, "ERROR ..." or "E: ..."
+levelPattern = re.compile(r"\b(ERROR|ERR|WARNING|WARN|INFO|DEBUG|VERBOSE|[EWIDV](?=:))\b")
+levels = {"ERROR": 3, "ERR": 3, "E": 3, "WARNING": 2, "WARN": 2, "W": 2, "INFO": 1, "I": 1, "DEBUG": 0, "VERBOSE": 0, "D": 0, "V": 0}
+
+
+def parse_level(line):
+    m = levelPattern.search(line, 0, 40)
+    return 1 if m is None else levels[m.group(1)]
+
 
-def writeKey(key, value):
-    if pool is None:
-        return True
+def rotate_files(fileName, rotated):
+    # Runs in the background thread, one rotation at a time so the generations stay in order
+    try:
+        for i in range(maxGenerations, 0, -1):
+            for ext in ("", ".gz"):
+                src = f"{fileName}.{i}{ext}"
+                if not os.path.exists(src):
+                    continue
+                if i == maxGenerations:
+                    os.remove(src)
+                else:
+                    os.replace(src, f"{fileName}.{i + 1}{ext}")
+
+        if compress:
+            with open(rotated, "rb") as src, gzip.open(fileName + ".1.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        else:
+            os.replace(rotated, fileName + ".1")
+    except Exception as e:
+        logger.error(f"Failed to rotate {fileName}, {e}")
+
+
+class LogWriter:
+    def __init__(self, chipId):
+        self.chipId = chipId
+        self.fileName = "log/" + chipId + ".log"
+        self.buffer = []
+        self.pending = 0
+        self.entries = deque(maxlen=maxPending) # Lines waiting to be posted to the API
+        self.lastFlush = time()
+        self.rotations = 0
+        try:
+            self.size = os.path.getsize(self.fileName)
+        except OSError:
+            self.size = 0
+
+        # Status shared in redis
+        self.start = 0
+        self.last = 0
+        self.lineCnt = 0
+        self.byteCnt = 0
+        self.changed = False
+
+    def connected(self):
+        self.start = int(time())
+        self.lineCnt = 0
+        self.byteCnt = 0
+        self.changed = True
+
+    def write(self, line):
+        data = line.encode(errors="replace")
+        self.buffer.append(data)
+        self.pending += len(data)
+        self.lineCnt += 1
+        self.byteCnt += len(line)
+        self.last = int(time())
+        self.changed = True
+
+        if storeLogs:
+            self.entries.append({
+                "chipId": self.chipId,
+                "timestamp": datetime.now().isoformat(),
+                "level": parse_level(line),
+                "message": line.rstrip("\r\n"),
+            })
+
+        if self.pending >= flushSize:
+            self.flush()
+
+    def flush(self):
+        self.lastFlush = time()
+        if len(self.buffer) == 0:
+            return
+
+        with open(self.fileName, "ab") as f:
+            f.write(b"".join(self.buffer))
+        self.size += self.pending
+        self.buffer = []
+        self.pending = 0
+
+        if self.size > maxFileSize:
+            self.rotate()
+
+    def rotate(self):
+        logger.info(f"Logile is to large (>{maxFileSize}), rotating {self.fileName} ({maxGenerations} generations)")
+        self.rotations += 1
+        rotated = f"{self.fileName}.rotate{self.rotations}"
+        os.replace(self.fileName, rotated)
+        self.size = 0
+        rotator.submit(rotate_files, self.fileName, rotated)
+
+
+def publish_status():
+    changed = [w for w in writers.values() if w.changed]
+    if pool is None or len(changed) == 0:
+        return
 
     ttl = 60*60*6 # 6 hours
 
-    logger.info(f"Writing key {key} = {value} ttl:{ttl}.")
     try:
-        r = redis.Redis(connection_pool=pool)
-        r.set(name=key, value=str(value), ex=ttl)
-        return True
+        pipe = redis.Redis(connection_pool=pool).pipeline(transaction=False)
+        for w in changed:
+            pipe.set(name=f"log_{w.chipId}_start", value=str(w.start), ex=ttl)
+            if w.last > 0:
+                pipe.set(name=f"log_{w.chipId}_last", value=str(w.last), ex=ttl)
+            pipe.set(name=f"log_{w.chipId}_count", value=str(w.lineCnt), ex=ttl)
+            pipe.set(name=f"log_{w.chipId}_size", value=str(w.byteCnt), ex=ttl)
+            w.changed = False
+        pipe.execute()
+        logger.info(f"Published log status for {len(changed)} devices.")
     except redis.exceptions.ConnectionError as e:
         logger.error(f"Failed to connect with redis {e}.")
-    return False
 
-class ThreadWrapper:
-    def __init__(self):
-        self.thread = None
-        self.event = threading.Event()
 
-    def is_stopped(self):
-        return self.event.is_set()
+async def post_entries(client):
+    for w in list(writers.values()):
+        while len(w.entries):
+            lines = [w.entries.popleft() for _ in range(min(postChunk, len(w.entries)))]
+            try:
+                r = await client.post(endpoint_logs, json=lines)
+                if r.is_success:
+                    continue
+                logger.error(f"Failed to post log lines for {w.chipId}, code {r.status_code}")
+                if r.status_code < 500:
+                    continue # Will not improve by retrying
+            except httpx.HTTPError as e:
+                logger.error(f"Failed to post log lines for {w.chipId}, Error: {e}")
+
+            w.entries.extendleft(reversed(lines)) # Retry on the next flush
+            return
+
 
-    def is_alive(self):
-        return self.thread.is_alive()
+async def flush_writers(client):
+    lastPublish = time()
 
-    def stop(self):
-        self.event.set()
+    while True:
+        await asyncio.sleep(1)
+
+        now = time()
+        for w in writers.values():
+            if now - w.lastFlush >= flushInterval:
+                try:
+                    w.flush()
+                except OSError as e:
+                    logger.error(f"Failed to write log file {w.fileName}, {e}")
+
+        if now - lastPublish >= statusInterval:
+            lastPublish = now
+            publish_status()
+
+        if storeLogs:
+            await post_entries(client)
 
 
-def websocket_collector(url, chipId):
+async def backoff(delay):
+    wait = delay + random.uniform(0, delay / 2)
+    await asyncio.sleep(wait)
+    return min(delay * 2, reconnect_max)
+
+
+async def websocket_collector(url, chipId):
     uri = url.replace("http://", "ws://") + "serialws"
     logger.info(f"Collecing logs from {uri} and saving to {chipId}")
-    fileName = "log/" + chipId + ".log"
+    if chipId not in writers:
+        writers[chipId] = LogWriter(chipId)
+    writer = writers[chipId]
+    delay = reconnect_min
 
+    # Runs until the task is cancelled by the supervisor, also while waiting to reconnect
     try:
-        with connect(uri) as websocket:
-            logger.info(f"Connected to {uri} listening for logs...")
-            writeKey(f"log_{chipId}_start", int(time()))
-
-            line = ""
-            lineCnt = 0
-            byteCnt = 0
-
-            while True:
-                line += websocket.recv()
-                if line.endswith("\n") or len(line) > 200:
-                    # logger.info(f"Received log line from {uri}: {line.strip()}")
-                    f = open(fileName, "a")
-                    f.write(line)
-                    lineCnt += 1
-                    byteCnt += len(line)
+        while True:
+            try:
+                async with connect(uri, open_timeout=10) as websocket:
+                    logger.info(f"Connected to {uri} listening for logs...")
+                    writer.connected()
+                    delay = reconnect_min
+
                     line = ""
-                    f.close()
-                    writeKey(f"log_{chipId}_last", int(time()))
-                    writeKey(f"log_{chipId}_count", lineCnt)
-                    writeKey(f"log_{chipId}_size", byteCnt)
-
-                    if os.stat(fileName).st_size > maxFileSize:
-                        logger.info(
-                            f"Logile is to large (>{maxFileSize}), rotating {fileName} to {fileName}.1"
-                        )
-                        try:
-                            os.remove(fileName + ".1")
-                        except Exception:
-                            pass
-                        os.rename(fileName, fileName + ".1")
-
-                # Check if we should to a graceful exit
-                tw = threads.get(chipId, None)
-                if tw is not None and tw.is_stopped():
-                    break
-
-    except WebSocketException as e:
-        logger.error(f"Websocket exception in log collection {e}")
-    except Exception as e:
-        logger.error(f"Unknown exception in log collection {e}")
 
-    logger.info(f"Stopping log collection for {uri}")
+                    async for message in websocket:
+                        line += message if isinstance(message, str) else message.decode(errors="replace")
+                        if line.endswith("\n") or len(line) > 200:
+                            # logger.info(f"Received log line from {uri}: {line.strip()}")
+                            writer.write(line)
+                            line = ""
+
+                    logger.warning(f"Connection closed by {uri}")
+            except (WebSocketException, OSError, TimeoutError) as e:
+                logger.error(f"Websocket exception in log collection {uri}, {e}")
+            except Exception as e:
+                logger.error(f"Unknown exception in log collection {uri}, {e}")
+
+            logger.info(f"Reconnecting to {uri} in about {delay}s")
+            delay = await backoff(delay)
+    finally:
+        logger.info(f"Stopping log collection for {uri}")
+        writer.flush()
+        writers.pop(chipId, None)
+
+
+def stop_collector(chipId):
+    url, task = collectors.pop(chipId)
+    logger.info(f"Stopping log collection for {chipId}")
+    task.cancel()
+
+
+def update_collectors(devices):
+    wanted = dict()
+
+    for d in devices:
+        if not d["collectLogs"]:
+            continue
+        if len(d["url"]) == 0:
+            logger.warning(f"Device has logging enabled but is missing an url {d['chipId']}")
+            continue
+        wanted[d["chipId"]] = d["url"]
+
+    # Stop collectors for removed devices, disabled logging or changed url
+    for chipId in list(collectors):
+        url, task = collectors[chipId]
+        if wanted.get(chipId) != url:
+            stop_collector(chipId)
+        elif task.done():
+            logger.warning(f"Task has exited for device {chipId}, restarting")
+            collectors.pop(chipId)
+
+    for chipId, url in wanted.items():
+        if chipId not in collectors:
+            logger.info(f"Found device with activated log collection {chipId}, {url}")
+            collectors[chipId] = (url, asyncio.create_task(websocket_collector(url, chipId)))
+
+
+async def fetch_devices(client):
+    try:
+        logger.info(f"Fetching device list from brewlogger API {endpoint}.")
+        r = await client.get(endpoint)
+        if r.is_success:
+            return r.json()
+        logger.error(f"Failed to request device list, code {r.status_code}")
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to request device list, Error: {e}")
+    return None
+
+
+async def watch_notifications():
+    global notify_connected
+
+    delay = reconnect_min
+
+    while True:
+        try:
+            async with connect(notify_uri, open_timeout=10) as websocket:
+                logger.info("Connected to brewlogger API notifications.")
+                notify_connected = True
+                delay = reconnect_min
+                refresh.set() # Changes could have been missed while disconnected
+
+                async for message in websocket:
+                    event = json.loads(message)
+                    if event.get("table") == "device":
+                        logger.info(f"Device {event.get('id')} {event.get('method')}, refreshing device list.")
+                        refresh.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Lost connection to brewlogger API notifications, {e}")
+
+        notify_connected = False
+        delay = await backoff(delay)
 
 
 async def main():
     global pool
+    global refresh
 
     redis_host = os.getenv("REDIS_HOST")
 
@@ -129,60 +368,29 @@ async def main():
         logger.info(f"Using redis {redis_host}")
         pool = redis.ConnectionPool(host=redis_host, port=6379, db=0)
 
-    while True:
-        devices = []
+    refresh = asyncio.Event()
+    watcher = asyncio.create_task(watch_notifications())
 
-        try:
-            logger.info(f"Fetching device list from brewlogger API {endpoint}.")
-            r = requests.get(endpoint, headers=headers)
-            if r.ok:
-                for d in r.json():
-                    devices.append(d)
-        except Exception as e:
-            logger.error(f"Failed to request device list, Error: {e}")
+    async with httpx.AsyncClient(headers=headers, timeout=10.0) as client:
+        flusher = asyncio.create_task(flush_writers(client))
 
-        for d in devices:
-            tw = threads.get(d["chipId"], None)
-            # logger.info(f"{d['chipId']}, {d['collectLogs']}, {tw}")
+        while True:
+            devices = await fetch_devices(client)
+            if devices is not None:
+                update_collectors(devices)
 
             try:
-                if tw is None:  # Create a new task for the device
-                    if d["collectLogs"]:
-                        if len(d["url"]) > 0:
-                            logger.info(
-                                f"Found device with activated log collection {d['chipId']}, {d['url']} {d['collectLogs']}"
-                            )
-                            tw = ThreadWrapper()
-                            tw.thread = threading.Thread(
-                                target=websocket_collector, args=[d["url"], d["chipId"]]
-                            )
-                            tw.thread.daemon = True  # Set the thread as a daemon
-                            tw.thread.start()
-                            threads[d["chipId"]] = tw
-                        else:
-                            logger.warning(
-                                f"Device has logging enabled but is missing an url {d['chipId']}"
-                            )
-                else:
-                    if d["collectLogs"] is False:  # Task exist, but lets stop it
-                        if not threads[d["chipId"]].is_stopped():
-                            logger.info(f"Stopping thread for {d['chipId']}")
-                            threads[d["chipId"]].stop()
-                        elif not tw.is_alive():
-                            logger.info(f"Removing thread for {d['chipId']}")
-                            threads.pop(d["chipId"])
-
-                    else:  # Already exists, check if its still running
-                        logger.info(
-                            f"Checking if thread is alive {d['chipId']} {tw.is_alive()}"
-                        )
-                        if tw.is_alive() is False:
-                            logger.warning(f"Task has exited for device {d['chipId']}")
-                            threads.pop(d["chipId"])
+                await asyncio.wait_for(refresh.wait(), poll_interval if notify_connected else fallback_interval)
+            except TimeoutError:
+                pass
+            refresh.clear()
 
-            except Exception as e:
-                logger.error(f"Failed to create task {e}")
-        await asyncio.sleep(5)
+            if watcher.done():
+                logger.warning("Notification watcher has exited, restarting")
+                watcher = asyncio.create_task(watch_notifications())
+            if flusher.done():
+                logger.warning("Log writer flush task has exited, restarting")
+                flusher = asyncio.create_task(flush_writers(client))
 
 
 if __name__ == "__main__":    
@@ -198,6 +406,19 @@ if __name__ == "__main__":
     if i is not None:
         maxFileSize = int(i)
 
+    i = os.getenv("MAX_GENERATIONS")
+
+    if i is not None:
+        maxGenerations = max(int(i), 1)
+
+    compress = os.getenv("COMPRESS_LOGS", "false").lower() in ("true", "1", "yes")
+    storeLogs = os.getenv("STORE_LOGS", "true").lower() in ("true", "1", "yes")
+
+    i = os.getenv("POLL_INTERVAL")
+
+    if i is not None:
+        poll_interval = int(i)
+
     if apiHost is None or apiKey is None:
         logging.error(
             "Environment variables APAPI_HOSTI_URL and API_KEY needs to be set"
@@ -205,12 +426,14 @@ if __name__ == "__main__":
         exit(-1)
 
     endpoint = "http://" + apiHost + "/api/device/"
+    endpoint_logs = "http://" + apiHost + "/api/device/logs/"
+    notify_uri = "ws://" + apiHost + "/api/system/notify?apiKey=" + apiKey
     headers = {
         "Content-Type": "application/json",
         "Authorization": "Bearer " + apiKey,
     }
 
-    logger.info(f"Starting log collector, max file size is {maxFileSize/1000} kb")
+    logger.info(f"Starting log collector, max file size is {maxFileSize/1000} kb, keeping {maxGenerations} rotated files")
     asyncio.run(main())
     logger.info("Exiting...")
 
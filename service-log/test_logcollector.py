@@ -0,0 +1,174 @@
+"""Tests for the log collector, run with pytest from service-log."""
+import asyncio
+import gzip
+import os
+
+import pytest
+
+import logcollector
+
+
+class FakeSocket:
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def __aiter__(self):
+        for message in self.messages:
+            yield message
+
+
+@pytest.fixture
+def collector(tmp_path, monkeypatch):
+    (tmp_path / "log").mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(logcollector, "writers", {})
+    monkeypatch.setattr(logcollector, "storeLogs", False)
+    monkeypatch.setattr(logcollector.random, "uniform", lambda low, high: 0)
+
+    delays = []
+    backoff = logcollector.backoff
+
+    async def recording_backoff(delay):
+        delays.append(delay)
+        return await backoff(delay)
+
+    monkeypatch.setattr(logcollector, "backoff", recording_backoff)
+    return delays
+
+
+def test_backoff(monkeypatch):
+    monkeypatch.setattr(logcollector, "reconnect_max", 4)
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(logcollector.asyncio, "sleep", sleep)
+    monkeypatch.setattr(logcollector.random, "uniform", lambda low, high: high)
+
+    async def run():
+        delay, delays = 1, []
+        for _ in range(4):
+            delays.append(delay)
+            delay = await logcollector.backoff(delay)
+        return delays
+
+    assert asyncio.run(run()) == [1, 2, 4, 4]
+    assert slept == [1.5, 3, 6, 6] # Up to half the delay is added as jitter
+
+
+def test_reconnect_backoff(collector, monkeypatch):
+    monkeypatch.setattr(logcollector, "reconnect_min", 0.001)
+    monkeypatch.setattr(logcollector, "reconnect_max", 0.004)
+    attempts = iter([OSError("refused"), OSError("refused"), OSError("refused"), ["line\n"], OSError("refused")])
+
+    def connect(uri, open_timeout):
+        result = next(attempts, None)
+        if isinstance(result, Exception):
+            raise result
+        return FakeSocket(result or [])
+
+    monkeypatch.setattr(logcollector, "connect", connect)
+
+    async def run():
+        task = asyncio.create_task(logcollector.websocket_collector("http://device/", "DEV001"))
+        while len(collector) < 5:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    # Doubled up to the max, back to the min after a connection
+    assert collector[:5] == [0.001, 0.002, 0.004, 0.001, 0.002]
+
+
+def test_flush_on_cancel(collector, monkeypatch):
+    monkeypatch.setattr(logcollector, "reconnect_min", 60)
+    monkeypatch.setattr(logcollector, "connect", lambda uri, open_timeout: FakeSocket(["first ", "line\n"]))
+
+    async def run():
+        task = asyncio.create_task(logcollector.websocket_collector("http://device/", "DEV002"))
+        while len(collector) == 0:
+            await asyncio.sleep(0.001)
+        # Waiting to reconnect with the line still buffered
+        assert logcollector.writers["DEV002"].pending > 0
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert logcollector.writers == {}
+    with open("log/DEV002.log") as f:
+        assert f.read() == "first line\n"
+
+
+def test_existing_writer_reused(collector, monkeypatch):
+    writer = logcollector.LogWriter("DEV003")
+    logcollector.writers["DEV003"] = writer
+    created = []
+    monkeypatch.setattr(logcollector, "LogWriter", lambda chipId: created.append(chipId))
+    monkeypatch.setattr(logcollector, "reconnect_min", 60)
+    monkeypatch.setattr(logcollector, "connect", lambda uri, open_timeout: FakeSocket(["line\n"]))
+
+    async def run():
+        task = asyncio.create_task(logcollector.websocket_collector("http://device/", "DEV003"))
+        while len(collector) == 0:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert created == []
+    assert writer.lineCnt == 1
+
+
+def write_lines(writer, first, last):
+    for i in range(first, last):
+        writer.write(f"line {i:04d}\n")
+    writer.flush()
+    logcollector.rotator.submit(lambda: None).result() # Wait for the rotations
+
+
+def lines(first, last):
+    return "".join(f"line {i:04d}\n" for i in range(first, last))
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_rotate(tmp_path, monkeypatch, compress):
+    (tmp_path / "log").mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(logcollector, "storeLogs", False)
+    monkeypatch.setattr(logcollector, "flushSize", 40)
+    monkeypatch.setattr(logcollector, "maxFileSize", 70)
+    monkeypatch.setattr(logcollector, "maxGenerations", 2)
+    monkeypatch.setattr(logcollector, "compress", compress)
+    ext = ".gz" if compress else ""
+
+    def read(name):
+        if name.endswith(".gz"):
+            with gzip.open(name, "rt") as f:
+                return f.read()
+        with open(name) as f:
+            return f.read()
+
+    # Lines of 10 bytes written 4 at a time, rotated when the file is larger than 70 bytes
+    writer = logcollector.LogWriter("DEV004")
+    write_lines(writer, 0, 10)
+    assert sorted(os.listdir("log")) == ["DEV004.log", "DEV004.log.1" + ext]
+    assert read("log/DEV004.log.1" + ext) == lines(0, 8)
+    assert read("log/DEV004.log") == lines(8, 10)
+
+    # Rotated twice, the generations are shifted and the oldest is removed
+    write_lines(writer, 10, 30)
+    assert sorted(os.listdir("log")) == ["DEV004.log", "DEV004.log.1" + ext, "DEV004.log.2" + ext]
+    assert read("log/DEV004.log.2" + ext) == lines(8, 18)
+    assert read("log/DEV004.log.1" + ext) == lines(18, 26)
+    assert read("log/DEV004.log") == lines(26, 30)
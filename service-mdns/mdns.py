@@ -1,9 +1,8 @@
 import asyncio
 import logging
-import time
 import os
-import requests
-from typing import Optional, cast
+import httpx
+from typing import cast
 
 from zeroconf import DNSQuestionType, IPVersion, ServiceStateChange, Zeroconf
 from zeroconf.asyncio import AsyncServiceBrowser, AsyncServiceInfo, AsyncZeroconf
@@ -20,99 +19,130 @@ ALL_SERVICES = [
 ]
 
 logger = logging.getLogger(__name__)
-scan_result = []
+
+# The browser keeps running and tracks the services in a dict, only changes are sent
+# to the API in batches. All services are sent again before they expire in the API cache.
+services = {} # Dict of resolved services (service name: mdns entry)
+added = {} # Services added or updated since the last post (service name: mdns entry)
+removed = {} # Services removed since the last post (service name: mdns entry)
+resolving = set() # Pending resolve tasks, referenced until they are done
 
 # Configuration
 web_host = ""
 api_key = ""
-
-
-async def scan_for_mdns(timeout):
-    logger.info(f"Scanning for mdns devices, timout {timeout}")
-    scan_result.clear()
-    runner = AsyncDeviceScanner(timeout)
-    await runner.async_run()
-    logger.info(f"Scanning completed {scan_result}")
-    return scan_result
+batch_interval = 2 # Seconds to collect changes before posting them
+refresh_interval = 5 * 60 # Seconds between sending all services, the API keeps them for 15 minutes
 
 
 def async_on_service_state_change(
     zeroconf: Zeroconf, service_type: str, name: str, state_change: ServiceStateChange
 ) -> None:
     logger.debug(f"Service {name} of type {service_type} state changed: {state_change}")
-    asyncio.ensure_future(_async_show_service_info(zeroconf, service_type, name))
+
+    if state_change is ServiceStateChange.Removed:
+        mdns = services.pop(name, None)
+        if mdns is not None:
+            logger.info(f"Removed: {mdns['type']} {mdns['host']} {mdns['name']}")
+            added.pop(name, None)
+            removed[name] = mdns
+        return
+
+    task = asyncio.ensure_future(_async_resolve_service(zeroconf, service_type, name))
+    resolving.add(task)
+    task.add_done_callback(_resolve_done)
 
 
-async def _async_show_service_info(
+def _resolve_done(task: asyncio.Task) -> None:
+    resolving.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Failed to resolve service, Error: {task.exception()}")
+
+
+async def _async_resolve_service(
     zeroconf: Zeroconf, service_type: str, name: str
 ) -> None:
     info = AsyncServiceInfo(service_type, name)
-    await info.async_request(zeroconf, 3000, question_type=DNSQuestionType.QU)
+    if not await info.async_request(zeroconf, 3000, question_type=DNSQuestionType.QU):
+        logger.warning(f"Unable to resolve {name}")
+        return
+
     logger.debug("Info from zeroconf.get_service_info: %r" % (info))
-    if info:
-        addresses = [
-            "%s:%d" % (addr, cast(int, info.port)) for addr in info.parsed_addresses()
-        ]
-        type = info.type
-        adresses = ", ".join(addresses)
-        host = info.server
-        logger.info(f"Found: {type} {adresses} {host}")
-        mdns = {"type": type, "host": str(adresses), "name": host.strip(".")}
-        scan_result.append(mdns)
-
-
-class AsyncDeviceScanner:
-    def __init__(self, timeout) -> None:
-        self.start = time.time()
-        self.timeout = timeout
-        self.aiobrowser: Optional[AsyncServiceBrowser] = None
-        self.aiozc: Optional[AsyncZeroconf] = None
-
-    async def async_run(self) -> None:
-        self.aiozc = AsyncZeroconf(ip_version=IPVersion.V4Only)
-        await self.aiozc.zeroconf.async_wait_for_start()
-        logging.info(
-            "\nBrowsing %s service(s), press Ctrl-C to exit...\n" % ALL_SERVICES
-        )
-        kwargs = {
-            "handlers": [async_on_service_state_change],
-            "question_type": DNSQuestionType.QU,
-        }
-        self.aiobrowser = AsyncServiceBrowser(
-            self.aiozc.zeroconf, ALL_SERVICES, **kwargs
-        )
-        while (time.time() - self.start) < self.timeout:
-            await asyncio.sleep(1)
-        logging.info("Scanning completed, exiting.")
-        await self.async_close()
-
-    async def async_close(self) -> None:
-        assert self.aiozc is not None
-        assert self.aiobrowser is not None
-        await self.aiobrowser.async_cancel()
-        await self.aiozc.async_close()
-
-
-async def task_scan_mdns():
-    logger.info("Scanning for mdns devices")
-
-    mdns_list = await scan_for_mdns(20)
+    addresses = [
+        "%s:%d" % (addr, cast(int, info.port)) for addr in info.parsed_addresses()
+    ]
+    mdns = {"type": info.type, "host": ", ".join(addresses), "name": info.server.strip(".")}
+
+    if services.get(name) == mdns:
+        return # Nothing changed
+
+    previous = services.get(name)
+    if previous is not None and previous["host"] != mdns["host"]:
+        removed[name] = previous # The cache key includes the host
 
+    logger.info(f"Found: {mdns['type']} {mdns['host']} {mdns['name']}")
+    services[name] = mdns
+    added[name] = mdns
+
+
+async def post_list(client, endpoint, mdns_list):
+    try:
+        logger.info(f"Posting {len(mdns_list)} services to {endpoint}.")
+        r = await client.post(endpoint, json=mdns_list)
+        logger.info(f"Response {r}.")
+        return r.status_code < 500 # Client errors will not improve by retrying
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to post data, Error: {e}")
+    return False
+
+
+async def task_post_changes(client):
     endpoint = "http://" + web_host + "/api/system/mdns"
-    headers = {"Content-Type": "application/json", "Authorization": "Bearer " + api_key}
+    last_refresh = 0
 
-    for mdns in mdns_list:
-        try:
-            logger.info(f"Posting data {endpoint} {mdns}.")
-            r = requests.post(endpoint, json=mdns, headers=headers)
-            logger.info(f"Response {r}.")
-        except Exception as e:
-            logger.error(f"Failed to post data, Error: {e}")
+    while True:
+        await asyncio.sleep(batch_interval)
+        now = asyncio.get_running_loop().time()
+
+        if len(removed):
+            changes = dict(removed)
+            removed.clear()
+            if not await post_list(client, endpoint + "/remove", list(changes.values())):
+                for name, mdns in changes.items():
+                    if services.get(name) != mdns:
+                        removed.setdefault(name, mdns)
+
+        if now - last_refresh > refresh_interval:
+            last_refresh = now
+            added.update(services)
+
+        if len(added):
+            changes = dict(added)
+            added.clear()
+            if not await post_list(client, endpoint, list(changes.values())):
+                for name, mdns in changes.items():
+                    if name in services:
+                        added.setdefault(name, services[name])
 
 
 async def main():
-    while True:
-        await task_scan_mdns()
+    aiozc = AsyncZeroconf(ip_version=IPVersion.V4Only)
+    await aiozc.zeroconf.async_wait_for_start()
+    logger.info(f"Browsing {ALL_SERVICES} service(s)")
+
+    browser = AsyncServiceBrowser(
+        aiozc.zeroconf,
+        ALL_SERVICES,
+        handlers=[async_on_service_state_change],
+        question_type=DNSQuestionType.QU,
+    )
+
+    headers = {"Content-Type": "application/json", "Authorization": "Bearer " + api_key}
+    try:
+        async with httpx.AsyncClient(headers=headers, timeout=10.0) as client:
+            await task_post_changes(client)
+    finally:
+        await browser.async_cancel()
+        await aiozc.async_close()
 
 
 if __name__ == "__main__":